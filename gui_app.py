@@ -388,7 +388,7 @@ class ISPGUIApp:
         """获取下拉框选项"""
         combo_options = {
             'demosaic': {
-                'method': ['opencv_vng', 'opencv_ea', 'frequency_domain', 'anti_moire', 'selective_anti_moire'],
+                'method': ['opencv_vng', 'opencv_ea', 'opencv_bilinear', 'mhc', 'frequency_domain', 'anti_moire', 'selective_anti_moire'],
                 'bayer_pattern': ['rggb', 'bggr', 'grbg', 'gbrg']
             },
             'wb': {
@@ -410,7 +410,7 @@ class ISPGUIApp:
                 'method': ['bicubic', 'bilinear', 'nearest']
             },
             'dpc': {
-                'method': ['median', 'mean', 'threshold']
+                'method': ['median', 'neighborhood', 'static', 'mean', 'threshold']
             },
             'exposure_compensation': {
                 'mode': ['auto', 'manual']
@@ -460,14 +460,14 @@ class ISPGUIApp:
             # 创建ISP流水线
             pipeline = ISPPipeline(temp_config_path)
             
-            # 运行处理
-            pipeline.run()
+            # 运行处理：单个文件失败不会抛出异常，结果中 error 非空
+            results = pipeline.run()
             
             # 清理临时文件
             if os.path.exists(temp_config_path):
                 os.remove(temp_config_path)
             
-            self.root.after(0, self.processing_complete)
+            self.root.after(0, lambda: self.processing_complete(results))
             
         except Exception as e:
             import traceback
@@ -517,11 +517,24 @@ class ISPGUIApp:
                     
                     self.config[module_key][param_key] = value
 
-    def processing_complete(self):
-        """处理完成回调"""
+    def processing_complete(self, results):
+        """处理完成回调：按结果报告成功 / 失败的文件"""
         self.progress.stop()
-        self.log("✅ 处理完成！")
-        messagebox.showinfo("完成", "图像处理完成！")
+        failed = [r for r in results if r['error'] is not None]
+        if not results:
+            self.log("⚠️ 没有处理任何文件")
+            messagebox.showwarning("完成", "未找到需要处理的RAW文件")
+        elif failed:
+            names = "\n".join(os.path.basename(r['file']) for r in failed)
+            summary = f"成功 {len(results) - len(failed)} 个，失败 {len(failed)} 个"
+            self.log(f"❌ 处理完成：{summary}")
+            for r in failed:
+                self.log(f"❌ {os.path.basename(r['file'])}: {r['error']}")
+            show = messagebox.showerror if len(failed) == len(results) else messagebox.showwarning
+            show("完成", f"{summary}\n失败的文件：\n{names}")
+        else:
+            self.log(f"✅ 处理完成！共 {len(results)} 个文件")
+            messagebox.showinfo("完成", "图像处理完成！")
         
         # 自动刷新图像列表
         self.refresh_images()
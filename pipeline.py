@@ -1,36 +1,332 @@
-
 # pipeline.py
 # ---------------------
 # ISP 主流程控制器（Pipeline）
 # ✅ 新手友好版，逐步执行每个模块，每步保存图像
+#    各阶段在 stages/registry.py 中注册，这里根据 config.yaml 编译成执行计划
 
 import yaml
 import os
 import numpy as np
 import glob # 新增：用于查找文件
+import io
+import functools
+import contextlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
 
 from raw_loader.raw_reader import read_raw
-# 导入所有 ISP 阶段模块，包括新增的 denoise 和 sharpen
-from stages import fisheye_mask,denoise_clip,blc, lsc, wb, ccm, demosaic, \
-    denoise,chroma_denoise, sharpen, gamma, tonemapping, super_resolution, \
-    noise_estimation, color_space, dpc
-from utils.image_io import save_image_debug, save_image
+from stages import color_lut, dpc, linear_color, lsc
+from stages.registry import BAYER, RGB, STAGES, get_stage
+from utils import profiling, stats
+from utils.arena import FrameArena
+from utils.image_io import DebugWriter, save_image
+from utils.precision import PrecisionPolicy
+from utils.temporal import Temporal3A
+from utils.tiling import analyze_frame, run_tiled
+
+def dither(rgb, strength):
+    """抖动：叠加幅度为 strength 个 8 位量化步长的均匀噪声，减少量化色带"""
+    noise = (np.random.rand(*rgb.shape).astype(np.float32) - 0.5) * strength * (1.0 / 255.0)
+    return rgb + noise
 
 def log_data_range(rgb, step_name):
-    """监控数据范围，帮助调试"""
-    print(f"→ {step_name}: 范围[{rgb.min():.3f}, {rgb.max():.3f}], "
-          f"均值{rgb.mean():.3f}, "
-          f"99%分位数{np.percentile(rgb, 99):.3f}")
+    """监控数据范围，帮助调试（config 中 stats.enable 为 false 时不做任何统计）"""
+    stats.log(step_name, rgb)
+
+class PlanNode:
+    """执行计划中的一个节点：阶段声明 + 编译好的阶段配置
+
+    stage_names: 节点包含的阶段名（融合 / 烘焙的节点还包括被替换的原阶段），output.debug_steps 按这些名字选择
+    """
+
+    def __init__(self, spec, stage_cfg, members=()):
+        self.spec = spec
+        self.name = spec.name
+        self.stage_names = (spec.name,) + tuple(members)
+        self.config = stage_cfg
+        self.halo = spec.get_halo(stage_cfg)
+        self.tileable = spec.is_tileable(stage_cfg)
+
+    def stage_config(self, context):
+        """本帧使用的阶段配置：前面的阶段可以通过 context['stage_overrides'][name] 按帧覆盖参数（不修改编译好的配置）"""
+        overrides = context.get('stage_overrides', {}).get(self.name)
+        return dict(self.config, **overrides) if overrides else self.config
+
+    def active(self, context):
+        """本帧是否执行：enabled_by 编译进来的节点按本帧配置的 enable 决定（可能被前面的阶段启用）"""
+        return not self.spec.enabled_by or self.stage_config(context).get('enable', False)
+
+    def run(self, data, context, out=None):
+        stage_cfg = self.stage_config(context)
+        if out is None:
+            return self.spec.run(data, stage_cfg, context)
+        return self.spec.run(data, stage_cfg, context, out=out)
+
+    def __repr__(self):
+        return f"PlanNode({self.name}, halo={self.halo})"
+
+class ExecutionPlan:
+    """由注册表和 config.yaml 编译出的阶段执行序列"""
+
+    def __init__(self, nodes, config):
+        self.nodes = nodes
+        self.config = config
+        self.tiling = config.get('pipeline', {}).get('tiling', {})
+        # 分块执行从 demosaic 开始；demosaic 方法依赖整帧（频域滤波等）时整帧执行 demosaic，从下一个节点开始分块
+        self.tile_start = None
+        for index, node in enumerate(nodes):
+            if node.spec.input_domain == BAYER and node.spec.output_domain == RGB:
+                self.tile_start = index if node.tileable else index + 1
+                break
+        # 精度策略：各数据域在节点之间的存储类型，节点内部按 float32 计算
+        self.precision = PrecisionPolicy.from_config(config.get('bit_depth_management', {}))
+        # 整帧缓冲区池：accepts_out 的节点输出和存储类型转换写入池中的缓冲区，批量处理时跨文件复用
+        self.arena = FrameArena(config.get('pipeline', {}).get('buffer_arena', True))
+
+    def run(self, raw, context, debug_dir=None, debug_writer=None, profiler=None):
+        """按计划执行所有节点，context 为当前文件的运行时状态
+
+        debug_dir 非空时由 debug_writer（默认同步写 PNG）保存所选阶段的调试图。
+        profiler 非空时记录每个节点（分块执行时每个分块段）的耗时和内存。
+        启用 buffer_arena 时返回的数组可能属于缓冲区池，下一次 run 时会被覆盖（需要保留时先复制）。
+        """
+        if debug_writer is None:
+            debug_writer = DebugWriter(async_write=False)
+        if profiler is None:
+            profiler = profiling.Profiler()
+        data = bayer = raw
+        tile_size = self.tiling.get('tile_size', 512) if self.tiling.get('enable', False) else 0
+        i = 0
+        while i < len(self.nodes):
+            node = self.nodes[i]
+            if node.spec.input_domain == BAYER:
+                bayer = data  # demosaic 的输入，分块执行的分析预处理使用
+            j = i
+            if tile_size and i == self.tile_start:
+                while j < len(self.nodes) and self.nodes[j].tileable:
+                    j += 1
+            tiled = j > i
+            # 运行时未启用的节点（例如没有被噪声估计启用的 denoise）跳过
+            segment = [n for n in self.nodes[i:max(j, i + 1)] if n.active(context)]
+            i = max(j, i + 1)
+            if not segment:
+                continue
+            if tiled:
+                # 从 tile_start 开始的连续可分块节点按 tile 执行，中间结果不生成整帧调试图
+                with profiler.stage("+".join(n.name for n in segment)):
+                    data = self._run_tiled(data, segment, context, tile_size, bayer)
+            else:
+                with profiler.stage(node.name):
+                    data = self._run_node(node, data, context, self.arena)
+            last = segment[-1]
+            self._report(last, data)
+            # 融合节点和分块段按其中任一原阶段名选择（例如 debug_steps: [wb] 时保存 linear_color 的输出）
+            if debug_dir and any(debug_writer.wants(name) for n in segment for name in n.stage_names):
+                debug_writer.save(data, os.path.join(debug_dir, last.spec.debug_name),
+                                  scale=last.spec.output_domain == BAYER)
+        return data
+
+    def _run_tiled(self, data, segment, context, tile_size, bayer):
+        """按 tile 执行 segment；data 为分块段的输入（Bayer 帧或整帧 demosaic 之后的 RGB），
+        整帧统计量（归一化最大值、WB 增益）在 demosaic 的输入 bayer 上计算"""
+        pattern = self.config['demosaic'].get('bayer_pattern', 'rggb')
+        state = context.get('3a')
+        analysis_cfg = self.config
+        if state is not None and not state.wants_measurement('wb_gains'):
+            # 序列模式的非估计帧：沿用平滑后的增益，分析预处理不再估计
+            analysis_cfg = dict(self.config, wb=dict(self.config.get('wb', {}), enable=False))
+        frame_stats = analyze_frame(bayer, analysis_cfg, pattern)
+        if state is not None and self.config.get('wb', {}).get('enable', False):
+            frame_stats['wb_gains'] = state.value('wb_gains', lambda: frame_stats['wb_gains'])
+        context['frame_stats'] = frame_stats
+        print(f"分块执行: {[n.name for n in segment]}, tile={tile_size}, "
+              f"整帧最大值={context['frame_stats']['raw_max']:.1f}, WB增益={context['frame_stats']['wb_gains']}")
+        chain = [(n.name, functools.partial(self._run_node, n, context=context), n.halo) for n in segment]
+        try:
+            # 各 tile 内的阶段统计只反映局部，分块段只在输出整帧上统计一次
+            with stats.get_logger().suspended():
+                return run_tiled(data, chain, tile_size)
+        finally:
+            context['frame_stats'] = None
+
+    def _run_node(self, node, data, context, arena=None):
+        """执行一个节点；arena 非空时节点输出（accepts_out）和存储类型转换使用池中的缓冲区
+
+        池中同一 (shape, dtype) 的缓冲区交替使用：输出缓冲区不与节点输入重叠，
+        节点输入所在的缓冲区在下一个节点中再作为输出使用。分块执行时各 tile 不使用缓冲区池。
+        """
+        data = self.precision.load(data)
+        if arena is not None and arena.enabled and node.spec.accepts_out:
+            data = node.run(data, context, out=arena.take(data.shape, np.float32, avoid=data))
+        else:
+            data = node.run(data, context)
+
+        storage = self.precision.storage[node.spec.storage]
+        out = None
+        if arena is not None and arena.enabled and data.dtype != storage:
+            out = arena.take(data.shape, storage, avoid=data)
+        return self.precision.store(data, node.spec.storage, node.name, out)
+
+    @staticmethod
+    def _report(node, data):
+        if node.spec.report:
+            if node.name == 'super_resolution':
+                print(f"→ {node.spec.report} 输出尺寸：{data.shape}")
+            stats.log(node.name, data, node.spec.report)
+
+    def __repr__(self):
+        return " → ".join(n.name for n in self.nodes)
+
+def compile_plan(config):
+    """根据 config.yaml 编译执行计划
+
+    执行顺序默认按注册顺序，也可以在 pipeline.stages 中显式列出阶段名来调整顺序。
+    只保留启用的阶段（以及可能在运行时被启用的阶段，见 StageSpec.enabled_by），
+    并检查相邻阶段的数据域（Bayer/RGB）是否衔接。
+    """
+    order = config.get('pipeline', {}).get('stages') or list(STAGES)
+    nodes = []
+    domain = BAYER
+    for name in order:
+        spec = get_stage(name)
+        if not spec.compiled(config):
+            continue
+        if spec.input_domain != domain:
+            raise ValueError(f"阶段 '{name}' 需要 {spec.input_domain} 输入，但前一阶段输出为 {domain}")
+        nodes.append(PlanNode(spec, spec.build_config(config)))
+        domain = spec.output_domain
+
+    if domain != RGB:
+        raise Exception("去马赛克（Demosaic）模块必须启用才能获得 RGB 图像。")
+    if config.get('pipeline', {}).get('fuse_linear_color', False):
+        nodes = fuse_linear_color(nodes)
+    if config.get('pipeline', {}).get('bake_color_lut', False):
+        nodes = bake_color_lut(nodes, config.get('color_lut', {}))
+    return ExecutionPlan(nodes, config)
+
+def fuse_linear_color(nodes):
+    """把相邻的 color_space → wb → ccm 节点（至少两个）替换为一个 linear_color 节点
+
+    只按 color_space、wb、ccm 的先后顺序融合；color_space 必须紧跟 demosaic
+    （输入在 [0, 1] 内）且色域映射可以线性化，否则保持独立节点。
+    启用噪声估计时 wb 与 ccm 之间总有 denoise 节点（可能在运行时启用），ccm 不参与融合。
+    """
+    fused = []
+    i = 0
+    while i < len(nodes):
+        members = []
+        j = i
+        for name in linear_color.FUSABLE_STAGES:
+            if j >= len(nodes) or nodes[j].name != name:
+                continue
+            if name == 'color_space' and not (
+                    j > 0 and nodes[j - 1].name == 'demosaic'
+                    and linear_color.can_fuse_color_space(nodes[j].config)):
+                break
+            members.append(nodes[j])
+            j += 1
+
+        if len(members) < 2:
+            fused.append(nodes[i])
+            i += 1
+            continue
+
+        fused_cfg = {name: None for name in linear_color.FUSABLE_STAGES}
+        fused_cfg.update({node.name: node.config for node in members})
+        print(f"线性颜色融合: {[node.name for node in members]} → linear_color")
+        fused.append(PlanNode(get_stage('linear_color'), fused_cfg,
+                              members=[name for node in members for name in node.stage_names]))
+        i = j
+    return fused
+
+def bake_color_lut(nodes, lut_cfg):
+    """把相邻的 ccm → tonemapping → gamma 节点（至少两个）烘焙成一个 color_lut 节点
+
+    烘焙时报告 3D LUT 相对原阶段链的 ΔE，超过 color_lut.max_delta_e 时保持原节点不变。
+    （启用 fuse_linear_color 时 ccm 已并入 linear_color，只烘焙 tonemapping → gamma。）
+    """
+    size = int(lut_cfg.get('size', 33))
+    input_max = float(lut_cfg.get('input_max', 2.0))
+    shaper = lut_cfg.get('shaper', 'sqrt')
+    interpolation = lut_cfg.get('interpolation', 'trilinear')
+
+    baked = []
+    i = 0
+    while i < len(nodes):
+        members = []
+        j = i
+        for name in color_lut.BAKEABLE_STAGES:
+            if j < len(nodes) and nodes[j].name == name:
+                members.append(nodes[j])
+                j += 1
+
+        if len(members) < 2:
+            baked.append(nodes[i])
+            i += 1
+            continue
+
+        names = [node.name for node in members]
+        chain = [(node.spec.apply, node.config) for node in members]
+        lut = color_lut.bake(chain, size, input_max, shaper)
+        report = color_lut.accuracy_report(lut, chain, input_max, shaper, interpolation)
+        print(f"3D LUT 烘焙: {names}, {size}³, 输入范围 [0, {input_max}], "
+              f"ΔE 最大 {report['max']:.2f} / 99% {report['p99']:.2f} / 平均 {report['mean']:.3f}")
+
+        max_delta_e = lut_cfg.get('max_delta_e', 3.0)
+        if report['max'] > max_delta_e:
+            print(f"→ ΔE 超过 max_delta_e={max_delta_e}，保持原阶段精确计算")
+            baked.extend(members)
+        else:
+            if lut_cfg.get('export_cube'):
+                color_lut.save_cube(lut_cfg['export_cube'], lut, input_max, shaper,
+                                    title=" → ".join(names))
+                print(f"→ 3D LUT 已导出到 {lut_cfg['export_cube']}")
+            lut.flags.writeable = False
+            baked.append(PlanNode(get_stage('color_lut'), {
+                'lut': lut, 'domain_max': input_max, 'shaper': shaper,
+                'interpolation': interpolation, 'exact_chain': chain},
+                members=[name for node in members for name in node.stage_names]))
+        i = j
+    return baked
 
 class ISPPipeline:
-    def __init__(self, config_file):
-        with open(config_file, encoding="utf-8") as f:
-            self.config = yaml.safe_load(f)
-        
-        # LSC 增益图的预计算（如果需要，目前在 LSC 模块内部处理）
-        self.lsc_gain_map = None # 保持此行，作为未来优化的占位符
+    def __init__(self, config_file=None, config=None):
+        # 可以传入配置文件路径，也可以直接传入已加载的配置字典（多进程 worker 使用）
+        if config is None:
+            with open(config_file, encoding="utf-8") as f:
+                config = yaml.safe_load(f)
+        self.config = config
         
-    def run(self):
+        # LSC 增益图预计算：按配置分辨率填充 lsc 模块的缓存，批量处理时每个文件只做一次乘法
+        self.lsc_gain_map = None
+        if config.get('lsc', {}).get('enable', False) and 'height' in config['raw'] and 'width' in config['raw']:
+            self.lsc_gain_map = lsc.get_gain_map(config['lsc'], config['raw']['height'], config['raw']['width'])
+
+        # 诊断统计：stats.enable 为 false 时各阶段不做任何诊断用的整帧归约
+        stats.configure(config.get('stats', {}))
+
+        # 按阶段 / 按文件的耗时与内存分析：profiling.enable 为 false 时几乎没有开销
+        self.profiler = profiling.Profiler.from_config(config.get('profiling', {}))
+
+        # 执行计划（包括各阶段配置）只编译一次，批量处理时每个文件（每个 worker）直接复用
+        self.plan = compile_plan(config)
+
+        # 调试图写入器：output.debug_steps 选择阶段，默认后台线程写入，不阻塞处理流程
+        self.debug_writer = DebugWriter.from_config(config['output'])
+
+        # 当前文件中 DPC 检测到的坏点（dpc.save_defect_map 标定用），随 process_file_safe 的结果返回
+        self.detected_defects = []
+
+    def run(self, workers=None):
+        """批量处理 input_dir 下的所有 RAW 文件
+
+        workers: 并行进程数，None 时读取 config 中的 pipeline.workers，
+                 <= 0 表示使用全部 CPU 核心。
+        返回按文件名排序的结果列表，每项为 {'file', 'output', 'error'}。
+        设置了 dpc.save_defect_map 时，所有文件（所有 worker）检测到的坏点在最后合并写入一次。
+        """
         cfg = self.config
         
         # --- 批量处理逻辑开始 ---
@@ -44,168 +340,200 @@ class ISPPipeline:
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         # 确保调试目录的基础路径存在，每个文件会在此目录下创建独立的子目录
-        os.makedirs(debug_base_dir, exist_ok=True)
+        if self.debug_writer.enabled:
+            os.makedirs(debug_base_dir, exist_ok=True)
 
-        # 查找所有 .raw 文件
-        raw_files = glob.glob(os.path.join(input_dir, "*.raw"))
+        # 查找所有 .raw 文件（排序保证结果顺序确定）
+        raw_files = sorted(glob.glob(os.path.join(input_dir, "*.raw")))
         if not raw_files:
             print(f"警告: 在目录 '{input_dir}' 中未找到任何 .raw 文件。请检查路径和文件后缀。")
-            return
+            return []
 
         print(f"在 '{input_dir}' 中找到 {len(raw_files)} 个 RAW 文件进行处理。")
 
-        for raw_file_path in raw_files:
-            file_name_with_ext = os.path.basename(raw_file_path)
-            file_name_without_ext = os.path.splitext(file_name_with_ext)[0]
+        if workers is None:
+            workers = cfg.get('pipeline', {}).get('workers', 1)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(raw_files))
+
+        if workers > 1:
+            print(f"使用 {workers} 个进程并行处理")
+            threads_per_worker = cfg.get('pipeline', {}).get('threads_per_worker', 1)
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_init_worker,
+                                     initargs=(cfg, threads_per_worker)) as executor:
+                # map 按提交顺序返回结果，chunksize=1 保证负载均衡；
+                # worker 的日志随结果返回，在主进程按文件顺序打印（GUI 等重定向了 stdout 的调用方也能看到）
+                results = []
+                for result in executor.map(_process_in_worker, raw_files, chunksize=1):
+                    print(result.pop('log'), end='')
+                    results.append(result)
+        else:
+            results = [self.process_file_safe(path) for path in raw_files]
+        # 处理失败的文件可能留下调试图写入线程，整批结束后关闭
+        self.debug_writer.close()
+
+        failed = [r for r in results if r['error'] is not None]
+        for r in failed:
+            print(f"❌ 文件 '{os.path.basename(r['file'])}' 处理失败：\n{r['error']}")
+
+        if self.profiler.enabled:
+            self.report_profile(results)
+
+        self.save_defect_map(results)
+
+        print(f"\n--- 所有文件处理完毕：成功 {len(results) - len(failed)} 个，失败 {len(failed)} 个 ---")
+        return results
+
+    def process_file_safe(self, raw_file_path):
+        """处理单个文件并捕获异常，单个文件失败不影响整个批次
+
+        启用 profiling 时结果中的 'profile' 为该文件的分析记录（多进程时随结果返回主进程）。
+        """
+        self.profiler.begin_file(raw_file_path)
+        self.detected_defects = []
+        try:
+            with self.profiler.stage('total'):
+                output_path = self.process_file(raw_file_path)
+            return {'file': raw_file_path, 'output': output_path, 'error': None,
+                    'profile': self.profiler.records, 'defects': self.detected_defects}
+        except Exception:
+            return {'file': raw_file_path, 'output': None, 'error': traceback.format_exc(),
+                    'profile': self.profiler.records, 'defects': self.detected_defects}
+
+    def save_defect_map(self, results):
+        """合并各文件检测到的坏点（包括静态坏点表），写入 dpc.save_defect_map（整批只写一次）"""
+        path = self.config.get('dpc', {}).get('save_defect_map')
+        detected = [defects for r in results for defects in r.get('defects') or []]
+        if not path or not detected:
+            return
+        defects = np.unique(np.concatenate(detected), axis=0)
+        dpc.save_defect_map(path, defects)
+        print(f"DPC: 坏点表已保存到 {path}（{len(defects)} 个）")
+
+    def report_profile(self, results):
+        """汇总批量处理的分析记录：打印汇总表，profiling.report 非空时写出 JSON / CSV 报告"""
+        records = [record for r in results for record in r.get('profile') or []]
+        summary = profiling.summarize(records)
+        print("\n--- 各阶段耗时与内存 ---")
+        print(profiling.format_summary(summary))
+        if self.profiler.report:
+            profiling.write_report(self.profiler.report, records, summary)
+            print(f"→ 分析报告已保存至：{self.profiler.report}")
+        return summary
+
+    def process_stream(self, frames, state=None):
+        """逐帧处理同一传感器的帧序列（视频 / 连拍），生成器，依次产出 8 位结果帧
+
+        frames: 可迭代的 (H, W) Bayer 帧（与 read_raw 的输出相同，可以是生成器）
+        state:  Temporal3A 时域 3A 状态，None 时按 config 的 stream 段新建；传入同一个对象可以跨调用延续状态
+        WB 增益、曝光增益和噪声水平只在每 stream.measure_interval 帧或检测到场景变化时重新估计，
+        其余帧跳过这些整帧统计，沿用按 stream.smoothing 指数平滑的值（见 utils/temporal.py）。
+        产出与 process_file 保存的结果图相同的 (H, W, 3) uint8 数组；不保存调试图。
+        启用 profiling 时每帧的记录累计在一起，序列结束后汇总打印；
+        设置了 dpc.save_defect_map 时各帧检测到的坏点在序列结束后合并写入一次。
+        """
+        if state is None:
+            state = Temporal3A.from_config(self.config.get('stream', {}))
+        dither_strength = self.config['output'].get('dither_strength', 0.5)
+        self.profiler.begin_file('stream')
+        detected = []
+        for raw in frames:
+            state.begin_frame(raw)
+            stats.get_logger().begin_file(f"frame {state.frame_index}")
+            with self.profiler.stage('frame'):
+                context = {'raw_file_path': None, '3a': state}
+                rgb = self.plan.run(raw, context, profiler=self.profiler)
+                detected.extend(context.get('dpc_defects', []))
+                if dither_strength > 0:
+                    rgb = dither(rgb, dither_strength)
+                frame = (rgb * 255).astype(np.uint8)
+            yield frame
 
-            print(f"\n--- 开始处理文件: {file_name_with_ext} ---")
-            
-            # 为当前文件创建独立的调试目录
+        if self.profiler.enabled:
+            self.report_profile([{'profile': self.profiler.records}])
+        self.save_defect_map([{'defects': detected}])
+
+    def process_file(self, raw_file_path):
+        """处理单个 RAW 文件，返回结果图路径"""
+        cfg = self.config
+        output_dir = cfg['output'].get('output_dir', 'output/results/')
+        debug_base_dir = cfg['output'].get('debug_dir', 'output/debug_steps/')
+
+        file_name_with_ext = os.path.basename(raw_file_path)
+        file_name_without_ext = os.path.splitext(file_name_with_ext)[0]
+
+        print(f"\n--- 开始处理文件: {file_name_with_ext} ---")
+        
+        # 为当前文件创建独立的调试目录（debug_steps 为 none 时不保存调试图）
+        current_debug_dir = None
+        if self.debug_writer.enabled:
             current_debug_dir = os.path.join(debug_base_dir, file_name_without_ext)
             os.makedirs(current_debug_dir, exist_ok=True)
 
-            # 更新配置中的 raw 文件路径，确保 read_raw 读取正确的文件
-            # 注意：这里我们修改的是 cfg 字典中 raw 模块的 path，但 read_raw 使用的是 cfg['raw'] 整个字典
-            # 因此，我们直接修改传入 read_raw 的字典更合适。
-            # 或者，read_raw 应该直接接受文件路径作为参数。
-            # 假设 read_raw 接受一个字典，且该字典中包含 'path' 键
-            current_raw_cfg = cfg['raw'].copy() # 复制一份，避免修改全局配置
-            current_raw_cfg['path'] = raw_file_path
+        # read_raw 接受 raw 配置字典，复制一份并填入当前文件路径，避免修改全局配置
+        current_raw_cfg = cfg['raw'].copy()
+        current_raw_cfg['path'] = raw_file_path
 
-            # 读取原始 RAW 数据
+        # 读取原始 RAW 数据
+        with self.profiler.stage('read_raw'):
             raw = read_raw(current_raw_cfg) # 传入包含当前文件路径的配置
-            print(f"图像尺寸：{raw.shape}")
-            
-            # 调试：打印原始 RAW 数据范围和类型，这在排查早期问题时很有用
-            print(f"DEBUG: 原始 RAW 数据类型: {raw.dtype}, 最小值: {raw.min()}, 最大值: {raw.max()}")
-
-            # --- ISP 流程开始 ---
-            
-            # Step 0: 坏点校正 (Dead Pixel Correction - DPC) - 在BLC之前处理
-            if cfg.get('dpc', {}).get('enable', False):
-                dpc_cfg = cfg['dpc'].copy()
-                dpc_cfg['bayer_pattern'] = cfg['demosaic'].get('bayer_pattern', 'rggb')
-                raw = dpc.apply(raw, dpc_cfg)
-                save_image_debug(raw, os.path.join(current_debug_dir, 'step0_dpc.png'), scale=True)
-            
-            # Step 1: 鱼眼掩膜 (Fisheye Mask) - 可选预处理
-            if cfg.get('fisheye_mask', {}).get('enable', False):
-                raw = fisheye_mask.apply(raw, cfg['fisheye_mask'])
-                save_image_debug(raw, os.path.join(current_debug_dir, 'step1_fisheye_mask.png'), scale=True)
-
-            # 确保所有模块都能访问位深配置
-            bit_depth_cfg = cfg.get('bit_depth_management', {})
-            
-            # Step 2: 黑电平校正 (Black Level Correction - BLC)
-            if cfg['blc']['enable']:
-                blc_cfg = cfg['blc'].copy()
-                blc_cfg['bit_depth_management'] = bit_depth_cfg
-                raw = blc.apply(raw, blc_cfg)
-                blc_max = raw.max()  # 记录BLC后的最大值
-                save_image_debug(raw, os.path.join(current_debug_dir, 'step2_blc.png'), scale=True)
-            
-            # Step 3: 暗部 Clip 保底去噪 (可选)
-            if cfg.get('denoise_clip', {}).get('enable', False):
-                raw = denoise_clip.apply(raw, cfg['denoise_clip'])
-                save_image_debug(raw, os.path.join(current_debug_dir, 'step3_denoise_clip.png'), scale=True) 
-                
-            # Step 4: 镜头阴影校正 (Lens Shading Correction - LSC)
-            if cfg['lsc']['enable']:
-                lsc_cfg = cfg['lsc'].copy()
-                lsc_cfg['sensor_bit_depth'] = cfg['raw'].get('sensor_bit_depth', 10)
-                lsc_cfg['bit_depth_management'] = bit_depth_cfg
-                raw = lsc.apply(raw, lsc_cfg)
-                # 不使用reference_max，让LSC图像用自己的最大值缩放
-                save_image_debug(raw, os.path.join(current_debug_dir, 'step4_lsc.png'), scale=True)
-
-            # Step 5: 噪声估计 (Noise Estimation) - 为后续自适应处理提供信息
-            if cfg.get('noise_estimation', {}).get('enable', False):
-                raw = noise_estimation.apply(raw, cfg)
-                save_image_debug(raw, os.path.join(current_debug_dir, 'step5_noise_estimation.png'), scale=True)
-                print(f"→ 噪声估计完成")
-
-            # Step 6: 去马赛克 (Demosaic) - 从RAW转换为RGB
-            if cfg['demosaic']['enable']:
-                demosaic_cfg = cfg['demosaic'].copy()
-                demosaic_cfg['bit_depth_management'] = bit_depth_cfg
-                if demosaic_cfg.get('method') == 'rawpy' or demosaic_cfg.get('method') == 'auto':
-                    demosaic_cfg['raw_file_path'] = raw_file_path
-                
-                rgb = demosaic.apply(raw, demosaic_cfg)
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step6_demosaic.png'), scale=False)
-            else:
-                raise Exception("去马赛克（Demosaic）模块必须启用才能获得 RGB 图像。")
-
-            # Step 7: 色彩空间转换 (Color Space Conversion) - 可选
-            if cfg.get('color_space_conversion', {}).get('enable', False):
-                rgb = color_space.apply(rgb, cfg['color_space_conversion'])
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step7_color_space.png'), scale=False)
-
-            # Step 8: 白平衡 (保持HDR范围)
-            if cfg['wb']['enable']:
-                rgb = wb.apply(rgb, cfg['wb'])
-                print(f"→ WB 输出范围：{rgb.min():.3f} - {rgb.max():.3f}")
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step8_wb.png'), scale=False)
-
-            # Step 9: 去噪 (在线性HDR空间)
-            if cfg['denoise']['enable']:
-                rgb = denoise.apply(rgb, cfg['denoise'])
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step9_denoise.png'), scale=False)
-
-            # Step 10: CCM (保持HDR范围)
-            if cfg['ccm']['enable']:
-                rgb = ccm.apply(rgb, cfg['ccm'])
-                print(f"→ CCM 输出范围：{rgb.min():.3f} - {rgb.max():.3f}")
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step10_ccm.png'), scale=False)
-
-            # Step 11: Tone Mapping (HDR → LDR，线性空间)
-            if cfg.get('tonemapping', {}).get('enable', False):
-                rgb = tonemapping.apply(rgb, cfg['tonemapping'])
-                print(f"→ Tone Mapping 输出范围：{rgb.min():.3f} - {rgb.max():.3f}")
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step11_tonemapping.png'), scale=False)
-
-            # Step 12: Gamma (线性 → 非线性，0-1范围)
-            if cfg['gamma']['enable']:
-                rgb = gamma.apply(rgb, cfg['gamma'])
-                print(f"→ Gamma 输出范围：{rgb.min():.3f} - {rgb.max():.3f}")
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step12_gamma.png'), scale=False)
-
-            # Step 13: 色度去噪 (Chroma Denoising) - 针对色彩噪声
-            if cfg.get('chroma_denoise', {}).get('enable', False):
-                rgb = chroma_denoise.apply(rgb, cfg['chroma_denoise'])
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step13_chroma_denoise.png'), scale=False)
-
-            # Step 14: 锐化 (Sharpen)
-            if cfg['sharpen']['enable']:
-                rgb = sharpen.apply(rgb, cfg['sharpen'])
-                print(f"→ 锐化 输出最大值：{rgb.max():.4f}")
-                print(f"→ 锐化 输出最小值：{rgb.min():.4f}")
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step14_sharpen.png'), scale=False)
-            
-            # Step 15: 超分辨率 (Super Resolution)
-            if 'super_resolution' in cfg and cfg['super_resolution'].get('enable', False):
-                rgb = super_resolution.apply(rgb, cfg['super_resolution'])
-                print(f"→ 超分辨 输出尺寸：{rgb.shape}")
-                print(f"→ 超分辨 输出最大值：{rgb.max():.4f}")
-                print(f"→ 超分辨 输出最小值：{rgb.min():.4f}")
-                save_image_debug(rgb, os.path.join(current_debug_dir, 'step15_super_resolution.png'), scale=False)
-            
+        print(f"图像尺寸：{raw.shape}, 数据类型: {raw.dtype}")
+        
+        # 调试：原始 RAW 数据范围，这在排查早期问题时很有用
+        stats.get_logger().begin_file(raw_file_path)
+        stats.log("raw", raw, "原始 RAW")
+
+        # --- ISP 流程：按执行计划依次执行各阶段（Step 0-15） ---
+        context = {'raw_file_path': raw_file_path}
+        try:
+            rgb = self.plan.run(raw, context, debug_dir=current_debug_dir, debug_writer=self.debug_writer,
+                                profiler=self.profiler)
+        finally:
+            # 当前文件的调试图写完再返回（写入失败时该文件记为失败）
+            self.debug_writer.flush()
+        self.detected_defects.extend(context.get('dpc_defects', []))
+
+        # Step 16-17: 抖动 + 保存结果图
+        with self.profiler.stage('output'):
             # Step 16: 抖动 (Dithering) - 最终输出前的处理
             dither_strength = cfg['output'].get('dither_strength', 0.5)
             if dither_strength > 0:
-                noise = (np.random.rand(*rgb.shape).astype(np.float32) - 0.5) * dither_strength * (1.0 / 255.0)
-                rgb_dithered = rgb + noise
+                rgb_dithered = dither(rgb, dither_strength)
                 print(f"→ 应用抖动，强度：{dither_strength}")
-                save_image_debug(rgb_dithered, os.path.join(current_debug_dir, 'step16_dithering.png'), scale=False)
+                if current_debug_dir and self.debug_writer.wants('dithering'):
+                    self.debug_writer.save(rgb_dithered, os.path.join(current_debug_dir, 'step16_dithering'))
             else:
                 rgb_dithered = rgb
 
             # 最终保存图像
             final_output_for_save = (rgb_dithered * 255).astype(np.uint8) # 使用抖动后的图像
-            
+        
             # 以原始文件名命名结果图，并保存到 output_dir
             output_path = os.path.join(output_dir, f"{file_name_without_ext}_processed.png")
             save_image(final_output_for_save, output_path)
-            print(f"✅ 文件 '{file_name_with_ext}' 处理完成，输出已保存至：{output_path}")
+        # 调试图全部写完，并停止后台写入线程（下一个文件保存调试图时重新创建）
+        self.debug_writer.close()
+        print(f"✅ 文件 '{file_name_with_ext}' 处理完成，输出已保存至：{output_path}")
+
+        return output_path
+
+
+# --- 多进程 worker ---
+# 每个 worker 进程只构建一次 ISPPipeline（包括阶段配置），之后处理分配到的所有文件
+_worker_pipeline = None
+
+def _init_worker(config, threads_per_worker=1):
+    global _worker_pipeline
+    # 避免 N 个进程 × OpenCV 内部线程造成 CPU 过载
+    cv2.setNumThreads(threads_per_worker)
+    _worker_pipeline = ISPPipeline(config=config)
 
-        print("\n--- 所有文件处理完毕 ---")
+def _process_in_worker(raw_file_path):
+    # worker 进程的 stdout 不会经过主进程，日志收集后随结果返回
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = _worker_pipeline.process_file_safe(raw_file_path)
+    result['log'] = log.getvalue()
+    return result
@@ -1,21 +1,129 @@
-# --------------------- 
-# 读取 RAW 图像（10bit, unpacked 格式） 
-# 返回 numpy 格式，供后续处理 
+# ---------------------
+# 读取 RAW 图像（10/12/14bit unpacked，或 MIPI CSI-2 packed RAW10/RAW12）
+# 返回 numpy 格式，供后续处理
 # 新手建议：确保 raw 的路径和分辨率与 config.yaml 一致
+#
+# 可选参数（config.yaml 的 raw 部分）：
+#   packing:            unpacked（每像素 2 字节，默认）或 mipi（RAW10: 4 像素 5 字节，
+#                       RAW12: 2 像素 3 字节），位深由 sensor_bit_depth 决定
+#   mmap:               true 时使用 np.memmap 零拷贝读取，返回 uint16（unpacked 时为只读视图），
+#                       直到某个阶段真正需要 float 时才转换（例如 BLC）
+#   header_bytes:       文件头字节数（跳过传感器 dump 的文件头）
+#   row_stride_bytes:   每行字节数（含行尾填充），0 表示紧密排列
+#   frame_header_bytes: 多帧文件中每帧前的帧头字节数
+#   frame_index:        多帧文件中要读取的帧序号
+#   unpack_threads:     packed 解包使用的线程数，0 表示 CPU 核数
 
 
-import numpy as np 
-import os 
-def read_raw(cfg):     
-     path = cfg['path']     
-     width = cfg['width']     
-     height = cfg['height']     
-     bit_depth = cfg['sensor_bit_depth'] 
-     if bit_depth == 10:         
-         # 10bit, 每像素2字节对齐（常见 unpacked 格式）         
-         raw = np.fromfile(path, dtype=np.uint16)         
-         raw = raw.reshape((height, width))     
-     else:         
-         raise NotImplementedError("Only 10bit raw supported")
-      
-     return raw.astype(np.float32)
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# MIPI CSI-2 打包格式：位深 -> (每组像素数, 每组字节数)
+MIPI_GROUPS = {10: (4, 5), 12: (2, 3)}
+UNPACKED_BIT_DEPTHS = (10, 12, 14, 16)
+
+# 解包用的低位查找表：把低位字节中属于第 i 个像素的 bit 移到字节高位，
+# 与高 8 位拼成 little-endian uint16 后整体右移即可得到像素值
+_RAW10_LOW_LUTS = [((np.arange(256) << s) & 0xC0).astype(np.uint8) for s in (6, 4, 2, 0)]
+_RAW12_LOW_LUTS = [((np.arange(256) << s) & 0xF0).astype(np.uint8) for s in (4, 0)]
+
+def read_raw(cfg):
+    path = cfg['path']
+    width = cfg['width']
+    height = cfg['height']
+    bit_depth = cfg['sensor_bit_depth']
+    packing = cfg.get('packing', 'unpacked').lower()
+
+    if packing == 'unpacked':
+        if bit_depth not in UNPACKED_BIT_DEPTHS:
+            raise NotImplementedError(f"不支持 {bit_depth}bit unpacked raw，支持: {UNPACKED_BIT_DEPTHS}")
+        # 每像素2字节对齐（常见 unpacked 格式）
+        row_bytes = width * 2
+    elif packing == 'mipi':
+        if bit_depth not in MIPI_GROUPS:
+            raise NotImplementedError(f"不支持 {bit_depth}bit MIPI packed raw，支持: {tuple(MIPI_GROUPS)}")
+        group_pixels, group_bytes = MIPI_GROUPS[bit_depth]
+        if width % group_pixels != 0:
+            raise ValueError(f"MIPI RAW{bit_depth} 要求 width 为 {group_pixels} 的倍数，当前 width={width}")
+        row_bytes = width // group_pixels * group_bytes
+    else:
+        raise ValueError(f"未知的 packing '{packing}'，可选: unpacked, mipi")
+
+    row_stride = cfg.get('row_stride_bytes') or row_bytes
+    if row_stride < row_bytes or (packing == 'unpacked' and row_stride % 2 != 0):
+        raise ValueError(f"row_stride_bytes={row_stride} 无效：不能小于每行数据字节数 {row_bytes}"
+                         f"{'，且必须为偶数' if packing == 'unpacked' else ''}")
+
+    frame_header = cfg.get('frame_header_bytes', 0)
+    frame_bytes = frame_header + height * row_stride
+    offset = cfg.get('header_bytes', 0) + cfg.get('frame_index', 0) * frame_bytes + frame_header
+
+    file_size = os.path.getsize(path)
+    if offset + height * row_stride > file_size:
+        raise ValueError(f"文件 '{path}' 大小 {file_size} 字节，不足以读取 "
+                         f"{height}x{width} 帧（偏移 {offset}，行跨度 {row_stride}）")
+
+    if packing == 'mipi':
+        if cfg.get('mmap', False):
+            packed = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(height, row_stride))
+        else:
+            packed = np.fromfile(path, dtype=np.uint8, count=height * row_stride, offset=offset)
+            packed = packed.reshape((height, row_stride))
+        raw = unpack_mipi(packed[:, :row_bytes], width, bit_depth, cfg.get('unpack_threads', 0))
+        return raw if cfg.get('mmap', False) else raw.astype(np.float32)
+
+    row_pixels = row_stride // 2
+    if cfg.get('mmap', False):
+        # 只映射需要的那一帧，按行跨度切片得到零拷贝视图
+        raw = np.memmap(path, dtype='<u2', mode='r', offset=offset, shape=(height, row_pixels))
+        return raw[:, :width]
+
+    raw = np.fromfile(path, dtype='<u2', count=height * row_pixels, offset=offset)
+    raw = raw.reshape((height, row_pixels))[:, :width]
+
+    return raw.astype(np.float32)
+
+def unpack_mipi(packed, width, bit_depth, threads=0):
+    """解包 MIPI CSI-2 RAW10/RAW12，packed 为 (H, 每行字节数) 的 uint8，返回 (H, W) uint16
+
+    大图按行分块多线程解包（OpenCV/NumPy 在计算时释放 GIL）。
+    """
+    height = packed.shape[0]
+    out = np.empty((height, width), dtype=np.uint16)
+
+    threads = threads or os.cpu_count() or 1
+    # 小图或单线程时直接解包，避免线程池开销
+    threads = min(threads, max(1, height * width // (1 << 20)))
+    if threads <= 1:
+        _unpack_rows(packed, out, bit_depth)
+        return out
+
+    bounds = np.linspace(0, height, threads + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda i: _unpack_rows(packed[bounds[i]:bounds[i + 1]],
+                                                 out[bounds[i]:bounds[i + 1]], bit_depth),
+                          range(threads)))
+    return out
+
+def _unpack_rows(packed, out, bit_depth):
+    """向量化解包若干行：高 8 位与查表得到的低位交织成 uint16，再整体右移"""
+    h, w = out.shape
+    group_pixels, group_bytes = MIPI_GROUPS[bit_depth]
+    groups = np.ascontiguousarray(packed).reshape(h, w // group_pixels, group_bytes)
+
+    # 最后一个字节存放本组所有像素的低位
+    low_byte = cv2.extractChannel(groups, group_bytes - 1)
+    # 交织结果：每个像素两个字节 [低位 << (8 - 低位数), 高 8 位]
+    words = out.view(np.uint8).reshape(h, w // group_pixels, group_pixels * 2)
+
+    if bit_depth == 10:
+        lows = [cv2.LUT(low_byte, lut) for lut in _RAW10_LOW_LUTS]
+        cv2.mixChannels([groups] + lows, [words], [0, 1, 1, 3, 2, 5, 3, 7, 5, 0, 6, 2, 7, 4, 8, 6])
+        out >>= 6
+    else:
+        lows = [cv2.LUT(low_byte, lut) for lut in _RAW12_LOW_LUTS]
+        cv2.mixChannels([groups] + lows, [words], [0, 1, 1, 3, 3, 0, 4, 2])
+        out >>= 4
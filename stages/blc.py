@@ -19,23 +19,26 @@ def apply(raw, config, debug_path=None):
 
 import numpy as np
 
-def apply(raw, config):
+from utils import log, stats
+
+def apply(raw, config, out=None):
+    """黑电平校正：不修改输入；out 非空时（float32、与输入同形状、不重叠）结果写入 out"""
     black_level = config.get("black_level", 64)
     
-    # 获取位深配置
+    # 获取位深配置：输入位深取 raw.sensor_bit_depth（与 RAW 读取一致），未指定时使用 sensor_native
     bit_depth_cfg = config.get('bit_depth_management', {})
-    input_bits = bit_depth_cfg.get('sensor_native', 10)
+    input_bits = config.get('sensor_bit_depth', bit_depth_cfg.get('sensor_native', 10))
     processing_bits = bit_depth_cfg.get('raw_processing', 16)
     
     # BLC处理：先减去黑电平，再扩展位深
-    corrected = raw.astype(np.float32) - black_level
-    corrected = np.maximum(corrected, 0)
+    corrected = np.subtract(raw, np.float32(black_level), out=out, dtype=np.float32)
+    np.maximum(corrected, 0, out=corrected)
     
     # 位深扩展到16bit处理精度
     if processing_bits > input_bits:
         scale_factor = (2**processing_bits - 1) / (2**input_bits - 1)
-        corrected = corrected * scale_factor
-        print(f"BLC: {input_bits}bit → {processing_bits}bit, 缩放={scale_factor:.2f}")
+        corrected *= scale_factor
+        log.info(f"BLC: {input_bits}bit → {processing_bits}bit, 缩放={scale_factor:.2f}")
     
-    print(f"BLC: 输出范围 [{corrected.min():.1f}, {corrected.max():.1f}]")
-    return corrected.astype(np.float32)
+    stats.log("blc", corrected, "输出")
+    return corrected.astype(np.float32, copy=False)
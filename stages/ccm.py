@@ -4,13 +4,16 @@
 
 import numpy as np
 
-def apply(rgb, config):
-    rgb = rgb.astype(np.float32)
+from utils import log, stats
+
+def apply(rgb, config, out=None):
+    """颜色校正矩阵：不修改输入；out 非空时（float32、与输入同形状、不重叠）结果写入 out"""
+    rgb = rgb.astype(np.float32, copy=False)
     matrix = np.array(config["matrix"], dtype=np.float32)
     h, w, _ = rgb.shape
     flat = rgb.reshape(-1, 3)
     
-    print(f"CCM: 输入范围 [{rgb.min():.4f}, {rgb.max():.4f}]")
+    stats.log("ccm", rgb, "输入")
     
     # 计算亮度，识别高光区域
     luminance = 0.299 * flat[:, 0] + 0.587 * flat[:, 1] + 0.114 * flat[:, 2]
@@ -19,35 +22,30 @@ def apply(rgb, config):
     # 高光区域直接跳过CCM
     highlight_mask = luminance > highlight_threshold
     
-    # 应用CCM矩阵
-    corrected = np.dot(flat, matrix.T)
-    corrected = np.maximum(corrected, 0.0)
+    # 应用CCM矩阵（直接写入输出缓冲区）
+    corrected = np.dot(flat, matrix.T, out=None if out is None else out.reshape(-1, 3))
+    np.maximum(corrected, 0.0, out=corrected)
     
     # 高光区域保持原始颜色
     corrected[highlight_mask] = flat[highlight_mask]
     
-    print(f"CCM: 跳过高光像素 {np.sum(highlight_mask)} 个")
-    print(f"CCM: 输出范围 [{corrected.min():.4f}, {corrected.max():.4f}]")
+    log.info(f"CCM: 跳过高光像素 {np.sum(highlight_mask)} 个")
+    stats.log("ccm", corrected, "输出")
     
-    # 饱和度增强（排除高光区域）
+    # 饱和度增强（排除高光区域）：原地计算 gray + (corrected - gray) * boost
     saturation_boost = config.get("saturation_boost", 1.0)
     if saturation_boost != 1.0:
         corrected_reshaped = corrected.reshape(h, w, 3)
-        highlight_mask_2d = highlight_mask.reshape(h, w)
         
         gray = 0.299 * corrected_reshaped[:,:,0] + 0.587 * corrected_reshaped[:,:,1] + 0.114 * corrected_reshaped[:,:,2]
         gray = np.expand_dims(gray, axis=2)
         
-        saturation_enhanced = gray + (corrected_reshaped - gray) * saturation_boost
-        saturation_enhanced = np.maximum(saturation_enhanced, 0.0)
-        
-        # 高光区域不做饱和度增强
-        corrected_reshaped = np.where(
-            np.expand_dims(highlight_mask_2d, axis=2),
-            corrected_reshaped,  # 保持原样
-            saturation_enhanced  # 应用饱和度增强
-        )
+        corrected_reshaped -= gray
+        corrected_reshaped *= saturation_boost
+        corrected_reshaped += gray
+        np.maximum(corrected_reshaped, 0.0, out=corrected_reshaped)
         
-        corrected = corrected_reshaped.reshape(-1, 3)
+        # 高光区域不做饱和度增强（恢复原始颜色）
+        corrected[highlight_mask] = flat[highlight_mask]
     
-    return corrected.reshape(h, w, 3).astype(np.float32)
+    return corrected.reshape(h, w, 3) if out is None else out
@@ -0,0 +1,254 @@
+# ---------------------
+# 3D LUT 模块
+# ✅ 两种用法：
+#    1. 独立阶段：color_lut.enable + cube_file，在 gamma 之后套用外部 .cube LUT（显示域调色）
+#    2. 烘焙（pipeline.bake_color_lut）：把相邻的逐像素阶段 ccm → tonemapping → gamma
+#       在编译执行计划时采样成 size³ 的 3D LUT，处理时每个像素只做一次三线性 / 四面体插值。
+#       超出 LUT 输入范围 [0, input_max] 的像素按原阶段链精确计算。
+#       烘焙时报告 LUT 相对精确计算的 ΔE（CIE76，按 sRGB 编码计算 Lab），超过 max_delta_e 时不烘焙。
+#
+#    网格默认使用 sqrt 整形（shaper）：采样点在 sqrt(x / input_max) 上均匀分布，
+#    暗部采样更密，gamma 类曲线的插值误差大幅降低。导出 .cube 时整形曲线写成 1D shaper LUT。
+
+import functools
+import os
+
+import numpy as np
+import cv2
+
+from utils import log
+
+# 可以烘焙的逐像素阶段（按必须的先后顺序），没有空间依赖，也不依赖整帧统计量
+BAKEABLE_STAGES = ("ccm", "tonemapping", "gamma")
+
+# 分块插值：每块 BLOCK_ROWS x ROW_LENGTH 个像素（cv2.remap 要求宽高小于 SHRT_MAX）
+ROW_LENGTH = 1024
+BLOCK_ROWS = 64
+
+# 导出 .cube 时 1D shaper 的采样点数
+SHAPER_SIZE = 4096
+
+def apply(rgb, config):
+    """config: {'lut': (N, N, N, 3), 'domain_max', 'shaper', 'interpolation', 'exact_chain'}
+
+    shaper 为 'linear'、'sqrt' 或 (S, 3) 的 1D 表（把 [0, domain_max] 映射到 [0, 1]）。
+    独立阶段使用时 lut / shaper 由 cube_file 加载（见 stages/registry.py）。
+    """
+    domain_max = config.get("domain_max", 1.0)
+    out = interpolate(rgb, config["lut"], domain_max, config.get("shaper", "linear"),
+                      config.get("interpolation", "trilinear"))
+
+    # 超出 LUT 输入范围的像素：有精确阶段链时按原阶段计算，否则按边界值截断
+    exact_chain = config.get("exact_chain")
+    if exact_chain:
+        flat = rgb.reshape(-1, 3)
+        out_of_range = np.any((flat < 0) | (flat > domain_max), axis=1)
+        count = int(np.count_nonzero(out_of_range))
+        if count:
+            exact = run_chain(exact_chain, flat[out_of_range].reshape(-1, 1, 3))
+            out.reshape(-1, 3)[out_of_range] = exact.reshape(-1, 3)
+            log.info(f"3D LUT: {count} 个像素超出 LUT 输入范围，按原阶段精确计算")
+    return out
+
+def interpolate(rgb, lut, domain_max=1.0, shaper="linear", method="trilinear"):
+    """对 (..., 3) 图像做 3D LUT 插值，lut[r, g, b] 为 (N, N, N, 3)"""
+    size = lut.shape[0]
+    flat = np.ascontiguousarray(rgb, dtype=np.float32).reshape(-1, 3)
+    out = np.empty_like(flat)
+    block_pixels = BLOCK_ROWS * ROW_LENGTH
+
+    if method == "trilinear":
+        # 把 LUT 排成 2D 图（第 b 个切片占 [b*N, (b+1)*N) 行，列为 r），
+        # 每个切片内的 (r, g) 双线性插值交给 cv2.remap，再沿 b 线性插值
+        slices = np.ascontiguousarray(lut.transpose(2, 1, 0, 3).reshape(size * size, size, 3), dtype=np.float32)
+        for start in range(0, flat.shape[0], block_pixels):
+            block = flat[start:start + block_pixels]
+            rows = block.shape[0] // ROW_LENGTH if block.shape[0] >= ROW_LENGTH else 1
+            cols = block.shape[0] // rows
+            main = rows * cols
+            out[start:start + main] = _trilinear_remap(block[:main].reshape(rows, cols, 3), slices, size,
+                                                       domain_max, shaper).reshape(-1, 3)
+            if main < block.shape[0]:
+                tail = block[main:].reshape(1, -1, 3)
+                out[start + main:start + block.shape[0]] = _trilinear_remap(tail, slices, size,
+                                                                            domain_max, shaper).reshape(-1, 3)
+    else:
+        # 四面体插值：按小数部分从大到小依次沿对应轴走到对角顶点，只需 4 次取值
+        table = lut.reshape(-1, 3)
+        strides = np.array([size * size, size, 1], dtype=np.int32)
+        for start in range(0, flat.shape[0], block_pixels):
+            coords = _lut_coords(flat[start:start + block_pixels], size, domain_max, shaper)
+            base = np.minimum(coords.astype(np.int32), size - 2)
+            frac = coords - base
+            index = base @ strides
+            order = np.argsort(-frac, axis=1, kind="stable")
+            f_sorted = np.take_along_axis(frac, order, axis=1)
+            step = strides[order]
+            v1 = index + step[:, 0]
+            v2 = v1 + step[:, 1]
+            v3 = index + strides.sum()
+            out[start:start + block_pixels] = (table[index] * (1.0 - f_sorted[:, 0:1])
+                                               + table[v1] * (f_sorted[:, 0:1] - f_sorted[:, 1:2])
+                                               + table[v2] * (f_sorted[:, 1:2] - f_sorted[:, 2:3])
+                                               + table[v3] * f_sorted[:, 2:3])
+    return out.reshape(rgb.shape)
+
+def _lut_coords(rgb, size, domain_max, shaper):
+    """输入值 → LUT 网格坐标 [0, size - 1]"""
+    coords = rgb * np.float32(1.0 / domain_max)
+    np.clip(coords, 0, 1, out=coords)
+    if isinstance(shaper, np.ndarray):
+        for c in range(3):
+            coords[..., c] = np.interp(coords[..., c], np.linspace(0, 1, len(shaper)), shaper[:, c])
+    elif shaper == "sqrt":
+        np.sqrt(coords, out=coords)
+    coords *= np.float32(size - 1)
+    return coords
+
+def _trilinear_remap(block, slices, size, domain_max, shaper):
+    coords = _lut_coords(block, size, domain_max, shaper)
+    r, g, b = coords[..., 0], coords[..., 1], coords[..., 2]
+    b0 = np.minimum(b.astype(np.int32), size - 2).astype(np.float32)
+    frac_b = (b - b0)[..., np.newaxis]
+    map_y = g + b0 * np.float32(size)
+    lower = cv2.remap(slices, r, map_y, cv2.INTER_LINEAR)
+    upper = cv2.remap(slices, r, map_y + np.float32(size), cv2.INTER_LINEAR)
+    return lower + (upper - lower) * frac_b
+
+def run_chain(chain, rgb):
+    """按顺序执行 [(apply, stage_cfg), ...]，屏蔽各阶段的普通日志（警告仍然输出）"""
+    with log.quiet():
+        for stage_apply, stage_cfg in chain:
+            rgb = stage_apply(rgb, stage_cfg)
+    return np.asarray(rgb, dtype=np.float32)
+
+def grid_axis(size, input_max=1.0, shaper="sqrt"):
+    """LUT 网格在每个通道上的采样点"""
+    axis = np.linspace(0.0, 1.0, size)
+    if shaper == "sqrt":
+        axis = axis ** 2
+    return (axis * input_max).astype(np.float32)
+
+def bake(chain, size=33, input_max=1.0, shaper="sqrt"):
+    """在 [0, input_max]³ 的 size³ 网格上采样阶段链，返回 lut[r, g, b] (size, size, size, 3)"""
+    axis = grid_axis(size, input_max, shaper)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing="ij")
+    grid = np.stack([r, g, b], axis=-1).reshape(size * size, size, 3)
+    return run_chain(chain, grid).reshape(size, size, size, 3)
+
+def accuracy_report(lut, chain, input_max=1.0, shaper="sqrt", interpolation="trilinear",
+                    samples=200000, seed=0):
+    """比较 LUT 插值与精确阶段链，返回 ΔE76 统计 {'max', 'p99', 'mean'}
+
+    采样点在整形后的输入空间内均匀分布（与网格密度一致），并包含所有网格单元中心（插值误差最大处）。
+    """
+    size = lut.shape[0]
+    rng = np.random.default_rng(seed)
+    unit = rng.uniform(0, 1, size=(samples, 3))
+    centers = (np.arange(size - 1) + 0.5) / (size - 1)
+    r, g, b = np.meshgrid(centers, centers, centers, indexing="ij")
+    unit = np.concatenate([unit, np.stack([r, g, b], axis=-1).reshape(-1, 3)])
+    if shaper == "sqrt":
+        unit = unit ** 2
+    points = (unit * input_max).astype(np.float32).reshape(-1, 1, 3)
+
+    exact = run_chain(chain, points).reshape(-1, 3)
+    approx = interpolate(points, lut, input_max, shaper, interpolation).reshape(-1, 3)
+    delta_e = np.linalg.norm(srgb_to_lab(exact) - srgb_to_lab(approx), axis=1)
+    return {"max": float(delta_e.max()), "p99": float(np.percentile(delta_e, 99)),
+            "mean": float(delta_e.mean())}
+
+def srgb_to_lab(rgb):
+    """sRGB 编码（0-1）→ CIE Lab（D65），用于计算 ΔE"""
+    rgb = np.clip(np.asarray(rgb, dtype=np.float64), 0, 1)
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([[0.4124, 0.3576, 0.1805],
+                             [0.2126, 0.7152, 0.0722],
+                             [0.0193, 0.1192, 0.9505]]).T
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+def save_cube(path, lut, domain_max=1.0, shaper="linear", title="ISP baked LUT"):
+    """导出 .cube（R 变化最快）
+
+    linear 网格写成标准 3D LUT（DOMAIN_MIN/DOMAIN_MAX）；sqrt 网格额外写 1D shaper LUT
+    （LUT_1D_INPUT_RANGE 0 ~ domain_max，DaVinci Resolve 的 shaper + 3D 格式）。
+    """
+    size = lut.shape[0]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'TITLE "{title}"\n')
+        if shaper == "linear":
+            f.write(f"LUT_3D_SIZE {size}\n")
+            f.write("DOMAIN_MIN 0.0 0.0 0.0\n")
+            f.write(f"DOMAIN_MAX {domain_max:.6f} {domain_max:.6f} {domain_max:.6f}\n")
+        else:
+            shaper_curve = np.sqrt(np.linspace(0, 1, SHAPER_SIZE))
+            f.write(f"LUT_1D_SIZE {SHAPER_SIZE}\n")
+            f.write(f"LUT_1D_INPUT_RANGE 0.0 {domain_max:.6f}\n")
+            f.write(f"LUT_3D_SIZE {size}\n")
+            f.write("LUT_3D_INPUT_RANGE 0.0 1.0\n")
+            np.savetxt(f, np.repeat(shaper_curve[:, np.newaxis], 3, axis=1), fmt="%.6f")
+        np.savetxt(f, lut.transpose(2, 1, 0, 3).reshape(-1, 3), fmt="%.6f")
+
+@functools.lru_cache(maxsize=4)
+def load_cube(path):
+    """读取 .cube 文件，返回 {'lut': lut[r, g, b] 只读 float32, 'domain_max', 'shaper'}
+
+    支持标准 3D LUT（DOMAIN_MIN 为 0、各通道 DOMAIN_MAX 相同）和 1D shaper + 3D LUT。
+    """
+    size_1d = size_3d = None
+    domain_min, domain_max = [0.0] * 3, [1.0] * 3
+    range_1d = range_3d = (0.0, 1.0)
+    values = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split()
+            key = fields[0].upper()
+            if key == "TITLE":
+                continue
+            elif key == "LUT_1D_SIZE":
+                size_1d = int(fields[1])
+            elif key == "LUT_3D_SIZE":
+                size_3d = int(fields[1])
+            elif key == "DOMAIN_MIN":
+                domain_min = [float(v) for v in fields[1:4]]
+            elif key == "DOMAIN_MAX":
+                domain_max = [float(v) for v in fields[1:4]]
+            elif key == "LUT_1D_INPUT_RANGE":
+                range_1d = (float(fields[1]), float(fields[2]))
+            elif key == "LUT_3D_INPUT_RANGE":
+                range_3d = (float(fields[1]), float(fields[2]))
+            else:
+                values.append([float(v) for v in fields[:3]])
+
+    count_1d = size_1d or 0
+    if size_3d is None or len(values) != count_1d + size_3d ** 3:
+        raise ValueError(f".cube 文件 '{path}' 格式错误：LUT_1D_SIZE={size_1d}，LUT_3D_SIZE={size_3d}，"
+                         f"数据行数 {len(values)}")
+    values = np.array(values, dtype=np.float32)
+
+    if size_1d:
+        if range_1d[0] != 0 or range_3d != (0.0, 1.0):
+            raise ValueError(f".cube 文件 '{path}' 的输入范围不受支持：1D {range_1d} / 3D {range_3d}")
+        shaper, domain = values[:size_1d], range_1d[1]
+        # 本模块导出的 sqrt shaper 直接用 np.sqrt 计算（1D 表在 0 附近斜率无穷大，线性插值误差大）
+        if np.allclose(shaper, np.sqrt(np.linspace(0, 1, size_1d))[:, np.newaxis], atol=1e-5):
+            shaper = "sqrt"
+    else:
+        if any(domain_min) or len(set(domain_max)) != 1:
+            raise ValueError(f".cube 文件 '{path}' 的 DOMAIN_MIN/DOMAIN_MAX 不受支持：{domain_min} / {domain_max}")
+        shaper, domain = "linear", domain_max[0]
+
+    lut = values[count_1d:].reshape(size_3d, size_3d, size_3d, 3).transpose(2, 1, 0, 3)
+    lut = np.ascontiguousarray(lut)
+    lut.flags.writeable = False
+    if isinstance(shaper, np.ndarray):
+        shaper.flags.writeable = False
+    return {"lut": lut, "domain_max": domain, "shaper": shaper}
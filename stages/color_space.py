@@ -1,35 +1,41 @@
 import numpy as np
+import cv2
 
 def apply(rgb, config):
     """色彩空间转换和色域管理"""
+    gamut_mapping = config.get("gamut_mapping", "clip")
+    transform_matrix = get_transform_matrix(config)
+    
+    if transform_matrix is None:
+        return rgb
+    
+    # 应用色彩空间转换（float32 矩阵，避免 np.dot 把整帧升为 float64）
+    rgb = np.asarray(rgb, dtype=np.float32)
+    rgb_out = cv2.transform(rgb.reshape(-1, 1, 3), transform_matrix.astype(np.float32)).reshape(rgb.shape)
+    
+    # 色域映射
+    if gamut_mapping == "clip":
+        np.clip(rgb_out, 0, 1, out=rgb_out)
+    elif gamut_mapping == "compress":
+        # 软压缩超出色域的颜色
+        rgb_out /= 1 + rgb_out
+    
+    return rgb_out
+
+def get_transform_matrix(config):
+    """返回 3x3 色彩空间转换矩阵，输入输出色彩空间相同时返回 None"""
     input_space = config.get("input_space", "sRGB")
     output_space = config.get("output_space", "sRGB")
-    gamut_mapping = config.get("gamut_mapping", "clip")
     
     if input_space == output_space:
-        return rgb
+        return None
     
     # sRGB to Rec.2020 转换矩阵
     if input_space == "sRGB" and output_space == "rec2020":
-        transform_matrix = np.array([
+        return np.array([
             [0.6274, 0.3293, 0.0433],
             [0.0691, 0.9195, 0.0114],
             [0.0164, 0.0880, 0.8956]
         ])
-    else:
-        # 默认单位矩阵
-        transform_matrix = np.eye(3)
-    
-    # 应用色彩空间转换
-    rgb_flat = rgb.reshape(-1, 3)
-    rgb_transformed = np.dot(rgb_flat, transform_matrix.T)
-    rgb_out = rgb_transformed.reshape(rgb.shape)
-    
-    # 色域映射
-    if gamut_mapping == "clip":
-        rgb_out = np.clip(rgb_out, 0, 1)
-    elif gamut_mapping == "compress":
-        # 软压缩超出色域的颜色
-        rgb_out = rgb_out / (1 + rgb_out)
-    
-    return rgb_out.astype(np.float32)
\ No newline at end of file
+    # 默认单位矩阵
+    return np.eye(3)
@@ -4,23 +4,83 @@
 
 import cv2
 import numpy as np
+import scipy.fft
 from scipy import ndimage
 
+from utils import log
+from utils.geometry import bayer_masks, bayer_sites, gaussian_rfft_filter
+
+# OpenCV 的 Bayer 转换代码前缀（COLOR_Bayer{XX}2RGB）
+BAYER_CODES = {"bggr": "BG", "grbg": "GR", "rggb": "RG", "gbrg": "GB"}
+
+# 支持 16 位输入的 OpenCV 算法（VNG 只支持 8 位）
+NATIVE_16BIT_METHODS = {"opencv_ea": "_EA", "opencv_bilinear": ""}
+
+# 依赖整帧的方法，不能按 tile 执行：frequency_domain 的 FFT 滤波截止频率随图像尺寸变化，
+# selective_anti_moire 按整幅图的最大值和 95% 分位数检测摩尔纹
+WHOLE_FRAME_METHODS = ("frequency_domain", "selective_anti_moire")
+
+# OpenCV BayerXX2RGB 的输出通道顺序：pattern 中的 R 在通道 2，B 在通道 0
+OPENCV_CHANNELS = {"r": 2, "g": 1, "b": 0}
+
+# Malvar-He-Cutler 梯度校正双线性插值的 5x5 核（已除以 8）
+MHC_KERNELS = {
+    # R/B 位置的 G
+    "g_at_rb": np.array([[ 0,  0, -1,  0,  0],
+                         [ 0,  0,  2,  0,  0],
+                         [-1,  2,  4,  2, -1],
+                         [ 0,  0,  2,  0,  0],
+                         [ 0,  0, -1,  0,  0]], dtype=np.float32) / 8,
+    # G 位置、左右邻居的颜色（行方向）
+    "row": np.array([[ 0,  0, 0.5,  0,  0],
+                     [ 0, -1,   0, -1,  0],
+                     [-1,  4,   5,  4, -1],
+                     [ 0, -1,   0, -1,  0],
+                     [ 0,  0, 0.5,  0,  0]], dtype=np.float32) / 8,
+    # G 位置、上下邻居的颜色（列方向）
+    "col": np.array([[  0,  0, -1,  0,   0],
+                     [  0, -1,  4, -1,   0],
+                     [0.5,  0,  5,  0, 0.5],
+                     [  0, -1,  4, -1,   0],
+                     [  0,  0, -1,  0,   0]], dtype=np.float32) / 8,
+    # R 位置的 B / B 位置的 R（对角方向）
+    "diagonal": np.array([[   0, 0, -1.5, 0,    0],
+                          [   0, 2,    0, 2,    0],
+                          [-1.5, 0,    6, 0, -1.5],
+                          [   0, 2,    0, 2,    0],
+                          [   0, 0, -1.5, 0,    0]], dtype=np.float32) / 8,
+}
+
 def apply(raw, config):
     method = config.get("method", "opencv_vng")
     pattern = config.get("bayer_pattern", "bggr").lower()
     
-    print(f"DEBUG: 使用Demosaic算法: {method}")
+    log.info(f"DEBUG: 使用Demosaic算法: {method}")
     
-    if method == "selective_anti_moire":
+    if method in NATIVE_16BIT_METHODS and config.get("high_bit_depth", True):
+        # 16 位原生路径：uint16 输入 → cvtColor → 一次乘法直接得到归一化的 float32
+        rgb16, scale = opencv_demosaic_16bit(raw, config, NATIVE_16BIT_METHODS[method])
+        normalize_max = config.get("normalize_max")
+        divisor = normalize_max / scale if normalize_max else int(rgb16.max()) or 1
+        return np.multiply(rgb16, np.float32(1.0 / divisor), dtype=np.float32)
+    
+    if method == "opencv_bilinear":
+        rgb = opencv_demosaic(raw, config, "")
+    elif method == "selective_anti_moire":
         rgb = selective_anti_moire_demosaic(raw, config)
     elif method == "opencv_ea":
         rgb = opencv_demosaic_ea(raw, config)
+    elif method == "frequency_domain":
+        rgb = frequency_domain_demosaic(raw, config)
+    elif method == "mhc":
+        rgb = mhc_demosaic(raw, config)
     else:
         rgb = opencv_demosaic(raw, config)
     
-    rgb_normalized = rgb / rgb.max()
-    return rgb_normalized.astype(np.float32)
+    # 分块执行时由分析预处理传入整帧的归一化最大值，保证各 tile 一致
+    normalize_max = config.get("normalize_max") or rgb.max()
+    rgb_normalized = rgb / normalize_max
+    return rgb_normalized.astype(np.float32, copy=False)
 
 def adaptive_gradient_demosaic(raw, config):
     """自适应梯度demosaic - 更好的边缘保持"""
@@ -39,42 +99,32 @@ def adaptive_gradient_demosaic(raw, config):
     # 插值缺失像素
     rgb = interpolate_missing_pixels(rgb, raw, r_mask, g_mask, b_mask)
     
-    print("DEBUG: 使用自适应梯度demosaic")
+    log.info("DEBUG: 使用自适应梯度demosaic")
     return rgb
 
 def frequency_domain_demosaic(raw, config):
-    """频域demosaic - 减少高频伪影"""
+    """频域demosaic - 减少高频伪影
+
+    fft_floor:   高频保留比例（默认 0.3）
+    fft_workers: scipy.fft 线程数，默认与 OpenCV 线程数一致（多进程时由 threads_per_worker 决定）
+    """
     # 先用EA算法
     rgb = opencv_demosaic_ea(raw, config)
     
-    # 频域处理每个通道
-    for c in range(3):
-        channel = rgb[:,:,c]
-        
-        # FFT
-        f_transform = np.fft.fft2(channel)
-        f_shift = np.fft.fftshift(f_transform)
-        
-        # 创建低通滤波器（抑制高频摩尔纹）
-        h, w = channel.shape
-        crow, ccol = h//2, w//2
-        
-        # 高斯低通滤波器
-        y, x = np.ogrid[:h, :w]
-        mask = np.exp(-((x - ccol)**2 + (y - crow)**2) / (2 * (min(h,w)/8)**2))
-        
-        # 保留低频，轻微抑制高频
-        mask = 0.3 + 0.7 * mask  # 不完全滤除高频
-        
-        # 应用滤波器
-        f_shift_filtered = f_shift * mask
-        
-        # 逆FFT
-        f_ishift = np.fft.ifftshift(f_shift_filtered)
-        channel_filtered = np.fft.ifft2(f_ishift)
-        rgb[:,:,c] = np.real(channel_filtered)
+    # 高斯低通滤波器（抑制高频摩尔纹），保留低频，轻微抑制高频（不完全滤除高频）
+    # 实数输入的频谱共轭对称，只需要 rfft2 的一半；滤波器按分辨率缓存，已做 ifftshift
+    h, w = rgb.shape[:2]
+    mask = gaussian_rfft_filter(h, w, config.get("fft_floor", 0.3))
+    workers = config.get("fft_workers") or cv2.getNumThreads()
+    
+    # 三个通道一次批量变换（通道在前，每个平面连续），float32 输入保持单精度计算
+    planes = np.ascontiguousarray(rgb.transpose(2, 0, 1))
+    spectrum = scipy.fft.rfft2(planes, workers=workers)
+    spectrum *= mask
+    filtered = scipy.fft.irfft2(spectrum, s=(h, w), workers=workers)
+    rgb = np.ascontiguousarray(filtered.transpose(1, 2, 0))
     
-    print("DEBUG: 应用频域抗摩尔纹处理")
+    log.info("DEBUG: 应用频域抗摩尔纹处理")
     return rgb
 
 def interpolate_missing_pixels(rgb, raw, r_mask, g_mask, b_mask):
@@ -103,23 +153,8 @@ def interpolate_missing_pixels(rgb, raw, r_mask, g_mask, b_mask):
     return rgb
 
 def create_bayer_masks(h, w, pattern):
-    """创建Bayer模式mask"""
-    r_mask = np.zeros((h, w), dtype=bool)
-    g_mask = np.zeros((h, w), dtype=bool) 
-    b_mask = np.zeros((h, w), dtype=bool)
-    
-    if pattern == "rggb":
-        r_mask[0::2, 0::2] = True
-        g_mask[0::2, 1::2] = True
-        g_mask[1::2, 0::2] = True
-        b_mask[1::2, 1::2] = True
-    elif pattern == "bggr":
-        b_mask[0::2, 0::2] = True
-        g_mask[0::2, 1::2] = True
-        g_mask[1::2, 0::2] = True
-        r_mask[1::2, 1::2] = True
-    
-    return r_mask, g_mask, b_mask
+    """创建Bayer模式mask（按分辨率缓存，只读）"""
+    return bayer_masks(h, w, pattern)
 
 def fill_borders(rgb, raw, r_mask, g_mask, b_mask):
     """填充边界像素"""
@@ -180,64 +215,108 @@ def edge_aware_demosaic(raw, pattern):
     
     return rgb
 
-def opencv_demosaic(raw, config):
-    """OpenCV demosaic方法 - 支持所有Bayer模式"""
+def opencv_demosaic(raw, config, algorithm="_VNG"):
+    """OpenCV demosaic方法 - 支持所有Bayer模式（8 位，VNG 只支持 8 位输入）"""
     pattern = config.get("bayer_pattern", "bggr").lower()
     
-    print(f"DEBUG: opencv_demosaic接收到的pattern: '{pattern}'")
-    print(f"DEBUG: config内容: {config}")
+    log.info(f"DEBUG: opencv_demosaic接收到的pattern: '{pattern}'")
+    log.info(f"DEBUG: config内容: {config}")
     
-    # 归一化到8bit进行demosaic
-    raw_8bit = (raw / raw.max() * 255).astype(np.uint8)
+    # 归一化到8bit进行demosaic（raw_max 可由分块执行的分析预处理给出整帧最大值）
+    raw_max = config.get("raw_max") or raw.max()
+    raw_8bit = (raw / raw_max * 255).astype(np.uint8)
     
     # 根据Bayer模式选择对应的OpenCV转换
-    if pattern == "bggr":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerBG2RGB_VNG)
-        print("DEBUG: 使用 COLOR_BayerBG2RGB_VNG")
-    elif pattern == "grbg":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerGR2RGB_VNG)
-        print("DEBUG: 使用 COLOR_BayerGR2RGB_VNG")
-    elif pattern == "rggb":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerRG2RGB_VNG)
-        print("DEBUG: 使用 COLOR_BayerRG2RGB_VNG")
-    elif pattern == "gbrg":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerGB2RGB_VNG)
-        print("DEBUG: 使用 COLOR_BayerGB2RGB_VNG")
-    else:
+    if pattern not in BAYER_CODES:
         print(f"WARNING: 未知Bayer模式 '{pattern}', 默认使用BGGR")
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerBG2RGB_VNG)
+        pattern = "bggr"
+    code_name = f"COLOR_Bayer{BAYER_CODES[pattern]}2RGB{algorithm}"
+    rgb_8bit = cv2.cvtColor(raw_8bit, getattr(cv2, code_name))
+    log.info(f"DEBUG: 使用 {code_name}")
     
     # 转回float32，保持在合理范围
-    rgb_float = rgb_8bit.astype(np.float32) * (raw.max() / 255.0)
+    rgb_float = rgb_8bit.astype(np.float32) * (raw_max / 255.0)
     
     return rgb_float
 
+def to_uint16(raw, raw_max=None):
+    """Bayer 数据 → uint16，返回 (raw16, scale)，raw16 * scale 为原始数据单位
+
+    uint16 输入直接使用（分块执行时 tile 是跨步视图，先复制成连续数组：cvtColor 的 Bayer 转换不支持跨步输入）；
+    float 输入按 raw_max 拉伸到 0-65535（一次带舍入和饱和的转换）。
+    """
+    if raw.dtype == np.uint16:
+        return np.ascontiguousarray(raw), 1.0
+    raw_max = float(raw_max or raw.max()) or 1.0
+    scale = raw_max / 65535.0
+    return cv2.multiply(np.asarray(raw, dtype=np.float32), 1.0 / scale, dtype=cv2.CV_16U), scale
+
+def opencv_demosaic_16bit(raw, config, algorithm="_EA"):
+    """16 位 OpenCV demosaic（bilinear / EA），返回 (rgb uint16, scale)，rgb * scale 为原始数据单位"""
+    pattern = config.get("bayer_pattern", "bggr").lower()
+    raw16, scale = to_uint16(raw, config.get("raw_max"))
+    code_name = f"COLOR_Bayer{BAYER_CODES.get(pattern, 'BG')}2RGB{algorithm}"
+    log.info(f"DEBUG: 使用 {code_name}（16位）")
+    return cv2.cvtColor(raw16, getattr(cv2, code_name)), scale
+
 def opencv_demosaic_ea(raw, config):
-    """OpenCV边缘感知demosaic - 减少摩尔纹"""
+    """OpenCV边缘感知demosaic - 减少摩尔纹（high_bit_depth 时用 16 位输入）"""
+    if config.get("high_bit_depth", True):
+        rgb16, scale = opencv_demosaic_16bit(raw, config, "_EA")
+        return np.multiply(rgb16, np.float32(scale), dtype=np.float32)
+    
     pattern = config.get("bayer_pattern", "bggr").lower()
     
     # 归一化到8bit
-    raw_8bit = (raw / raw.max() * 255).astype(np.uint8)
+    raw_max = config.get("raw_max") or raw.max()
+    raw_8bit = (raw / raw_max * 255).astype(np.uint8)
     
     # 使用边缘感知算法
-    if pattern == "bggr":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerBG2RGB_EA)
-    elif pattern == "grbg":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerGR2RGB_EA)
-    elif pattern == "rggb":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerRG2RGB_EA)
-    elif pattern == "gbrg":
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerGB2RGB_EA)
-    else:
-        rgb_8bit = cv2.cvtColor(raw_8bit, cv2.COLOR_BayerBG2RGB_EA)
+    code_name = f"COLOR_Bayer{BAYER_CODES.get(pattern, 'BG')}2RGB_EA"
+    rgb_8bit = cv2.cvtColor(raw_8bit, getattr(cv2, code_name))
     
-    print("DEBUG: 使用边缘感知demosaic (EA)")
+    log.info("DEBUG: 使用边缘感知demosaic (EA)")
     
     # 转回float32
-    rgb_float = rgb_8bit.astype(np.float32) * (raw.max() / 255.0)
+    rgb_float = rgb_8bit.astype(np.float32) * (raw_max / 255.0)
     
     return rgb_float
 
+def mhc_demosaic(raw, config):
+    """Malvar-He-Cutler demosaic - 固定 5x5 卷积，全程 float32
+
+    每个核对整帧卷积一次，再按 Bayer 位置从对应结果中取跨步子平面填入输出通道。
+    输出为原始数据单位，通道顺序与 OpenCV BayerXX2RGB 一致。
+    """
+    pattern = config.get("bayer_pattern", "bggr").lower()
+    raw = np.asarray(raw, dtype=np.float32)
+    h, w = raw.shape
+    
+    # BORDER_REFLECT_101 以边界像素为轴镜像，镜像后的像素颜色不变，边界不需要单独处理
+    filtered = {name: cv2.filter2D(raw, -1, kernel, borderType=cv2.BORDER_REFLECT_101)
+                for name, kernel in MHC_KERNELS.items()}
+    
+    rgb = np.empty((h, w, 3), dtype=np.float32)
+    sites = bayer_sites(pattern)
+    layout = {offset: color for color, offsets in sites.items() for offset in offsets}
+    for (dy, dx), color in layout.items():
+        if color == "g":
+            # 同一行左右邻居的颜色取行方向核，另一种颜色取列方向核
+            row_color = layout[(dy, 1 - dx)]
+            col_color = "b" if row_color == "r" else "r"
+            sources = {"g": raw, row_color: filtered["row"], col_color: filtered["col"]}
+        else:
+            other = "b" if color == "r" else "r"
+            sources = {color: raw, "g": filtered["g_at_rb"], other: filtered["diagonal"]}
+        for source_color, source in sources.items():
+            rgb[dy::2, dx::2, OPENCV_CHANNELS[source_color]] = source[dy::2, dx::2]
+    
+    # 梯度校正项会在强边缘处过冲，裁剪到输入范围
+    raw_max = config.get("raw_max") or raw.max()
+    np.clip(rgb, 0, raw_max, out=rgb)
+    log.info("DEBUG: 使用 Malvar-He-Cutler demosaic")
+    return rgb
+
 def anti_moire_demosaic(raw, config):
     """抗摩尔纹demosaic算法"""
     pattern = config.get("bayer_pattern", "bggr").lower()
@@ -249,7 +328,7 @@ def anti_moire_demosaic(raw, config):
     gray = cv2.cvtColor((rgb * 255 / rgb.max()).astype(np.uint8), cv2.COLOR_RGB2GRAY)
     
     # 高频检测
-    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
     high_freq_mask = np.abs(laplacian) > np.percentile(np.abs(laplacian), 85)
     
     # 在高频区域应用轻微的低通滤波
@@ -266,7 +345,7 @@ def anti_moire_demosaic(raw, config):
                       rgb * (1 - alpha) + rgb_blurred * alpha, 
                       rgb)
     
-    print("DEBUG: 应用抗摩尔纹处理")
+    log.info("DEBUG: 应用抗摩尔纹处理")
     
     return rgb
 
@@ -306,5 +385,5 @@ def selective_anti_moire_demosaic(raw, config):
                                  channel * (1-alpha) + smoothed * alpha,
                                  channel)
     
-    print("DEBUG: 选择性抗摩尔纹 - 保持细节")
+    log.info("DEBUG: 选择性抗摩尔纹 - 保持细节")
     return rgb
@@ -6,6 +6,12 @@
 import cv2
 import numpy as np
 
+from utils import log
+from utils.tiling import map_tiles
+
+# NORM_L1 权重按平均绝对差计算，同样的 h 比 8 位 NORM_L2 强；乘以该系数后去噪强度与 8 位路径接近
+NORM_L1_H_SCALE = 0.8
+
 def apply(rgb, config):
     # 确保输入 rgb 是 0-1 范围的 float32
     rgb = np.clip(rgb, 0, 1).astype(np.float32)
@@ -36,11 +42,34 @@ def apply(rgb, config):
         
         h_color_param = config.get("h_color_param", h_param)
         
-        denoised_rgb_8bit = cv2.fastNlMeansDenoisingColored(
-            rgb_8bit, None, h_param, h_color_param, template_ws, search_ws
-        )
-        print(f"应用自适应去噪 (非局部均值), 噪声水平: {estimated_noise:.4f}, h: {h_param}")
+        # tile_size > 0 时按带 halo 的重叠 tile 在线程池中并行（结果与整帧处理相同）；
+        # 单线程时整帧处理（halo 只会增加计算量）
+        threads = config.get("threads", 0) or cv2.getNumThreads()
+        tile_size = config.get("tile_size", 0) if threads > 1 else 0
+        halo = search_ws // 2 + template_ws // 2
+        
+        if config.get("bit_depth", 8) == 16:
+            denoised_rgb = nl_means_16bit(rgb, h_param, h_color_param, template_ws, search_ws,
+                                          config.get("chroma_scale", 0.5), tile_size, threads)
+            log.info(f"应用自适应去噪 (16位非局部均值，亮度/色度分离), 噪声水平: {estimated_noise:.4f}, h: {h_param}")
+            return np.clip(denoised_rgb, 0, 1)
+        
+        denoised_rgb_8bit = map_tiles(
+            rgb_8bit,
+            lambda tile: cv2.fastNlMeansDenoisingColored(tile, None, h_param, h_color_param, template_ws, search_ws),
+            tile_size, halo, threads)
+        log.info(f"应用自适应去噪 (非局部均值), 噪声水平: {estimated_noise:.4f}, h: {h_param}")
         
+    elif denoise_method == "guided":
+        # 引导滤波：盒式滤波实现，耗时与半径无关，直接在 float32 线性 RGB 上计算
+        radius = config.get("radius", 4)
+        eps = config.get("eps") or (2 * estimated_noise) ** 2
+        guide = config.get("guide", "self")
+        subsample = config.get("subsample", 1)
+        denoised_rgb = guided_filter(rgb, radius, eps, guide, subsample)
+        log.info(f"应用去噪 (引导滤波), 半径: {radius}, eps: {eps:.5f}, 引导图: {guide}, 下采样: {subsample}")
+        return np.clip(denoised_rgb, 0, 1)
+
     elif denoise_method == "gaussian":
         # 高斯模糊
         kernel_size = config.get("kernel_size", 5) # 模糊核大小，必须是奇数
@@ -53,7 +82,7 @@ def apply(rgb, config):
 
         # cv2.GaussianBlur 期望 BGR 顺序
         denoised_rgb_8bit = cv2.GaussianBlur(denoised_rgb_8bit, (kernel_size, kernel_size), sigma_x)
-        print(f"应用去噪 (高斯模糊), 核大小: {kernel_size}, SigmaX: {sigma_x}")
+        log.info(f"应用去噪 (高斯模糊), 核大小: {kernel_size}, SigmaX: {sigma_x}")
 
     elif denoise_method == "bilateral":
         # 双边滤波
@@ -66,7 +95,7 @@ def apply(rgb, config):
 
         # cv2.bilateralFilter 期望 BGR 顺序
         denoised_rgb_8bit = cv2.bilateralFilter(denoised_rgb_8bit, d, sigma_color, sigma_space)
-        print(f"应用去噪 (双边滤波), Diameter: {d}, SigmaColor: {sigma_color}, SigmaSpace: {sigma_space}")
+        log.info(f"应用去噪 (双边滤波), Diameter: {d}, SigmaColor: {sigma_color}, SigmaSpace: {sigma_space}")
 
     elif denoise_method == "median":
         # 中值滤波
@@ -77,7 +106,7 @@ def apply(rgb, config):
         
         # cv2.medianBlur 对多通道图像按通道独立处理
         denoised_rgb_8bit = cv2.medianBlur(denoised_rgb_8bit, kernel_size)
-        print(f"应用去噪 (中值滤波), 核大小: {kernel_size}")
+        log.info(f"应用去噪 (中值滤波), 核大小: {kernel_size}")
     
     elif denoise_method == "nl_means": # 添加非局部均值去噪
         # h: 决定滤波器强度的参数。较大的 h 值可以更好地去除噪声，但也会导致更多的细节丢失。
@@ -98,7 +127,7 @@ def apply(rgb, config):
             template_window_size, 
             search_window_size
         )
-        print(f"应用去噪 (非局部均值), h: {h_param}, h_color: {h_color_param}, template_ws: {template_window_size}, search_ws: {search_window_size}")
+        log.info(f"应用去噪 (非局部均值), h: {h_param}, h_color: {h_color_param}, template_ws: {template_window_size}, search_ws: {search_window_size}")
 
 
     else:
@@ -110,3 +139,86 @@ def apply(rgb, config):
     
     # 裁剪到 0-1 范围，防止转换误差
     return np.clip(denoised_rgb, 0, 1)
+
+
+def nl_means_16bit(rgb, h_param, h_color_param, template_ws, search_ws, chroma_scale=0.5, tile_size=0, threads=1):
+    """16 位非局部均值：亮度、色度分开处理，不经过 8 位量化
+
+    RGB → YCrCb（float）后，亮度 Y 量化到 uint16，全分辨率 NORM_L1 去噪；
+    色度 CrCb 按 chroma_scale 缩小后去噪再放大（色度噪声以低频为主）。
+    h 参数与 8 位路径含义相同（0-255 单位）。返回 float32 RGB。
+    """
+    h, w = rgb.shape[:2]
+    ycrcb = cv2.cvtColor(rgb, cv2.COLOR_RGB2YCrCb)
+    halo = search_ws // 2 + template_ws // 2
+    
+    def nlm(image, strength):
+        image16 = _to_uint16(image)
+        h16 = [strength * 257.0 * NORM_L1_H_SCALE]
+        denoised = map_tiles(
+            image16,
+            lambda tile: cv2.fastNlMeansDenoising(tile, h16, templateWindowSize=template_ws,
+                                                  searchWindowSize=search_ws, normType=cv2.NORM_L1),
+            tile_size, halo, threads)
+        return denoised.astype(np.float32) * np.float32(1.0 / 65535)
+    
+    luma = nlm(ycrcb[:, :, 0], h_param)
+    
+    chroma = ycrcb[:, :, 1:]
+    if chroma_scale < 1:
+        small_size = (max(1, round(w * chroma_scale)), max(1, round(h * chroma_scale)))
+        chroma = cv2.resize(chroma, small_size, interpolation=cv2.INTER_AREA)
+    chroma = nlm(chroma, h_color_param)
+    if chroma_scale < 1:
+        chroma = cv2.resize(chroma, (w, h), interpolation=cv2.INTER_LINEAR)
+    
+    return cv2.cvtColor(np.dstack([luma, chroma]), cv2.COLOR_YCrCb2RGB)
+
+def guided_filter(rgb, radius=4, eps=0.0036, guide="self", subsample=1):
+    """引导滤波（He et al.），每个像素的计算量与半径无关
+
+    guide:     "self" 每个通道用自身做引导图；"luma" 三个通道共用亮度引导图（边缘位置一致）
+    subsample: > 1 时在缩小 subsample 倍的图上计算线性系数再放大（Fast Guided Filter），用于预览
+    eps 为 0-1 线性值的方差单位，平坦区域方差远小于 eps 时趋于盒式平均，边缘处方差大则保持原值。
+    """
+    h, w = rgb.shape[:2]
+    rgb = np.asarray(rgb, dtype=np.float32)
+    if guide == "luma":
+        guide_full = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)[:, :, np.newaxis]
+    else:
+        guide_full = rgb
+    
+    image, guide_image = rgb, guide_full
+    if subsample > 1:
+        small_size = (max(1, round(w / subsample)), max(1, round(h / subsample)))
+        image = cv2.resize(rgb, small_size, interpolation=cv2.INTER_AREA)
+        guide_image = cv2.resize(guide_full, small_size, interpolation=cv2.INTER_AREA)
+        guide_image = guide_image.reshape(image.shape[:2] + (-1,))
+        radius = max(1, round(radius / subsample))
+    
+    ksize = (2 * radius + 1, 2 * radius + 1)
+    def box(x):
+        return cv2.boxFilter(x, -1, ksize, borderType=cv2.BORDER_REFLECT).reshape(x.shape)
+    
+    mean_i = box(guide_image)
+    var_i = box(guide_image * guide_image) - mean_i * mean_i
+    if guide == "luma":
+        mean_p = box(image)
+        cov_ip = box(guide_image * image) - mean_i * mean_p
+    else:
+        # 自引导：输入就是引导图，协方差即方差
+        mean_p, cov_ip = mean_i, var_i
+    
+    a = cov_ip / (var_i + np.float32(eps))
+    b = mean_p - a * mean_i
+    mean_a, mean_b = box(a), box(b)
+    
+    if subsample > 1:
+        mean_a = cv2.resize(mean_a, (w, h), interpolation=cv2.INTER_LINEAR).reshape(h, w, -1)
+        mean_b = cv2.resize(mean_b, (w, h), interpolation=cv2.INTER_LINEAR).reshape(h, w, -1)
+    return mean_a * guide_full + mean_b
+
+def _to_uint16(image):
+    """0-1 浮点 → uint16（一次带舍入和饱和的转换）"""
+    flat = np.ascontiguousarray(image, dtype=np.float32).reshape(image.shape[0], -1)
+    return cv2.multiply(flat, 65535.0, dtype=cv2.CV_16U).reshape(image.shape)
@@ -1,9 +1,13 @@
 import numpy as np
 
-def apply(raw, config):
+def apply(raw, config, out=None):
+    """低于 threshold 的值置零：不修改输入；out 非空时（float32、与输入同形状、不重叠）结果写入 out"""
     threshold = config.get("threshold", 8.0)
 
     # 保留 float 精度，但低于 threshold 的值直接 clip 到 0
-    raw_denoised = np.where(raw < threshold, 0, raw)
+    if out is None:
+        out = np.empty(raw.shape, dtype=np.float32)
+    np.copyto(out, raw)
+    out[raw < threshold] = 0
     
-    return raw_denoised.astype(np.float32)
+    return out
@@ -1,8 +1,24 @@
+import os
+import tempfile
+
 import numpy as np
+import cv2
 from scipy.ndimage import median_filter
 
-def apply(raw, config):
-    """坏点校正 - Bayer感知版本"""
+from utils.geometry import bayer_sites, bayer_masks
+
+def apply(raw, config, out=None, detected=None):
+    """坏点校正 - Bayer感知版本（不修改输入；out 非空时校正结果写入 out）
+
+    method:
+      median:       按通道全局统计检测暗坏点（默认）
+      neighborhood: 在每个 Bayer 子平面上做 3x3 同色邻域检测（亮/暗坏点），单次向量化处理
+      static:       只使用静态坏点表
+    defect_map:      静态坏点表路径（.npy 或每行 "y,x" 的 .txt/.csv），先按表修复已知坏点；
+                     static_defects 非空时直接使用（执行计划编译时已加载，不再每帧读文件）
+    detected:        非空列表时，把静态坏点表和 neighborhood 检测到的坏点合并后追加到其中
+                     （save_defect_map 标定由 ISPPipeline 在整批处理结束后合并写入一次）
+    """
     if not config.get('enable', False):
         return raw
     
@@ -10,40 +26,72 @@ def apply(raw, config):
     threshold = config.get('threshold', 3.0)
     bayer_pattern = config.get('bayer_pattern', 'rggb').lower()
     
+    # 已知坏点：直接按坐标修复，O(坏点数)，不需要统计
+    static_defects = config.get('static_defects')
+    if static_defects is None and config.get('defect_map'):
+        static_defects = load_defect_map(config['defect_map'])
+    if static_defects is not None:
+        # 之后的检测直接在这份副本上进行，不再复制
+        raw = out = copy_frame(raw, out)
+        fixed = fix_static_defects(raw, static_defects)
+        print(f"DPC: 静态坏点表修复 {fixed} 个坏点")
+    
     if method == 'median':
-        corrected = bayer_aware_dpc(raw, threshold, bayer_pattern)
+        corrected = bayer_aware_dpc(raw, threshold, bayer_pattern, out)
         return corrected
     
+    if method == 'neighborhood':
+        corrected, defects = neighborhood_dpc(raw, config.get('neighborhood_threshold', 64.0), bayer_pattern, out)
+        if detected is not None:
+            if static_defects is not None:
+                defects = np.unique(np.concatenate([static_defects, defects]), axis=0)
+            detected.append(defects)
+        return corrected
+    
+    if method == 'static' and static_defects is None:
+        print("DPC: static 模式未指定 defect_map，跳过处理")
+    
     return raw
 
-def bayer_aware_dpc(raw, threshold, pattern):
+def copy_frame(raw, out=None):
+    """返回 raw 的副本：out 非空时复制到 out 并返回 out（out 就是 raw 时不复制）"""
+    if out is None:
+        return raw.copy()
+    if out is not raw:
+        np.copyto(out, raw)
+    return out
+
+def bayer_aware_dpc(raw, threshold, pattern, out=None):
     """Bayer感知的坏点校正"""
-    h, w = raw.shape
-    corrected = raw.copy()
+    corrected = copy_frame(raw, out)
     
-    # 创建Bayer masks
-    r_mask, g_mask, b_mask = create_bayer_masks(h, w, pattern)
+    # 每种颜色用 Bayer 子平面的跨步视图处理，不再分配整帧布尔 mask
+    sites = bayer_sites(pattern)
     
     # 分别处理每个颜色通道
     bad_count = 0
     
     # 处理R通道
-    bad_count += fix_channel_bad_pixels(corrected, r_mask, threshold)
+    bad_count += fix_channel_bad_pixels(corrected, sites['r'], threshold)
     
     # 处理G通道  
-    bad_count += fix_channel_bad_pixels(corrected, g_mask, threshold)
+    bad_count += fix_channel_bad_pixels(corrected, sites['g'], threshold)
     
     # 处理B通道
-    bad_count += fix_channel_bad_pixels(corrected, b_mask, threshold)
+    bad_count += fix_channel_bad_pixels(corrected, sites['b'], threshold)
     
     print(f"DPC: 检测并修复 {bad_count} 个坏点 ({bad_count/raw.size*100:.3f}%)")
     
     return corrected
 
-def fix_channel_bad_pixels(raw, channel_mask, threshold):
-    """修复单个颜色通道的坏点 - 只处理暗坏点"""
+def fix_channel_bad_pixels(raw, channel_sites, threshold):
+    """修复单个颜色通道的坏点 - 只处理暗坏点
+
+    channel_sites: 该颜色在 2x2 Bayer 单元中的位置 [(dy, dx), ...]
+    """
+    planes = [raw[dy::2, dx::2] for dy, dx in channel_sites]
     # 提取该通道的像素
-    channel_pixels = raw[channel_mask]
+    channel_pixels = np.concatenate([plane.ravel() for plane in planes])
     
     # 计算统计量
     q25, q50 = np.percentile(channel_pixels, [25, 50])
@@ -52,34 +100,107 @@ def fix_channel_bad_pixels(raw, channel_mask, threshold):
     # 🔥 只检测异常暗的像素（暗坏点）
     # 不处理亮坏点，避免误伤高光
     dark_threshold = q25 - threshold * mad
-    bad_pixels = channel_pixels < dark_threshold
     
-    if np.any(bad_pixels):
-        # 用中值替换暗坏点
-        channel_pixels[bad_pixels] = q50
-        raw[channel_mask] = channel_pixels
+    bad_count = 0
+    for plane in planes:
+        # 用中值替换暗坏点（直接写回跨步视图）
+        bad_pixels = plane < dark_threshold
+        plane[bad_pixels] = q50
+        bad_count += np.count_nonzero(bad_pixels)
     
-    return np.sum(bad_pixels)
+    return bad_count
 
 def create_bayer_masks(h, w, pattern):
-    """创建Bayer模式mask"""
-    r_mask = np.zeros((h, w), dtype=bool)
-    g_mask = np.zeros((h, w), dtype=bool) 
-    b_mask = np.zeros((h, w), dtype=bool)
-    
-    if pattern == "rggb":
-        r_mask[0::2, 0::2] = True  # R
-        g_mask[0::2, 1::2] = True  # G
-        g_mask[1::2, 0::2] = True  # G
-        b_mask[1::2, 1::2] = True  # B
-    elif pattern == "bggr":
-        b_mask[0::2, 0::2] = True  # B
-        g_mask[0::2, 1::2] = True  # G
-        g_mask[1::2, 0::2] = True  # G
-        r_mask[1::2, 1::2] = True  # R
-    # 其他模式...
-    
-    return r_mask, g_mask, b_mask
+    """创建Bayer模式mask（按分辨率缓存，只读）"""
+    return bayer_masks(h, w, pattern)
+
+def neighborhood_dpc(raw, threshold, pattern, out=None):
+    """3x3 同色邻域坏点校正
+
+    在每个 Bayer 子平面（raw[dy::2, dx::2]，相邻元素即原图中距离 2 的同色像素）上：
+    比 8 邻域最大值还亮 threshold 以上，或比最小值还暗 threshold 以上的像素判为坏点，
+    用 3x3 中值替换。threshold 为原始数据单位（DN）。
+    out 非空时校正结果写入 out。返回 (校正结果, 坏点坐标 (N, 2) int32，每行 y, x)。
+    """
+    corrected = copy_frame(raw, out)
+    # 不含中心像素的 3x3 结构元素：dilate / erode 得到邻域最大 / 最小值
+    # （默认边界值不参与最大 / 最小值计算）
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    kernel[1, 1] = 0
+    
+    coords = []
+    for offsets in bayer_sites(pattern).values():
+        for dy, dx in offsets:
+            plane = corrected[dy::2, dx::2]
+            src = np.ascontiguousarray(plane, dtype=np.float32)
+            neighbor_max = cv2.dilate(src, kernel)
+            neighbor_min = cv2.erode(src, kernel)
+            bad_pixels = (src > neighbor_max + threshold) | (src < neighbor_min - threshold)
+            if np.any(bad_pixels):
+                plane[bad_pixels] = cv2.medianBlur(src, 3)[bad_pixels]
+                ys, xs = np.nonzero(bad_pixels)
+                coords.append(np.stack([ys * 2 + dy, xs * 2 + dx], axis=1))
+    
+    defects = np.concatenate(coords).astype(np.int32) if coords else np.empty((0, 2), dtype=np.int32)
+    print(f"DPC: 邻域检测修复 {len(defects)} 个坏点 ({len(defects)/raw.size*100:.3f}%)")
+    return corrected, defects
+
+def fix_static_defects(raw, defects):
+    """按坏点表原地修复，用 8 个同色邻居（距离 2）的中值替换，邻居中的坏点不参与计算"""
+    h, w = raw.shape
+    defects = np.asarray(defects, dtype=np.int64).reshape(-1, 2)
+    inside = (defects[:, 0] >= 0) & (defects[:, 0] < h) & (defects[:, 1] >= 0) & (defects[:, 1] < w)
+    if not np.all(inside):
+        print(f"DPC: 忽略坏点表中超出图像范围的 {np.count_nonzero(~inside)} 个坐标")
+        defects = defects[inside]
+    if len(defects) == 0:
+        return 0
+    
+    ys, xs = defects[:, :1], defects[:, 1:]
+    offsets = np.array([-2, 0, 2])
+    dy, dx = np.meshgrid(offsets, offsets, indexing='ij')
+    keep = (dy != 0) | (dx != 0)
+    ny, nx = ys + dy[keep], xs + dx[keep]
+    # 越界的邻居取另一侧的同色像素（镜像）
+    ny = np.where(ny < 0, ny + 4, np.where(ny >= h, ny - 4, ny))
+    nx = np.where(nx < 0, nx + 4, np.where(nx >= w, nx - 4, nx))
+    valid = (ny >= 0) & (ny < h) & (nx >= 0) & (nx < w)
+    ny, nx = np.clip(ny, 0, h - 1), np.clip(nx, 0, w - 1)
+    
+    neighbors = raw[ny, nx].astype(np.float32)
+    valid &= ~np.isin(ny * w + nx, defects[:, 0] * w + defects[:, 1])
+    neighbors[~valid] = np.nan
+    
+    has_neighbors = valid.any(axis=1)
+    replacement = np.nanmedian(neighbors[has_neighbors], axis=1)
+    raw[defects[has_neighbors, 0], defects[has_neighbors, 1]] = replacement
+    return int(np.count_nonzero(has_neighbors))
 
+def load_defect_map(path):
+    """读取坏点表：.npy 保存的 (N, 2) 数组，或每行 "y,x" 的文本文件（# 开头为注释）"""
+    if os.path.splitext(path)[1].lower() == '.npy':
+        defects = np.load(path)
+    else:
+        defects = np.loadtxt(path, delimiter=',', dtype=np.int64, ndmin=2)
+    return np.asarray(defects, dtype=np.int32).reshape(-1, 2)
 
+def save_defect_map(path, defects):
+    """保存坏点表，格式由扩展名决定（.npy 或文本）
 
+    先写同目录下的临时文件再 os.replace，读取方不会看到写了一半的坏点表
+    """
+    defects = np.asarray(defects, dtype=np.int32).reshape(-1, 2)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if os.path.splitext(path)[1].lower() == '.npy':
+                np.save(f, defects)
+            else:
+                np.savetxt(f, defects, fmt='%d', delimiter=',', header='y,x')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
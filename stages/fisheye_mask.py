@@ -1,14 +1,20 @@
 import numpy as np
 
-def apply(raw, config):
+from utils.geometry import fisheye_outside_mask, parse_point
+
+def apply(raw, config, out=None):
+    """鱼眼成像圆外置零：不修改输入；out 非空时（float32、与输入同形状、不重叠）结果写入 out"""
     h, w = raw.shape
-    cx, cy = config.get("center", [w//2, h//2])
+    cx, cy = parse_point(config.get("center", [w//2, h//2]))
     radius = config.get("radius", min(h, w) // 2 - 10)
 
-    Y, X = np.ogrid[:h, :w]
-    dist = np.sqrt((X - cx)**2 + (Y - cy)**2)
-    mask = dist <= radius
+    # 成像圆外的 mask 按分辨率缓存，批量处理时不再每帧重建距离场
+    outside = fisheye_outside_mask(h, w, cx, cy, radius)
 
-    raw_masked = raw.copy()
-    raw_masked[~mask] = 0
+    if out is None:
+        raw_masked = raw.copy()
+    else:
+        raw_masked = out
+        np.copyto(raw_masked, raw)
+    raw_masked[outside] = 0
     return raw_masked
@@ -9,45 +9,47 @@
 
 import numpy as np
 
-def apply(rgb, config):
+from utils import log
+from utils.lut import DEFAULT_LUT_SIZE, apply_lut, cached_lut
+
+def apply(rgb, config, out=None):
+    """Gamma 校正：不修改输入；out 非空时（float32、与输入同形状、不重叠）结果写入 out"""
     gamma_value = config.get("value", 2.2)
     curve_type = config.get("curve_type", "standard")
     
-    rgb = np.clip(rgb, 0, 1).astype(np.float32)
+    # 裁剪结果直接作为输出缓冲区，之后的查表 / 幂运算原地进行
+    rgb = np.clip(rgb, 0, 1, out=out, dtype=np.float32)
     
     if curve_type == "s_curve":
-        midtone_boost = config.get("midtone_boost", 0.08)
-        
-        # 分段gamma值
-        shadow_gamma = gamma_value * 0.9   # 暗部gamma更低
-        midtone_gamma = gamma_value * 0.95 # 中调gamma稍低
-        highlight_gamma = gamma_value      # 高光正常
-        
-        # 分段处理
-        shadow_mask = rgb < 0.3
-        midtone_mask = (rgb >= 0.3) & (rgb < 0.7)
-        highlight_mask = rgb >= 0.7
-        
-        corrected = np.copy(rgb)
-        
-        if np.any(shadow_mask):
-            corrected[shadow_mask] = np.power(rgb[shadow_mask], 1.0/shadow_gamma)
+        # 分段曲线是 [0, 1] 上的一维函数：默认编译成按参数缓存的 LUT，每个像素一次插值查表
+        lut_size = config.get("lut_size", DEFAULT_LUT_SIZE)
+        if lut_size:
+            corrected = apply_lut(rgb, cached_lut(s_curve, (float(gamma_value),), lut_size), out=rgb)
+        else:
+            corrected = s_curve(rgb, gamma_value)
         
-        if np.any(midtone_mask):
-            corrected[midtone_mask] = np.power(rgb[midtone_mask], 1.0/midtone_gamma)
-        
-        if np.any(highlight_mask):
-            corrected[highlight_mask] = np.power(rgb[highlight_mask], 1.0/highlight_gamma)
-        
-        print(f"Gamma: S曲线分段处理")
+        log.info(f"Gamma: S曲线分段处理")
     else:
         # 标准Gamma
         try:
             power_exponent = 1.0 / gamma_value
-            corrected = np.power(rgb, power_exponent)
+            corrected = np.power(rgb, power_exponent, out=rgb)
         except Exception as e:
             print(f"伽马校正错误: {e}")
             corrected = rgb
     
-    corrected = np.clip(corrected, 0, 1)
+    np.clip(corrected, 0, 1, out=corrected)
     return corrected # 返回 0-1 范围的浮点数图像 (非线性亮度)
+
+
+def s_curve(x, gamma_value):
+    """分段 gamma 曲线（x 在 [0, 1] 内）"""
+    # 分段gamma值
+    shadow_gamma = gamma_value * 0.9   # 暗部gamma更低
+    midtone_gamma = gamma_value * 0.95 # 中调gamma稍低
+    highlight_gamma = gamma_value      # 高光正常
+    
+    # 分段处理
+    return np.where(x < 0.3, np.power(x, 1.0/shadow_gamma),
+                    np.where(x < 0.7, np.power(x, 1.0/midtone_gamma),
+                             np.power(x, 1.0/highlight_gamma)))
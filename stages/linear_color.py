@@ -0,0 +1,147 @@
+# ---------------------
+# 线性颜色融合模块（Color Space × WB × CCM）
+# ✅ 色彩空间转换、白平衡增益、CCM 都是 3x3 线性变换，这里每帧把它们合成一个矩阵，
+#    分块（每块几万像素，中间结果留在 CPU 缓存中）一次完成，代替三次整帧遍历。
+#    CCM 的高光跳过和饱和度增强语义保持不变：在同一遍中按高光掩膜混合。
+#    由 pipeline 在 pipeline.fuse_linear_color 开启时自动替换相邻的 color_space / wb / ccm 节点。
+
+import numpy as np
+import cv2
+
+from stages import wb, color_space
+from utils import log, stats
+
+# 与 ccm / wb 中一致的亮度权重
+LUMA = np.array([0.299, 0.587, 0.114])
+
+# 每块像素数：64K 像素 x 3 通道 x float32 = 768KB，可以留在 L2 缓存中
+BLOCK_PIXELS = 1 << 16
+
+# 可融合的阶段（按必须的先后顺序）
+FUSABLE_STAGES = ("color_space", "wb", "ccm")
+
+def can_fuse_color_space(config):
+    """色彩空间转换能否作为线性矩阵融合
+
+    compress 色域映射是非线性的，不能融合；clip 只有在矩阵非负、每行和不超过 1 时
+    对 [0, 1] 输入（demosaic 归一化后的数据）不起作用，才能融合。
+    """
+    gamut_mapping = config.get("gamut_mapping", "clip")
+    if gamut_mapping == "compress":
+        return False
+    if gamut_mapping == "clip":
+        matrix = color_space.get_transform_matrix(config)
+        return matrix is None or (matrix.min() >= 0 and matrix.sum(axis=1).max() <= 1.0 + 1e-3)
+    return True
+
+def apply(rgb, config):
+    """config: {'color_space': cfg 或 None, 'wb': cfg 或 None, 'ccm': cfg 或 None}"""
+    rgb = np.ascontiguousarray(rgb, dtype=np.float32)
+    h, w, _ = rgb.shape
+    flat = rgb.reshape(-1, 1, 3)
+    stats.log("linear_color", rgb, "输入")
+
+    # CCM 之前的线性部分：色彩空间转换，再乘白平衡增益
+    pre_matrix = color_space_matrix(config)
+
+    wb_cfg = config.get("wb")
+    if wb_cfg:
+        gains = estimate_gains(flat, pre_matrix, wb_cfg)
+        if gains is not None:
+            log.info(f"线性颜色: WB增益 R={gains[0]:.2f}, G={gains[1]:.2f}, B={gains[2]:.2f}")
+            pre_matrix = np.diag(gains) @ pre_matrix
+        else:
+            log.info("线性颜色: WB增益估计失败，跳过白平衡")
+
+    ccm_cfg = config.get("ccm")
+    out = np.empty_like(rgb)
+    out_flat = out.reshape(-1, 1, 3)
+
+    if not ccm_cfg:
+        for start in range(0, flat.shape[0], BLOCK_PIXELS):
+            end = start + BLOCK_PIXELS
+            cv2.transform(flat[start:end], pre_matrix.astype(np.float32), dst=out_flat[start:end])
+        stats.log("linear_color", out, "输出")
+        return out
+
+    # CCM 输入 = pre_matrix @ x，因此 CCM 的亮度判断和矩阵都可以直接作用在原始输入上
+    fused_matrix = (np.array(ccm_cfg["matrix"], dtype=np.float64) @ pre_matrix).astype(np.float32)
+    pre_matrix32 = pre_matrix.astype(np.float32)
+    luma_row = (LUMA @ pre_matrix).reshape(1, 3).astype(np.float32)
+    highlight_threshold = ccm_cfg.get("highlight_threshold", 0.8)
+
+    # 饱和度增强：gray + (c - gray) * s 也是线性变换 s*I + (1-s) * 1 * LUMA^T
+    saturation_boost = ccm_cfg.get("saturation_boost", 1.0)
+    saturation_matrix = None
+    if saturation_boost != 1.0:
+        saturation_matrix = (saturation_boost * np.eye(3)
+                             + (1.0 - saturation_boost) * np.outer(np.ones(3), LUMA)).astype(np.float32)
+
+    highlight_count = 0
+    for start in range(0, flat.shape[0], BLOCK_PIXELS):
+        end = start + BLOCK_PIXELS
+        block = flat[start:end]
+        corrected = out_flat[start:end]
+
+        cv2.transform(block, fused_matrix, dst=corrected)
+        np.maximum(corrected, 0.0, out=corrected)
+        if saturation_matrix is not None:
+            cv2.transform(corrected, saturation_matrix, dst=corrected)
+            np.maximum(corrected, 0.0, out=corrected)
+
+        # 高光区域跳过 CCM 和饱和度增强，只保留白平衡（及色彩空间转换）的结果
+        highlight_mask = cv2.transform(block, luma_row).ravel() > highlight_threshold
+        if highlight_mask.any():
+            corrected[highlight_mask] = cv2.transform(block[highlight_mask], pre_matrix32)
+            highlight_count += int(np.count_nonzero(highlight_mask))
+
+    log.info(f"线性颜色: 跳过高光像素 {highlight_count} 个")
+    stats.log("linear_color", out, "输出")
+    return out
+
+def color_space_matrix(config):
+    """色彩空间转换矩阵（未启用时为单位矩阵）"""
+    cs_cfg = config.get("color_space")
+    matrix = color_space.get_transform_matrix(cs_cfg) if cs_cfg else None
+    return np.eye(3) if matrix is None else matrix
+
+def compute_gains(rgb, config):
+    """按融合配置估计白平衡增益（与 apply 中的估计相同），估计失败时返回 None"""
+    flat = np.ascontiguousarray(rgb, dtype=np.float32).reshape(-1, 1, 3)
+    return estimate_gains(flat, color_space_matrix(config), config["wb"])
+
+def estimate_gains(flat, pre_matrix, wb_config):
+    """估计白平衡增益，统计量等价于在 pre_matrix 变换后的图像上计算
+
+    gray_world 利用线性性质：变换后的通道均值 = pre_matrix @ 原始通道均值，
+    只需一次只读的分块统计，不生成变换后的整帧图像。
+    """
+    method = wb_config.get("method", "manual")
+    identity = np.allclose(pre_matrix, np.eye(3))
+
+    if method == "gray_world":
+        min_threshold = wb_config.get("wb_min_luminance_threshold", 0.05)
+        max_threshold = wb_config.get("wb_max_luminance_threshold", 0.99)
+        luma_row = (LUMA @ pre_matrix).reshape(1, 3).astype(np.float32)
+
+        sums = np.zeros(3)
+        count = 0
+        for start in range(0, flat.shape[0], BLOCK_PIXELS):
+            block = flat[start:start + BLOCK_PIXELS]
+            luminance = cv2.transform(block, luma_row).ravel()
+            valid_mask = ((luminance > min_threshold) & (luminance < max_threshold)).astype(np.float32)
+            sums += valid_mask @ block.reshape(-1, 3)
+            count += int(valid_mask.sum())
+
+        if count <= 100:  # 确保有足够的有效像素
+            return None
+        log.info(f"WB: 有效像素数量: {count}")
+        r_mean, g_mean, b_mean = pre_matrix @ (sums / count)
+        return wb.gray_world_gains(r_mean, g_mean, b_mean, wb_config)
+
+    if method == "white_patch" and not identity:
+        # 分位数不满足线性关系，需要在变换后的图像上统计
+        transformed = cv2.transform(flat, pre_matrix.astype(np.float32))
+        return wb.compute_gains(transformed.reshape(-1, 1, 3), wb_config)
+
+    return wb.compute_gains(flat, wb_config)
@@ -1,51 +1,124 @@
-
-
 # stages/lsc.py
+# 增益图只取决于 (h, w, 模型, 像素尺寸, 焦距, 强度)，按这些参数缓存（不含增益上限）：
+#   - 进程内 LRU 缓存，批量处理同一分辨率时每个文件只做一次乘法
+#   - cache_dir 非空时同时缓存到磁盘（.npy），多次运行 / 多进程 worker 共享
+#   - grid_step > 1 时在粗网格上计算增益图再双线性上采样（增益图很平滑，误差很小）
+#   随帧亮度变化的增益上限不进入缓存键，每帧在缓存的增益图上单独施加（np.minimum）
+import functools
+import hashlib
+import os
+
 import numpy as np
+import cv2
 from scipy.ndimage import gaussian_filter
 
-def apply(raw, config):
-    print(f"LSC输入: dtype={raw.dtype}, min={raw.min()}, max={raw.max()}")
-    
+from utils import stats
+
+# 默认硬限制的最大增益
+MAX_GAIN = 1.5
+
+def apply(raw, config, out=None):
+    """镜头阴影校正：不修改输入；out 非空时（float32、与输入同形状、不重叠）结果写入 out"""
+    stats.log("lsc", raw, "输入")
+
     # 获取位深配置
     bit_depth_cfg = config.get('bit_depth_management', {})
     processing_bits = bit_depth_cfg.get('raw_processing', 16)
     max_value = (2**processing_bits) - 1
-    
+
+    # 限制最大增益，避免过度放大
+    raw_max = raw.max()
+    max_allowed_gain = max_value / raw_max if raw_max > 0 else MAX_GAIN
+    max_allowed_gain = min(max_allowed_gain, MAX_GAIN)  # 硬限制1.5x
+
     h, w = raw.shape
-    model_type = config.get("model_type", "cosine_fourth")
-    strength = config.get("strength", 0.3)
-    
-    # 在16bit精度下处理，避免截断误差
-    y, x = np.indices((h, w), dtype=np.float32)
+    gain_map = get_gain_map(config, h, w)
+
+    # 增益上限经过强度控制后的值：1 + (min(g, 上限) - 1) * 强度 = min(1 + (g - 1) * 强度, 该值)（强度 >= 0）
+    strength = float(config.get("strength", 0.3))
+    gain_cap = np.float32(1.0 + (max_allowed_gain - 1.0) * strength)
+
+    # 应用LSC校正，并确保不超出16bit范围（限制后的增益图直接写在输出缓冲区中，再原地相乘）
+    gains = np.minimum(gain_map, gain_cap, out=out)
+    corrected = np.multiply(raw, gains, out=gains, dtype=np.float32)
+    np.clip(corrected, 0, max_value, out=corrected)
+
+    stats.log("lsc", corrected, "输出")
+    return corrected.astype(np.float32, copy=False)
+
+def get_gain_map(config, h, w):
+    """返回 (h, w) float32 只读增益图（已包含强度控制，不含每帧的增益上限），按参数缓存"""
+    return _cached_gain_map(
+        h, w,
+        config.get("model_type", "cosine_fourth"),
+        float(config.get("pixel_size_um", 1.4)),
+        float(config.get("focal_length_mm", 4.0)),
+        float(config.get("strength", 0.3)),
+        int(config.get("grid_step", 0)),
+        config.get("cache_dir") or "",
+    )
+
+@functools.lru_cache(maxsize=8)
+def _cached_gain_map(h, w, model_type, pixel_size, focal_length, strength, grid_step, cache_dir):
+    key = (h, w, model_type, pixel_size, focal_length, strength, grid_step)
+    path = None
+    if cache_dir:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"lsc_{h}x{w}_{digest}.npy")
+        if os.path.exists(path):
+            gain_map = np.load(path)
+            print(f"LSC: 从磁盘缓存加载增益图 {path}")
+            gain_map.flags.writeable = False
+            return gain_map
+
+    gain_map = compute_gain_map(h, w, model_type, pixel_size, focal_length, strength, grid_step)
+
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 先写临时文件再改名，避免多个 worker 同时写入时读到不完整的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, gain_map)
+        os.replace(tmp_path, path)
+
+    gain_map.flags.writeable = False
+    return gain_map
+
+def compute_gain_map(h, w, model_type="cosine_fourth", pixel_size=1.4, focal_length=4.0,
+                     strength=0.3, grid_step=0):
+    """计算 LSC 增益图（不经过缓存，不含增益上限）"""
     center_y, center_x = h / 2.0, w / 2.0
-    
-    pixel_size = config.get("pixel_size_um", 1.4)
-    focal_length = config.get("focal_length_mm", 4.0)
-    
+
+    if grid_step > 1:
+        # 粗网格每隔 grid_step 个像素采样一次，最后一个采样点覆盖到图像边界之外，
+        # 上采样时每个像素都在采样点之间插值（没有边界外推）
+        ys = np.arange(-(-(h - 1) // grid_step) + 1, dtype=np.float32) * grid_step
+        xs = np.arange(-(-(w - 1) // grid_step) + 1, dtype=np.float32) * grid_step
+        y, x = np.meshgrid(ys, xs, indexing="ij")
+    else:
+        # 在16bit精度下处理，避免截断误差
+        y, x = np.indices((h, w), dtype=np.float32)
+
     dx = (x - center_x) * pixel_size / 1000.0
     dy = (y - center_y) * pixel_size / 1000.0
     r_mm = np.sqrt(dx**2 + dy**2)
     theta = np.arctan(r_mm / focal_length)
-    
+
     if model_type == "cosine_fourth":
         gain_map = 1.0 / (np.cos(theta) ** 4)
     else:
-        gain_map = np.ones((h, w), dtype=np.float32)
-    
-    # 限制最大增益，避免过度放大
-    max_allowed_gain = max_value / raw.max() if raw.max() > 0 else 1.5
-    max_allowed_gain = min(max_allowed_gain, 1.5)  # 硬限制1.5x
-    gain_map = np.clip(gain_map, 1.0, max_allowed_gain)
-    
+        gain_map = np.ones(y.shape, dtype=np.float32)
+
+    if grid_step > 1:
+        # 对齐角点的双线性上采样：输出像素 (x, y) 取粗网格 (x / grid_step, y / grid_step)。
+        # 插值的是平滑的 cos^4 曲线，每帧的增益上限在上采样之后施加，限制处的拐点保持锐利
+        scale = np.float32([[1.0 / grid_step, 0, 0], [0, 1.0 / grid_step, 0]])
+        gain_map = cv2.warpAffine(gain_map.astype(np.float32), scale, (w, h),
+                                  flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                  borderMode=cv2.BORDER_REPLICATE)
+
+    gain_map = np.maximum(gain_map, 1.0)
+
     # 应用强度控制
     gain_map = 1.0 + (gain_map - 1.0) * strength
-    
-    # 应用LSC校正
-    corrected = raw * gain_map
-    
-    # 确保不超出16bit范围
-    corrected = np.clip(corrected, 0, max_value)
-    
-    print(f"LSC: 16bit处理完成，输出范围 [{corrected.min():.1f}, {corrected.max():.1f}]")
-    return corrected.astype(np.float32)
+    return gain_map.astype(np.float32)
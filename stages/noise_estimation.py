@@ -3,8 +3,11 @@ from scipy import ndimage
 
 def estimate_noise_level(raw, config):
     """估计图像噪声水平，用于后续自适应处理"""
+    # uint16 存储时统一转为 float32 计算（ndimage.sobel 按输入类型输出，uint16 会溢出）
+    raw = np.asarray(raw, dtype=np.float32)
+    
     # 使用Laplacian算子估计噪声
-    laplacian = ndimage.laplace(raw.astype(np.float32))
+    laplacian = ndimage.laplace(raw)
     noise_variance = np.var(laplacian) / 6.0  # 理论系数
     
     # 基于暗区域的噪声估计
@@ -29,19 +32,90 @@ def estimate_noise_level(raw, config):
     
     return np.sqrt(noise_variance)
 
-def apply(raw, config):
-    """自适应噪声估计"""
-    noise_level = estimate_noise_level(raw, config)
+def estimate_noise_fast(raw, sample_rows=64, groups=8):
+    """快速噪声估计：只读取均匀跨步抽取的行，返回 (噪声标准差, 置信度, 抽样行最大值)
+
+    在 4 个同色子平面的抽样行上计算水平二阶差分 p[x-1] - 2p[x] + p[x+1]（消除线性渐变，
+    纯噪声时方差为 6σ²），用 MAD 稳健估计 σ（边缘、纹理是少数离群值，对中位数影响小）。
+    抽样行分成 groups 组，每组每个子平面各得一个估计：
+      σ 取所有估计的中位数；置信度由每个子平面内各组估计的相对离散程度（IQR / 中位数）
+      和有效样本数决定，纹理多或样本少时置信度低。
+    饱和与黑电平处截断的像素（差分被压成 0）不参与估计。
+    """
+    h, w = raw.shape
+    plane_h = h // 2
+    step = max(1, plane_h // sample_rows)
+    rows = np.arange(0, plane_h, step)[:sample_rows]
+    groups = max(1, min(groups, len(rows)))
+    rows = rows[:len(rows) - len(rows) % groups]
+    if len(rows) == 0 or w < 6:
+        return 0.0, 0.0, 0.0
     
-    # 将噪声水平存储到config中供后续模块使用
-    config['estimated_noise_level'] = noise_level
+    # 只复制抽样行（2 * rows + dy），其余数据不读取
+    sampled = [np.asarray(raw[2 * rows + dy], dtype=np.float32) for dy in (0, 1)]
+    signal_max = max(float(block.max()) for block in sampled)
+    clip_high = 0.98 * signal_max
     
-    # 根据噪声水平调整后续模块参数
-    if noise_level > 0.05:  # 高噪声
-        config.setdefault('denoise', {})['enable'] = True
-        config['denoise']['h_param'] = min(15, max(8, int(noise_level * 200)))
-    elif noise_level > 0.02:  # 中等噪声
-        config.setdefault('denoise', {})['h_param'] = min(10, max(5, int(noise_level * 150)))
+    estimates = []
+    valid_count = 0
+    for block in sampled:
+        for dx in (0, 1):
+            plane = block[:, dx::2]
+            center = plane[:, 1:-1]
+            diff = plane[:, :-2] - 2 * center + plane[:, 2:]
+            valid = (center > 0) & (center < clip_high)
+            valid_count += int(np.count_nonzero(valid))
+            diff = np.where(valid, diff, np.nan).reshape(groups, -1)
+            median = np.nanmedian(diff, axis=1, keepdims=True)
+            mad = np.nanmedian(np.abs(diff - median), axis=1)
+            estimates.append(1.4826 * mad / np.sqrt(6.0))
     
-    print(f"估计噪声水平: {noise_level:.4f}")
+    # (4 个子平面, groups)：各子平面的信号水平不同，散粒噪声也不同，离散程度按子平面分别计算
+    estimates = np.stack(estimates)
+    if not np.any(np.isfinite(estimates)):
+        return 0.0, 0.0, signal_max
+    sigma = float(np.nanmedian(estimates))
+    q25, q50, q75 = np.nanpercentile(estimates, [25, 50, 75], axis=1)
+    spread = np.nanmean(np.where(q50 > 0, (q75 - q25) / np.where(q50 > 0, q50, 1), 1.0))
+    confidence = float(np.clip(1.0 - spread, 0, 1) * min(1.0, valid_count / 20000))
+    return sigma, confidence, signal_max
+
+def apply(raw, config):
+    """自适应噪声估计（只估计并打印，不修改数据和配置）
+
+    执行计划中由 stages/registry.py 调用 estimate / denoise_params，
+    结果写入当前帧的 context，供后续模块自适应调整。
+    """
+    estimate(raw, config)
     return raw
+
+def estimate(raw, config):
+    """估计噪声水平，返回 (噪声标准差（原始数据单位）, 置信度, 信号最大值)
+
+    noise_estimation.method:
+      laplacian: 整帧 Laplacian / Sobel / 暗区统计（默认，多次整帧遍历）
+      fast:      跨步抽样同色子平面的稳健估计（只读取 sample_rows 行），并给出置信度
+    置信度不低于 min_confidence 时才用于调整后续模块参数。
+    """
+    ne_cfg = config.get('noise_estimation', {})
+    if ne_cfg.get('method', 'laplacian') == 'fast':
+        noise_level, confidence, signal_max = estimate_noise_fast(raw, ne_cfg.get('sample_rows', 64))
+    else:
+        noise_level = estimate_noise_level(raw, config)
+        confidence, signal_max = 1.0, float(raw.max())
+    
+    print(f"估计噪声水平: {noise_level:.4f}, 置信度: {confidence:.2f}")
+    if confidence < ne_cfg.get('min_confidence', 0.5):
+        print("→ 噪声估计置信度低，不调整后续模块参数")
+    return noise_level, confidence, signal_max
+
+def denoise_params(noise_level, signal_max):
+    """根据噪声水平（相对满量程）得到本帧 denoise 的参数覆盖项：高噪声时启用 denoise 并加大 h"""
+    relative_level = noise_level / signal_max if signal_max > 0 else 0.0
+    params = {'estimated_noise_level': relative_level}
+    if relative_level > 0.05:  # 高噪声
+        params['enable'] = True
+        params['h_param'] = min(15, max(8, int(relative_level * 200)))
+    elif relative_level > 0.02:  # 中等噪声
+        params['h_param'] = min(10, max(5, int(relative_level * 150)))
+    return params
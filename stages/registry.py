@@ -0,0 +1,293 @@
+# stages/registry.py
+# ---------------------
+# ISP 阶段注册表
+# ✅ 每个阶段声明：配置段、输入/输出数据域（Bayer/RGB）、输出存储精度、
+#    分块执行需要的 halo、是否可分块、是否接受输出缓冲区（out）、调试图文件名。
+#    pipeline 根据 config.yaml 把注册表编译成执行计划（ExecutionPlan），
+#    不再手写 if 链，新增阶段只需在这里注册一次。
+
+import numpy as np
+
+from stages import fisheye_mask, denoise_clip, blc, lsc, wb, ccm, demosaic, \
+    denoise, chroma_denoise, sharpen, gamma, tonemapping, super_resolution, \
+    noise_estimation, color_space, dpc, linear_color, color_lut, bayer_denoise, \
+    exposure_compensation
+
+BAYER = "bayer"
+RGB = "rgb"
+
+class StageSpec:
+    """单个阶段的声明
+
+    name:          阶段名（也是 pipeline.stages 中使用的名字）
+    apply:         stages/*.apply 函数，签名 apply(data, stage_cfg)；accepts_out 时为 apply(data, stage_cfg, out=None)
+    config_key:    config.yaml 中的配置段，默认与 name 相同
+    input_domain / output_domain: BAYER 或 RGB
+    storage:       输出的存储精度，bit_depth_management 中的键（见 utils/precision.py）：
+                   默认 Bayer 输出为 raw_processing，RGB 输出为 linear_hdr；显示域阶段为 display_ready
+    halo:          分块执行需要的单侧 halo 像素数，可以是 int 或 halo(stage_cfg) -> int
+    tileable:      是否可以按 tile 独立执行（依赖整帧统计量的阶段需要分析预处理配合），
+                   可以是 bool 或 tileable(stage_cfg) -> bool
+    accepts_out:   apply 遵守 out 约定（见 utils/arena.py）：输出与输入同形状，不修改输入，
+                   out 非空时结果写入 out；执行计划从缓冲区池取 out，不再为该阶段分配整帧数组
+    required:      必须启用的阶段
+    enabled_by:    其他阶段的配置段，这些阶段启用时即使本阶段未启用也编译该节点（它们可能在运行时启用本阶段，
+                   例如噪声估计在高噪声时启用 denoise），执行时按本帧的 enable 决定是否跳过
+                   （context['stage_overrides'][name] 中的覆盖项优先，见 pipeline.PlanNode）
+    debug_name:    调试图文件名（不含扩展名）
+    report:        非空时执行后打印输出范围，值为日志中显示的名字
+    build_config:  build_config(config) -> stage_cfg，编译计划时调用一次
+    run:           run(data, stage_cfg, context) -> data，默认直接调用 apply；
+                   context 为每个文件的运行时状态（文件路径、整帧统计量等）；
+                   accepts_out 的阶段执行计划会传入关键字参数 out
+    """
+
+    def __init__(self, name, apply, input_domain=RGB, output_domain=None, config_key=None,
+                 storage=None, halo=0, tileable=True, accepts_out=False, required=False, enabled_by=(),
+                 debug_name=None,
+                 report=None, build_config=None, run=None):
+        self.name = name
+        self.apply = apply
+        self.config_key = config_key or name
+        self.input_domain = input_domain
+        self.output_domain = output_domain or input_domain
+        self.storage = storage or ("raw_processing" if self.output_domain == BAYER else "linear_hdr")
+        self.halo = halo
+        self.tileable = tileable
+        self.accepts_out = accepts_out
+        self.required = required
+        self.enabled_by = tuple(enabled_by)
+        self.debug_name = debug_name or name
+        self.report = report
+        self.build_config = build_config or (lambda config: config.get(self.config_key, {}))
+        self.run = run or self._apply
+
+    def _apply(self, data, stage_cfg, context, out=None):
+        if out is None:
+            return self.apply(data, stage_cfg)
+        return self.apply(data, stage_cfg, out=out)
+
+    def enabled(self, config):
+        return self.required or config.get(self.config_key, {}).get('enable', False)
+
+    def compiled(self, config):
+        """编译计划时是否包含该节点：已启用，或 enabled_by 中的阶段启用（运行时可能启用本阶段）"""
+        return self.enabled(config) or any(config.get(key, {}).get('enable', False) for key in self.enabled_by)
+
+    def get_halo(self, stage_cfg):
+        return self.halo(stage_cfg) if callable(self.halo) else self.halo
+
+    def is_tileable(self, stage_cfg):
+        return self.tileable(stage_cfg) if callable(self.tileable) else self.tileable
+
+    def __repr__(self):
+        return f"StageSpec({self.name}: {self.input_domain}→{self.output_domain})"
+
+# 按默认执行顺序排列
+STAGES = {}
+
+def register(spec):
+    """注册阶段（同名覆盖），未在 pipeline.stages 指定顺序时按注册顺序执行"""
+    STAGES[spec.name] = spec
+    return spec
+
+def get_stage(name):
+    if name not in STAGES:
+        raise KeyError(f"未注册的 ISP 阶段 '{name}'，可用: {list(STAGES)}")
+    return STAGES[name]
+
+# --- 各阶段的配置构建与运行时适配 ---
+
+def _with_bit_depth(config_key, **extra):
+    """复制阶段配置并合并位深管理等全局参数"""
+    def build(config):
+        stage_cfg = config[config_key].copy()
+        stage_cfg['bit_depth_management'] = config.get('bit_depth_management', {})
+        for key, fn in extra.items():
+            stage_cfg[key] = fn(config)
+        return stage_cfg
+    return build
+
+def _build_dpc_config(config):
+    dpc_cfg = config.get('dpc', {}).copy()
+    dpc_cfg['bayer_pattern'] = config['demosaic'].get('bayer_pattern', 'rggb')
+    # 静态坏点表只在编译计划时读取一次，所有帧共用（只读）
+    if dpc_cfg.get('enable', False) and dpc_cfg.get('defect_map'):
+        static_defects = dpc.load_defect_map(dpc_cfg['defect_map'])
+        static_defects.flags.writeable = False
+        dpc_cfg['static_defects'] = static_defects
+    return dpc_cfg
+
+def _run_dpc(raw, dpc_cfg, context, out=None):
+    # neighborhood 检测到的坏点记录在当前帧的 context['dpc_defects'] 中，
+    # 由 ISPPipeline 在整批处理结束后合并，只写一次 save_defect_map（多进程时由主进程写）
+    detected = context.setdefault('dpc_defects', []) if dpc_cfg.get('save_defect_map') else None
+    return dpc.apply(raw, dpc_cfg, out=out, detected=detected)
+
+def _run_exposure_compensation(raw, ec_cfg, context):
+    # 序列模式（context['3a']）下增益只在重新估计的帧上统计，其余帧沿用平滑后的增益
+    state = context.get('3a')
+    measure = lambda: exposure_compensation.compute_gain(raw, ec_cfg)
+    gain = state.value('exposure_gain', measure) if state is not None else measure()
+    return exposure_compensation.apply_gain(raw, gain, ec_cfg)
+
+def _run_noise_estimation(raw, config, context):
+    # 噪声估计的结果只写入当前帧的 context（不修改共享的配置）：
+    # estimated_noise_level 驱动 Bayer 域去噪，stage_overrides['denoise'] 调整（高噪声时启用）denoise
+    def measure():
+        noise_level, confidence, signal_max = noise_estimation.estimate(raw, config)
+        # 置信度足够时才驱动后续模块
+        if confidence >= config.get('noise_estimation', {}).get('min_confidence', 0.5):
+            return noise_level, signal_max
+        return None
+
+    state = context.get('3a')
+    estimate = state.value('noise_level', measure) if state is not None else measure()
+    if estimate is not None:
+        noise_level, signal_max = estimate
+        context['estimated_noise_level'] = noise_level
+        context.setdefault('stage_overrides', {})['denoise'] = noise_estimation.denoise_params(noise_level, signal_max)
+    print(f"→ 噪声估计完成")
+    return raw
+
+def _run_bayer_denoise(raw, bayer_cfg, context):
+    # 启用噪声估计时由估计的噪声水平驱动（配置中的 sigma 为 0 时）
+    noise_level = context.get('estimated_noise_level')
+    if noise_level is not None and not bayer_cfg.get('sigma'):
+        bayer_cfg = dict(bayer_cfg, sigma=noise_level)
+    return bayer_denoise.apply(raw, bayer_cfg)
+
+def _run_demosaic(raw, demosaic_cfg, context):
+    if demosaic_cfg.get('method') == 'rawpy' or demosaic_cfg.get('method') == 'auto':
+        demosaic_cfg = dict(demosaic_cfg, raw_file_path=context.get('raw_file_path'))
+    frame_stats = context.get('frame_stats')
+    if frame_stats:
+        # 分块执行：使用整帧归一化参数，保证各 tile 一致
+        demosaic_cfg = dict(demosaic_cfg, raw_max=frame_stats['raw_max'],
+                            normalize_max=frame_stats['raw_max'])
+    return demosaic.apply(raw, demosaic_cfg)
+
+def _run_wb(rgb, wb_cfg, context, out=None):
+    frame_stats = context.get('frame_stats')
+    state = context.get('3a')
+    if frame_stats:
+        # 分块执行：整帧增益（序列模式下已经过时域平滑）在分析预处理中确定
+        gains = frame_stats['wb_gains']
+    elif state is not None:
+        # 序列模式：只在重新估计的帧上统计增益，其余帧沿用平滑后的增益
+        gains = state.value('wb_gains', lambda: wb.compute_gains(rgb, wb_cfg))
+    else:
+        return wb.apply(rgb, wb_cfg, out=out)
+    if gains is None:
+        return rgb
+    # 整帧增益固定为手动增益，各 tile / 各帧不再各自估计
+    wb_cfg = dict(wb_cfg, method='manual', gains=[float(g) for g in gains])
+    return wb.apply(rgb, wb_cfg, out=out)
+
+def _run_linear_color(rgb, fused_cfg, context):
+    frame_stats = context.get('frame_stats')
+    state = context.get('3a')
+    if fused_cfg.get('wb') and (frame_stats or state is not None):
+        if frame_stats:
+            gains = frame_stats['wb_gains']
+        else:
+            gains = state.value('wb_gains', lambda: linear_color.compute_gains(rgb, fused_cfg))
+        if gains is None:
+            fused_cfg = dict(fused_cfg, wb=None)
+        else:
+            wb_cfg = dict(fused_cfg['wb'], method='manual', gains=[float(g) for g in gains])
+            fused_cfg = dict(fused_cfg, wb=wb_cfg)
+    return linear_color.apply(rgb, fused_cfg)
+
+def _build_color_lut_config(config):
+    # 独立阶段：套用外部 .cube（烘焙节点的配置由 pipeline.bake_color_lut 在编译计划时生成）
+    lut_cfg = config.get('color_lut', {})
+    if not lut_cfg.get('cube_file'):
+        raise ValueError("color_lut.enable 为 true 时必须指定 cube_file")
+    return dict(color_lut.load_cube(lut_cfg['cube_file']),
+                interpolation=lut_cfg.get('interpolation', 'trilinear'))
+
+def _demosaic_halo(demosaic_cfg):
+    # OpenCV VNG 在行尾约 7 个像素内的处理与内部不同，halo 取 8（整帧执行的方法不使用 halo）
+    return 8
+
+def _demosaic_tileable(demosaic_cfg):
+    # 依赖整帧的方法（频域滤波等）由执行计划整帧执行，之后的节点再按 tile 执行
+    return demosaic_cfg.get("method") not in demosaic.WHOLE_FRAME_METHODS
+
+def _bayer_denoise_halo(bayer_cfg):
+    # 子平面上两次盒式滤波，换算回原分辨率
+    return 4 * bayer_cfg.get("radius", 2) + 2
+
+def _denoise_halo(denoise_cfg):
+    method = denoise_cfg.get("method", "nl_means")
+    if method == "nl_means":
+        # 搜索窗口 + 模板窗口的一半（取自适应参数中的最大值）
+        halo = denoise_cfg.get("search_window_size", 21) // 2 + denoise_cfg.get("template_window_size", 7) // 2
+        chroma_scale = denoise_cfg.get("chroma_scale", 0.5)
+        if denoise_cfg.get("bit_depth", 8) == 16 and chroma_scale < 1:
+            # 16 位路径的色度在缩小后的图上去噪，换算回原分辨率并加上缩放插值的范围
+            halo = int(np.ceil(halo / chroma_scale)) + 2
+        return halo
+    if method == "bilateral":
+        return denoise_cfg.get("diameter", 9) // 2
+    if method == "guided":
+        # 两次盒式滤波，再加上下采样时半径取整和缩放插值的范围
+        return 2 * denoise_cfg.get("radius", 4) + 3 * denoise_cfg.get("subsample", 1)
+    return denoise_cfg.get("kernel_size", 5) // 2 + 1
+
+def _sharpen_halo(sharpen_cfg):
+    return sharpen_cfg.get("blur_kernel_size", 5) // 2 + 1
+
+# --- 内置阶段（默认执行顺序） ---
+
+# Bayer 域：坏点校正在 BLC 之前处理，噪声估计为后续自适应处理提供信息
+register(StageSpec('dpc', dpc.apply, BAYER, accepts_out=True, debug_name='step0_dpc', tileable=False,
+                   build_config=_build_dpc_config, run=_run_dpc))
+register(StageSpec('fisheye_mask', fisheye_mask.apply, BAYER, accepts_out=True, debug_name='step1_fisheye_mask',
+                   tileable=False))
+register(StageSpec('blc', blc.apply, BAYER, accepts_out=True, debug_name='step2_blc',
+                   build_config=_with_bit_depth(
+                       'blc', sensor_bit_depth=lambda config: config['raw'].get('sensor_bit_depth', 10))))
+register(StageSpec('denoise_clip', denoise_clip.apply, BAYER, accepts_out=True, debug_name='step3_denoise_clip'))
+register(StageSpec('lsc', lsc.apply, BAYER, accepts_out=True, debug_name='step4_lsc', tileable=False,
+                   build_config=_with_bit_depth(
+                       'lsc', sensor_bit_depth=lambda config: config['raw'].get('sensor_bit_depth', 10))))
+register(StageSpec('exposure_compensation', exposure_compensation.apply, BAYER, debug_name='step4_exposure_compensation',
+                   tileable=False, build_config=_with_bit_depth('exposure_compensation'),
+                   run=_run_exposure_compensation))
+register(StageSpec('noise_estimation', noise_estimation.apply, BAYER, debug_name='step5_noise_estimation',
+                   tileable=False, build_config=lambda config: config, run=_run_noise_estimation))
+register(StageSpec('bayer_denoise', bayer_denoise.apply, BAYER, debug_name='step5_bayer_denoise',
+                   halo=_bayer_denoise_halo, run=_run_bayer_denoise))
+
+# Bayer → RGB
+register(StageSpec('demosaic', demosaic.apply, BAYER, RGB, debug_name='step6_demosaic', required=True,
+                   halo=_demosaic_halo, tileable=_demosaic_tileable, build_config=_with_bit_depth('demosaic'),
+                   run=_run_demosaic))
+
+# RGB 域（线性 HDR → 显示）
+register(StageSpec('color_space', color_space.apply, config_key='color_space_conversion',
+                   debug_name='step7_color_space'))
+register(StageSpec('wb', wb.apply, accepts_out=True, debug_name='step8_wb', report='WB', run=_run_wb))
+# 噪声估计在高噪声的帧上启用 denoise（见 stages/noise_estimation.denoise_params），启用噪声估计时总是编译 denoise 节点
+register(StageSpec('denoise', denoise.apply, debug_name='step9_denoise', halo=_denoise_halo,
+                   enabled_by=('noise_estimation',)))
+register(StageSpec('ccm', ccm.apply, accepts_out=True, debug_name='step10_ccm', report='CCM'))
+# color_space / wb / ccm 的融合节点：不单独启用，由 pipeline.fuse_linear_color 在编译计划时生成
+register(StageSpec('linear_color', linear_color.apply, debug_name='step10_linear_color', report='线性颜色',
+                   run=_run_linear_color))
+register(StageSpec('tonemapping', tonemapping.apply, storage='display_ready', accepts_out=True,
+                   debug_name='step11_tonemapping',
+                   report='Tone Mapping'))
+register(StageSpec('gamma', gamma.apply, storage='display_ready', accepts_out=True, debug_name='step12_gamma', report='Gamma'))
+# 3D LUT：独立启用时套用 cube_file；pipeline.bake_color_lut 把 ccm → tonemapping → gamma 烘焙成该节点
+register(StageSpec('color_lut', color_lut.apply, storage='display_ready', debug_name='step12_color_lut', report='3D LUT',
+                   build_config=_build_color_lut_config))
+# 色度降噪只用当前像素的通道均值（亮度）和色差逐像素处理，没有空间滤波，分块时不需要 halo
+register(StageSpec('chroma_denoise', chroma_denoise.apply, storage='display_ready', debug_name='step13_chroma_denoise',
+                   halo=0))
+register(StageSpec('sharpen', sharpen.apply, storage='display_ready', debug_name='step14_sharpen',
+                   halo=_sharpen_halo, report='锐化'))
+register(StageSpec('super_resolution', super_resolution.apply, storage='display_ready', debug_name='step15_super_resolution',
+                   tileable=False, report='超分辨'))
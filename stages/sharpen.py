@@ -6,6 +6,8 @@
 import cv2
 import numpy as np
 
+from utils import log
+
 def apply(rgb, config):
     # 确保输入 rgb 是 0-1 范围的 float32
     rgb = np.clip(rgb, 0, 1).astype(np.float32)
@@ -40,7 +42,7 @@ def apply(rgb, config):
         
         # 4. 裁剪并转换回 8bit
         sharpened_rgb_8bit = np.clip(sharpened_rgb_float, 0, 255).astype(np.uint8)
-        print(f"应用锐化 (非锐化掩蔽), 模糊核大小: {blur_kernel_size}, 强度: {sharpen_strength}")
+        log.info(f"应用锐化 (非锐化掩蔽), 模糊核大小: {blur_kernel_size}, 强度: {sharpen_strength}")
 
     # 你可以根据需要添加其他锐化方法，例如拉普拉斯锐化，但通常不推荐单独使用。
     # elif sharpen_method == "laplacian":
@@ -1,5 +1,6 @@
 import numpy as np
 from scipy.ndimage import zoom, gaussian_filter
+from utils import log
 
 def apply(rgb, config):
     """
@@ -21,10 +22,10 @@ def apply(rgb, config):
         np.ndarray: 放大后并可选地经过锐化的 RGB 图像数据 (float32 类型，值域裁剪到 0-1 之间)。
     """
     if not config.get('enable', False):
-        print("超分辨率模块已禁用。")
+        log.info("超分辨率模块已禁用。")
         return rgb
 
-    print("正在应用超分辨率...")
+    log.info("正在应用超分辨率...")
     
     scale_factor = config.get('scale_factor', 2.0)
     upscale_method = config.get('upscale_method', 'bicubic').lower()
@@ -1,6 +1,9 @@
 import numpy as np
 
-def apply(rgb, config):
+from utils import log
+from utils.lut import apply_lut, cached_lut
+
+def apply(rgb, config, out=None):
     """
     Apply tone mapping to the RGB image.
     This version is further optimized to prevent excessive darkening of normal brightness inputs,
@@ -17,11 +20,14 @@ def apply(rgb, config):
                        - 'contrast' (float): Controls the mid-tone contrast.
                        - 'brightness' (float): Overall brightness multiplier after tone mapping.
 
+        out (np.ndarray, optional): Output buffer (float32, same shape as rgb, not overlapping it).
+                                    The input is never modified.
+
     Returns:
         np.ndarray: Tone-mapped RGB image data (float32, values clipped to 0-1 range).
     """
     # Ensure input is float32
-    rgb = rgb.astype(np.float32)
+    rgb = rgb.astype(np.float32, copy=False)
 
     # --- 从 config 字典中获取参数 ---
     lift = config.get("lift", 0.2)     # 默认值，用于整体曝光提升
@@ -31,22 +37,26 @@ def apply(rgb, config):
     brightness = config.get("brightness", 1.0) # 默认值
     # --- 参数获取结束 ---
 
-    # 确保 RGB 值大于 0，避免数学问题（如 log(0) 或除以零）
-    rgb_safe = np.maximum(rgb, 1e-6)
-
     # 将 RGB 转换为亮度 Y (ITU-R BT.709 标准亮度系数)
-    Y = 0.2126 * rgb_safe[:,:,0] + 0.7152 * rgb_safe[:,:,1] + 0.0722 * rgb_safe[:,:,2]
+    # 各通道先确保大于 0，避免数学问题（如 log(0) 或除以零）；逐通道累加，不生成整帧的三通道副本
+    Y = np.maximum(rgb[:,:,0], 1e-6)
+    Y *= 0.2126
+    channel = np.maximum(rgb[:,:,1], 1e-6)
+    channel *= 0.7152
+    Y += channel
+    np.maximum(rgb[:,:,2], 1e-6, out=channel)
+    channel *= 0.0722
+    Y += channel
+    del channel
 
     # --- 核心优化：多阶段亮度调整 ---
 
     # 1. 曝光增益 (Exposure Gain): 主要受 lift 参数控制，用于整体提亮，特别是暗部。
     # 保持 lift 的显著效果，确保即使 Y 较低，也能得到足够的 Y_exposed。
     exposure_gain = 1.0 + lift * 10.0 
-    Y_exposed = Y * exposure_gain
 
     # 2. 对比度调整 (Contrast Adjustment): 通过伽马曲线来控制中间调的对比度。
     contrast_gamma = 1.0 / (contrast + 1e-6) 
-    Y_contrasted = np.power(Y_exposed, contrast_gamma)
 
     # 3. Filmic S-curve 核心映射：处理大动态范围，特别是高光压缩。
     # *** 关键修改：调整 high_compression_point 和 compression_strength 的计算 ***
@@ -62,30 +72,55 @@ def apply(rgb, config):
     # compress 的值越小，强度越低，高光越亮。
     compression_strength = 0.2 + compress * 2.0 # 基础值设为 0.2，并降低 `compress` 的乘数
 
-    # 应用 S-curve 公式
-    denominator = 1.0 + Y_contrasted / (high_compression_point + 1e-6) * (compression_strength + 1e-6)
-    mapped_Y = Y_contrasted / denominator
-    
-    # 4. 整体亮度乘数：最终调整整体图像亮度。
-    mapped_Y = mapped_Y * brightness
+    # 亮度映射是 Y 的一维函数：lut_size > 0 时编译成 [0, lut_max_input] 上按参数缓存的 LUT，
+    # 超出 LUT 范围的（少量）HDR 像素按公式精确计算。
+    # 只作用于单通道亮度，公式本身只有一次 np.power，默认（lut_size=0）直接计算更快
+    curve_params = (exposure_gain, contrast_gamma, high_compression_point, compression_strength, brightness)
+    lut_size = config.get("lut_size", 0)
+    if lut_size:
+        lut_max = config.get("lut_max_input", 8.0)
+        mapped_Y = apply_lut(Y, cached_lut(tone_curve, curve_params, lut_size, lut_max), lut_max)
+        over_range = Y > lut_max
+        if np.any(over_range):
+            mapped_Y[over_range] = tone_curve(Y[over_range], *curve_params)
+    else:
+        mapped_Y = tone_curve(Y, *curve_params)
 
     # --- 多阶段调整结束 ---
 
     # 保持色度，只调整亮度 (将亮度的变化比例重新应用回 RGB 分量)
-    scale_factor = np.divide(mapped_Y, Y, out=np.zeros_like(Y), where=Y!=0)
+    # （Y 之后不再使用，比例直接写入 Y；Y 为 0 的位置保持 0）
+    scale_factor = np.divide(mapped_Y, Y, out=Y, where=Y!=0)
     
-    # 将亮度调整因子应用到每个 RGB 通道
-    rgb_tonemapped = rgb * np.stack([scale_factor, scale_factor, scale_factor], axis=-1)
+    # 将亮度调整因子应用到每个 RGB 通道（广播，不复制成三通道）
+    rgb_tonemapped = np.multiply(rgb, scale_factor[:, :, np.newaxis], out=out)
 
     # 修改：不要过早裁剪，保留一定的超出范围
     preserve_headroom = config.get("preserve_headroom", False)
     if preserve_headroom:
         # 软裁剪：保留一些超出1.0的值，让后续Gamma处理
         max_value = config.get("max_output_value", 1.2)
-        rgb_tonemapped = np.clip(rgb_tonemapped, 0, max_value)
-        print(f"Tonemapping: 保留headroom，最大值: {max_value}")
+        np.clip(rgb_tonemapped, 0, max_value, out=rgb_tonemapped)
+        log.info(f"Tonemapping: 保留headroom，最大值: {max_value}")
     else:
         # 原始硬裁剪
-        rgb_tonemapped = np.clip(rgb_tonemapped, 0, 1)
+        np.clip(rgb_tonemapped, 0, 1, out=rgb_tonemapped)
     
     return rgb_tonemapped
+
+
+def tone_curve(Y, exposure_gain, contrast_gamma, high_compression_point, compression_strength, brightness):
+    """亮度映射曲线 Y -> mapped_Y（曝光增益、对比度、高光压缩、整体亮度）"""
+    # 曝光 → 对比度 → S-curve → 亮度，中间结果原地计算（运算顺序与逐项公式相同）
+    mapped_Y = Y * exposure_gain
+    np.power(mapped_Y, contrast_gamma, out=mapped_Y)
+
+    # 应用 S-curve 公式：Y_contrasted / (1 + Y_contrasted / (high_compression_point + ε) * (compression_strength + ε))
+    denominator = mapped_Y / (high_compression_point + 1e-6)
+    denominator *= compression_strength + 1e-6
+    denominator += 1.0
+    mapped_Y /= denominator
+
+    # 4. 整体亮度乘数：最终调整整体图像亮度。
+    mapped_Y *= brightness
+    return mapped_Y
@@ -0,0 +1,205 @@
+# 文件：test/benchmark_stages.py
+# 阶段基准测试：在合成 Bayer 帧上测量每个阶段的每种方法（含 demosaic / denoise 的全部方法）和整条流水线的耗时。
+# 可以保存基线，之后的运行与基线比较，耗时超出容差的用例标记为性能回退（退出码 1）。
+# 各用例能否运行的冒烟测试见 test/test_benchmark_cases.py。
+#   python test/benchmark_stages.py --sizes 1080p,12mp --save-baseline output/benchmark_baseline.json
+#   python test/benchmark_stages.py --sizes 1080p,12mp --baseline output/benchmark_baseline.json --tolerance 0.2
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import copy
+import json
+import time
+import argparse
+import platform
+import contextlib
+import cv2
+import numpy as np
+from conftest import load_config
+from pipeline import compile_plan
+from stages import color_lut
+from stages.registry import BAYER, get_stage
+from synthetic_bayer import RESOLUTIONS, make_bayer
+
+# 在原始传感器数据上运行的阶段（其余 Bayer 阶段的输入为 BLC 之后的数据）
+SENSOR_STAGES = ("dpc", "fisheye_mask", "blc")
+
+DEMOSAIC_METHODS = ("opencv_vng", "opencv_ea", "opencv_bilinear", "selective_anti_moire",
+                    "frequency_domain", "mhc")
+
+# (阶段名, 用例名, 对该阶段配置段的覆盖项)；覆盖值为 None 表示删除该项（使用模块默认值）
+CASES = [
+    ("dpc", "median", {"method": "median"}),
+    ("dpc", "neighborhood", {"method": "neighborhood"}),
+    ("fisheye_mask", "default", {"center": None, "radius": None}),
+    ("blc", "default", {}),
+    ("denoise_clip", "default", {}),
+    ("lsc", "default", {}),
+    ("exposure_compensation", "auto", {"mode": "auto"}),
+    ("noise_estimation", "laplacian", {"method": "laplacian"}),
+    ("noise_estimation", "fast", {"method": "fast"}),
+    ("bayer_denoise", "default", {"sigma": 20.0}),
+    *[("demosaic", method, {"method": method}) for method in DEMOSAIC_METHODS],
+    ("demosaic", "opencv_ea 8bit", {"method": "opencv_ea", "high_bit_depth": False}),
+    ("color_space", "default", {}),
+    ("wb", "manual", {"method": "manual"}),
+    ("wb", "gray_world", {"method": "gray_world"}),
+    ("wb", "white_patch", {"method": "white_patch"}),
+    ("denoise", "nl_means", {"method": "nl_means"}),
+    ("denoise", "nl_means 16bit", {"method": "nl_means", "bit_depth": 16}),
+    ("denoise", "guided", {"method": "guided"}),
+    ("denoise", "gaussian", {"method": "gaussian"}),
+    ("denoise", "bilateral", {"method": "bilateral"}),
+    ("denoise", "median", {"method": "median"}),
+    ("ccm", "default", {}),
+    ("linear_color", "fused", {}),
+    ("tonemapping", "default", {"lut_size": 0}),
+    ("tonemapping", "lut", {"lut_size": 4096}),
+    ("gamma", "standard", {"curve_type": "standard"}),
+    ("gamma", "s_curve", {"curve_type": "s_curve"}),
+    ("color_lut", "trilinear", {"interpolation": "trilinear"}),
+    ("color_lut", "tetrahedral", {"interpolation": "tetrahedral"}),
+    ("chroma_denoise", "default", {}),
+    ("sharpen", "default", {}),
+    ("super_resolution", "default", {}),
+]
+
+# 整条流水线：config.yaml 中启用的阶段，对 pipeline 段的覆盖项
+PIPELINE_CASES = [
+    ("default", {}),
+    ("tiled", {"tiling": {"enable": True, "tile_size": 512}}),
+]
+
+def build_stage(base_config, stage, overrides):
+    """返回 (spec, stage_cfg)：启用该阶段并应用覆盖项后按注册表编译阶段配置"""
+    spec = get_stage(stage)
+    config = copy.deepcopy(base_config)
+    if stage == "linear_color":
+        return spec, {"color_space": config["color_space_conversion"], "wb": config["wb"], "ccm": config["ccm"]}
+    if stage == "color_lut":
+        # 与 pipeline.bake_color_lut 相同：把 ccm → tonemapping → gamma 烘焙成 3D LUT
+        chain = [(get_stage(name).apply, get_stage(name).build_config(config)) for name in color_lut.BAKEABLE_STAGES]
+        lut = color_lut.bake(chain, 33, 2.0)
+        return spec, dict({"lut": lut, "domain_max": 2.0, "shaper": "sqrt", "exact_chain": chain}, **overrides)
+
+    section = config.setdefault(spec.config_key, {})
+    section["enable"] = True
+    for key, value in overrides.items():
+        if value is None:
+            section.pop(key, None)
+        else:
+            section[key] = value
+    return spec, spec.build_config(config)
+
+def prepare_inputs(size, config):
+    """合成帧及各数据域的输入：原始传感器数据、BLC 之后的 Bayer 数据、demosaic 之后的 RGB"""
+    raw = make_bayer(size, pattern=config["demosaic"].get("bayer_pattern", "rggb"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec, blc_cfg = build_stage(config, "blc", {})
+        bayer = spec.run(raw, blc_cfg, {})
+        spec, demosaic_cfg = build_stage(config, "demosaic", {"method": "opencv_ea"})
+        rgb = spec.run(bayer, demosaic_cfg, {})
+    return {"sensor": raw, "bayer": bayer, "rgb": rgb}
+
+def stage_input(inputs, stage, spec):
+    """该阶段用例的输入（prepare_inputs 返回的某个数据域）"""
+    if spec.input_domain == BAYER:
+        return inputs["sensor"] if stage in SENSOR_STAGES else inputs["bayer"]
+    return inputs["rgb"]
+
+def time_call(fn, make_input, repeat):
+    """最短耗时（毫秒）；每次调用前准备新的输入副本（不计时），避免原地修改影响下一次"""
+    times = []
+    for _ in range(repeat):
+        data = make_input()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fn(data)
+            times.append(time.perf_counter() - t0)
+    return min(times) * 1000
+
+def run_benchmark(sizes, stages=None, repeat=3, include_pipeline=True):
+    """返回 {'<分辨率>/<阶段>/<用例>': 毫秒}"""
+    base_config = load_config()
+    results = {}
+    for size in sizes:
+        inputs = prepare_inputs(size, base_config)
+        for stage, label, overrides in CASES:
+            if stages and stage not in stages:
+                continue
+            spec, stage_cfg = build_stage(base_config, stage, overrides)
+            source = stage_input(inputs, stage, spec)
+            key = f"{size}/{stage}/{label}"
+            results[key] = time_call(
+                lambda data: spec.run(data, copy.deepcopy(stage_cfg) if stage == "noise_estimation" else stage_cfg,
+                                      {"raw_file_path": None}),
+                source.copy, repeat)
+            print(f"{key:<44}{results[key]:>10.1f} ms")
+
+        if include_pipeline and (not stages or "pipeline" in stages):
+            for label, overrides in PIPELINE_CASES:
+                config = copy.deepcopy(base_config)
+                config.setdefault("pipeline", {}).update(overrides)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    plan = compile_plan(config)
+                key = f"{size}/pipeline/{label}"
+                results[key] = time_call(lambda data: plan.run(data, {"raw_file_path": None}),
+                                         inputs["sensor"].copy, repeat)
+                print(f"{key:<44}{results[key]:>10.1f} ms")
+        del inputs
+    return results
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回超出 (1 + tolerance) 倍的用例 [(key, 基线 ms, 当前 ms)]"""
+    regressions = []
+    print(f"\n{'用例':<42}{'基线 ms':>10}{'当前 ms':>10}{'变化':>9}")
+    for key, value in results.items():
+        if key not in baseline:
+            continue
+        change = value / baseline[key] - 1 if baseline[key] > 0 else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append((key, baseline[key], value))
+            flag = "  ⚠️ 回退"
+        print(f"{key:<44}{baseline[key]:>10.1f}{value:>10.1f}{change:>+9.0%}{flag}")
+    return regressions
+
+def save_baseline(path, results, sizes, repeat):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"machine": {"platform": platform.platform(), "processor": platform.processor(),
+                               "cpu_count": os.cpu_count(), "opencv_threads": cv2.getNumThreads(),
+                               "numpy": np.__version__, "opencv": cv2.__version__},
+                   "sizes": sizes, "repeat": repeat, "results": results}, f, ensure_ascii=False, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="ISP 阶段基准测试")
+    parser.add_argument("--sizes", default="1080p", help=f"逗号分隔的分辨率：{', '.join(RESOLUTIONS)}")
+    parser.add_argument("--stages", default="", help="只测这些阶段（逗号分隔，pipeline 表示整条流水线），默认全部")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数，取最短耗时")
+    parser.add_argument("--save-baseline", default="", help="把结果保存为基线 JSON")
+    parser.add_argument("--baseline", default="", help="与该基线 JSON 比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对变慢比例，默认 0.2（20%%）")
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    stages = {s for s in args.stages.split(",") if s}
+    print(f"OpenCV 线程数: {cv2.getNumThreads()}, 分辨率: {sizes}, 重复 {args.repeat} 次取最短")
+    results = run_benchmark(sizes, stages, args.repeat)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, sizes, args.repeat)
+        print(f"→ 基线已保存至：{args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} 个用例超出容差 {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"✅ 所有用例都在基线的 {args.tolerance:.0%} 容差以内")
+
+if __name__ == "__main__":
+    main()
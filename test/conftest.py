@@ -0,0 +1,33 @@
+# 文件：test/conftest.py
+# 测试共用的配置加载和执行计划辅助函数
+# pytest 通过 config fixture 注入配置；直接运行测试脚本时 __main__ 中调用 load_config() 传入
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import contextlib
+import yaml
+from pipeline import compile_plan
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+
+def load_config():
+    """读取仓库根目录的 config.yaml（每次返回新的副本，测试可以直接修改）"""
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def run_plan(config, raw):
+    """编译并执行一次计划（不输出日志），返回结果的副本（缓冲区池中的结果下一次执行时会被覆盖）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return compile_plan(config).run(raw, {'raw_file_path': None}).copy()
+
+try:
+    import pytest
+except ImportError:  # 直接运行测试脚本时不需要 pytest
+    pytest = None
+
+if pytest is not None:
+    @pytest.fixture
+    def config():
+        return load_config()
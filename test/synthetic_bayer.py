@@ -0,0 +1,89 @@
+# 文件：test/synthetic_bayer.py
+# 合成 Bayer 帧生成器：可控的噪声、边缘和高光，供测试和基准测试使用
+# 场景为线性 RGB（渐变底色 + 色块 + 西门子星 + 饱和高光），按 Bayer 排列采样后
+# 加上 Poisson-Gaussian 噪声（正态近似），输出与 read_raw 相同的 float32 传感器数据（含黑电平）。
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from utils.geometry import bayer_sites
+
+# 常用分辨率 (高, 宽)
+RESOLUTIONS = {
+    '1080p': (1080, 1920),
+    '4k': (2160, 3840),
+    '12mp': (3000, 4000),
+    '48mp': (6000, 8000),
+}
+
+def make_scene(height, width, edges=True, highlights=0.01, seed=0):
+    """线性 RGB 场景 (h, w, 3) float32，1.0 为传感器饱和
+
+    edges:      True 时叠加色块网格的硬边缘和中心的西门子星（各方向的高频细节）
+    highlights: 饱和高光（> 1.0，采样时截断）占画面的比例
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[:height, :width]
+    y = (y / height).astype(np.float32)
+    x = (x / width).astype(np.float32)
+    tint = np.array([0.8, 1.0, 0.6], dtype=np.float32)
+    scene = (0.05 + 0.35 * x * (0.5 + 0.5 * y))[..., np.newaxis] * tint
+
+    if edges:
+        # 8x6 色块网格：每块一个随机颜色，块边缘是硬边
+        colors = rng.uniform(0.05, 0.6, size=(6, 8, 3)).astype(np.float32)
+        rows = np.minimum((y * 6).astype(np.int32), 5)
+        cols = np.minimum((x * 8).astype(np.int32), 7)
+        patches = colors[rows, cols]
+        scene = np.where(((rows + cols) % 2 == 0)[..., np.newaxis], patches, scene)
+
+        # 西门子星：36 个扇区的黑白辐射线，越靠近中心频率越高
+        cy, cx = height / 2, width / 2
+        dy, dx = np.ogrid[:height, :width]
+        dy = (dy - cy).astype(np.float32)
+        dx = (dx - cx).astype(np.float32)
+        radius = min(height, width) / 4
+        inside = dx * dx + dy * dy < radius * radius
+        spokes = np.sin(18 * np.arctan2(dy, dx)) > 0
+        scene = np.where(inside[..., np.newaxis], np.where(spokes, 0.7, 0.03)[..., np.newaxis], scene)
+
+    if highlights > 0:
+        # 随机位置的饱和圆斑（灯光、反光），总面积约为 highlights
+        count = 12
+        spot = np.sqrt(highlights * height * width / (count * np.pi))
+        for cy, cx in zip(rng.uniform(0, height, count), rng.uniform(0, width, count)):
+            y0, y1 = int(max(0, cy - spot)), int(min(height, cy + spot + 1))
+            x0, x1 = int(max(0, cx - spot)), int(min(width, cx + spot + 1))
+            yy, xx = np.ogrid[y0:y1, x0:x1]
+            disk = (yy - cy) ** 2 + (xx - cx) ** 2 < spot * spot
+            scene[y0:y1, x0:x1][disk] = 1.5
+    return scene.astype(np.float32)
+
+def make_bayer(size='1080p', pattern='rggb', noise=1.0, edges=True, highlights=0.01,
+               bit_depth=10, black_level=64, gain=0.5, read_noise=2.0, seed=0):
+    """合成 Bayer 帧 (h, w) float32，单位为传感器 DN（含黑电平，与 read_raw 输出一致）
+
+    size:       RESOLUTIONS 中的名字或 (高, 宽)
+    noise:      噪声倍数，0 为无噪声；噪声方差 = noise² * (gain * 信号 + read_noise²)
+    gain:       散粒噪声增益（DN / 电子）
+    read_noise: 读出噪声标准差（DN）
+    """
+    height, width = RESOLUTIONS[size] if isinstance(size, str) else size
+    scene = make_scene(height, width, edges, highlights, seed)
+    white_level = 2 ** bit_depth - 1
+
+    raw = np.empty((height, width), dtype=np.float32)
+    for color, offsets in bayer_sites(pattern).items():
+        channel = "rgb".index(color)
+        for dy, dx in offsets:
+            raw[dy::2, dx::2] = scene[dy::2, dx::2, channel]
+    del scene
+    # 高光在加噪声之后才按白电平截断（与传感器满阱一致，饱和区域没有噪声）
+    signal = raw * (white_level - black_level)
+
+    if noise > 0:
+        rng = np.random.default_rng(seed + 1)
+        sigma = noise * np.sqrt(gain * signal + read_noise * read_noise)
+        signal += sigma * rng.standard_normal(signal.shape, dtype=np.float32)
+    return np.clip(np.round(signal + black_level), 0, white_level).astype(np.float32)
@@ -0,0 +1,68 @@
+# 文件：test/test_arena.py
+# 缓冲区池测试：缓冲区交替复用、accepts_out 阶段的 out 约定（结果与不传 out 一致、不修改输入），
+# 以及执行计划跨文件复用缓冲区（不再分配）且结果与关闭缓冲区池时一致
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import copy
+import contextlib
+import numpy as np
+from conftest import load_config
+from pipeline import compile_plan
+from stages.registry import BAYER, STAGES
+from utils.arena import FrameArena
+from synthetic_bayer import make_bayer
+
+def test_take():
+    arena = FrameArena()
+    a = arena.take((4, 6), np.float32)
+    b = arena.take((4, 6), np.float32, avoid=a)
+    assert a is not b and not np.shares_memory(a, b)
+    # 第三次取得的是不与 b 重叠的 a，不再分配
+    assert arena.take((4, 6), np.float32, avoid=b) is a
+    assert arena.take((4, 6), np.uint16, avoid=a).dtype == np.uint16
+    assert arena.allocations == 3 and arena.nbytes() == 2 * 4 * 6 * 4 + 4 * 6 * 2
+
+def test_out_contract(config):
+    config['fisheye_mask'].update(center=[40, 30], radius=30)
+    raw = make_bayer((64, 96))
+    with contextlib.redirect_stdout(io.StringIO()):
+        bayer = STAGES['blc'].run(raw, STAGES['blc'].build_config(config), {})
+        rgb = STAGES['demosaic'].run(bayer, STAGES['demosaic'].build_config(config), {})
+        for spec in STAGES.values():
+            if not spec.accepts_out:
+                continue
+            stage_cfg = dict(spec.build_config(config), enable=True)
+            source = raw if spec.input_domain == BAYER else rgb
+            original = source.copy()
+            expected = spec.run(source, stage_cfg, {})
+            out = np.full(source.shape, np.nan, dtype=np.float32)
+            result = spec.run(source, stage_cfg, {}, out=out)
+            assert result is out, spec.name
+            np.testing.assert_array_equal(result, expected, err_msg=spec.name)
+            np.testing.assert_array_equal(source, original, err_msg=f"{spec.name} 修改了输入")
+
+def test_plan_reuse(config):
+    config['demosaic']['method'] = 'opencv_ea'
+    raw = make_bayer((96, 128))
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for arena in (True, False):
+            config['pipeline']['buffer_arena'] = arena
+            plan = compile_plan(copy.deepcopy(config))
+            first = plan.run(raw, {'raw_file_path': None}).copy()
+            allocations = plan.arena.allocations
+            results[arena] = plan.run(raw, {'raw_file_path': None})
+            np.testing.assert_array_equal(results[arena], first)
+            # 第二个文件不再分配新的缓冲区
+            assert plan.arena.allocations == allocations
+    assert plan.arena.allocations == 0
+    np.testing.assert_array_equal(results[True], results[False])
+
+if __name__ == "__main__":
+    test_take()
+    test_out_contract(load_config())
+    test_plan_reuse(load_config())
+    print("✅ 缓冲区池测试通过")
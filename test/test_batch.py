@@ -0,0 +1,86 @@
+# 文件：test/test_batch.py
+# 批量处理测试：多进程时结果按文件名排序、单个文件失败只记录在该文件的结果中，
+# worker 的日志转发到主进程的 stdout，且结果与单进程处理一致；
+# output.debug_steps 按融合节点 / 分块段中的原阶段名选择调试图，处理结束后调试图写入线程关闭
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import copy
+import tempfile
+import threading
+import contextlib
+import cv2
+import numpy as np
+from conftest import load_config
+from pipeline import ISPPipeline
+from stages.registry import STAGES
+from synthetic_bayer import make_bayer
+
+def make_batch(config, tmp):
+    """在 tmp 下写 3 个正常帧（与文件名顺序相反的写入顺序）和 1 个过小的文件"""
+    input_dir = os.path.join(tmp, "input")
+    os.makedirs(input_dir)
+    h, w = 64, 96
+    for i, name in reversed(list(enumerate(("a", "b", "d")))):
+        raw = make_bayer((h, w), seed=i) * (1023 / 65535)
+        np.clip(np.round(raw), 0, 1023).astype("<u2").tofile(os.path.join(input_dir, f"{name}.raw"))
+    with open(os.path.join(input_dir, "c.raw"), "wb") as f:
+        f.write(b"\0" * 100)
+
+    config['raw'].update(input_dir=input_dir, height=h, width=w, sensor_bit_depth=10)
+    config['output'].update(output_dir=os.path.join(tmp, "output"), debug_dir=os.path.join(tmp, "debug"),
+                            debug_steps='none', dither_strength=0)
+    config['demosaic']['method'] = 'opencv_ea'
+    config['fisheye_mask'].update(center=[48, 32], radius=40)
+    return [os.path.join(input_dir, f"{name}.raw") for name in "abcd"]
+
+def run_batch(config, workers):
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        results = ISPPipeline(config=config).run(workers=workers)
+    return results, log.getvalue()
+
+def test_workers(config):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_batch(config, tmp)
+        results, log = run_batch(config, workers=2)
+        assert [r['file'] for r in results] == files
+        assert [r['error'] is None for r in results] == [True, True, False, True]
+        assert "不足以读取" in results[2]['error'] and results[2]['output'] is None
+        # worker 的日志在主进程中按文件顺序打印
+        positions = [log.index(f"文件 '{os.path.basename(f)}' 处理完成") for f in files if not f.endswith("c.raw")]
+        assert positions == sorted(positions)
+        assert "成功 3 个，失败 1 个" in log
+
+        parallel = [cv2.imread(r['output']) for r in results if r['output']]
+        serial, _ = run_batch(config, workers=1)
+        for r, image in zip([r for r in serial if r['output']], parallel):
+            np.testing.assert_array_equal(cv2.imread(r['output']), image)
+
+def test_debug_steps(config):
+    cases = [
+        # wb、ccm 融合为 linear_color：按 wb 选择时保存 linear_color 的输出
+        ({'fuse_linear_color': True}, ['wb'], 'linear_color'),
+        # demosaic → gamma 按 tile 执行：按段中间的 tonemapping 选择时保存整段（gamma）的输出
+        ({'tiling': {'enable': True, 'tile_size': 32}}, ['tonemapping'], 'gamma'),
+    ]
+    for pipeline_cfg, steps, saved in cases:
+        case_config = copy.deepcopy(config)
+        with tempfile.TemporaryDirectory() as tmp:
+            make_batch(case_config, tmp)
+            case_config['pipeline'].update(pipeline_cfg)
+            case_config['output'].update(debug_steps=steps, debug_async=True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipeline = ISPPipeline(config=case_config)
+                pipeline.run(workers=1)
+            assert os.listdir(os.path.join(tmp, "debug", "a")) == [STAGES[saved].debug_name + ".png"]
+            # 调试图写入线程已关闭
+            assert pipeline.debug_writer._executor is None
+            assert not [t for t in threading.enumerate() if t.name.startswith('debug_writer')]
+
+if __name__ == "__main__":
+    test_workers(load_config())
+    test_debug_steps(load_config())
+    print("✅ 批量处理测试通过")
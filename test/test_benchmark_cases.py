@@ -0,0 +1,25 @@
+# 文件：test/test_benchmark_cases.py
+# 基准测试用例的冒烟测试：test/benchmark_stages.py 的每个用例在小尺寸合成帧上都能运行，输出尺寸和数据域正确
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import copy
+import contextlib
+from conftest import load_config
+from stages.registry import BAYER
+from benchmark_stages import CASES, build_stage, prepare_inputs, stage_input
+
+def test_all_cases(config):
+    inputs = prepare_inputs((64, 96), config)
+    for stage, label, overrides in CASES:
+        spec, stage_cfg = build_stage(config, stage, overrides)
+        with contextlib.redirect_stdout(io.StringIO()):
+            out = spec.run(stage_input(inputs, stage, spec).copy(), copy.deepcopy(stage_cfg), {"raw_file_path": None})
+        expected_ndim = 2 if spec.output_domain == BAYER else 3
+        assert out.ndim == expected_ndim and out.shape[0] >= 64, (stage, label, out.shape)
+
+if __name__ == "__main__":
+    test_all_cases(load_config())
+    print("✅ 基准测试用例冒烟测试通过")
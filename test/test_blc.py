@@ -1,12 +1,17 @@
 
 # 文件：test/test_blc.py
+# BLC 测试：按 raw.sensor_bit_depth 扩展到 16bit（12bit 帧不饱和），以及处理前后的可视化
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import io
+import contextlib
 import numpy as np
 import cv2
+from conftest import load_config
 from stages import blc
+from stages.registry import STAGES
 from utils.image_io import save_image_debug
 
 def normalize_for_display(img):
@@ -15,7 +20,21 @@ def normalize_for_display(img):
     img = img / img.max() * 255.0
     return img.astype(np.uint8)
 
+def test_sensor_bit_depth(config):
+    # 12bit 帧按 sensor_bit_depth 缩放（不是 bit_depth_management.sensor_native 的 10bit）
+    config['raw']['sensor_bit_depth'] = 12
+    config['blc']['black_level'] = 256
+    raw = np.array([[0, 256, 2048, 4095]], dtype=np.float32)
+    spec = STAGES['blc']
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = spec.run(raw, spec.build_config(config), {})
+    np.testing.assert_allclose(out, (np.maximum(raw - 256, 0)) * 65535 / 4095, rtol=1e-6)
+    assert out.max() < 65535
+
 if __name__ == "__main__":
+    test_sensor_bit_depth(load_config())
+    print("✅ BLC 位深测试通过")
+
     # 模拟 raw 数据
     dummy_raw = np.random.randint(64, 300, size=(100, 100)).astype(np.float32)
     config = {"black_level": 64}
@@ -0,0 +1,67 @@
+# 文件：test/test_color_lut.py
+# 3D LUT 测试：烘焙精度（ΔE 报告）、.cube 导出/导入往返、超范围像素回退精确计算，以及与原阶段链的耗时对比
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import time
+import tempfile
+import numpy as np
+from stages import color_lut, tonemapping, gamma, ccm
+
+CHAIN = [(tonemapping.apply, {'lift': 0.1, 'contrast': 1.1, 'compress': 0.45, 'brightness': 1.05}),
+         (gamma.apply, {'value': 2.2, 'curve_type': 'standard'})]
+
+def make_rgb(h=48, w=64, input_max=2.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(0, 1, size=(h, w, 3)) ** 2 * input_max).astype(np.float32)
+
+def test_bake_accuracy():
+    lut = color_lut.bake(CHAIN, 33, 2.0)
+    for method in ('trilinear', 'tetrahedral'):
+        report = color_lut.accuracy_report(lut, CHAIN, 2.0, 'sqrt', method, samples=20000)
+        assert report['max'] < 3.0 and report['mean'] < 0.2, report
+
+def test_cube_roundtrip():
+    rgb = make_rgb()
+    for shaper in ('sqrt', 'linear'):
+        lut = color_lut.bake(CHAIN, 17, 2.0, shaper)
+        expected = color_lut.interpolate(rgb, lut, 2.0, shaper)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, f'{shaper}.cube')
+            color_lut.save_cube(path, lut, 2.0, shaper)
+            loaded = color_lut.load_cube(path)
+        assert loaded['domain_max'] == 2.0
+        np.testing.assert_allclose(loaded['lut'], lut, atol=1e-6)
+        out = color_lut.apply(rgb, dict(loaded, interpolation='trilinear'))
+        np.testing.assert_allclose(out, expected, atol=2e-4)
+
+def test_out_of_range_exact():
+    rgb = make_rgb()
+    rgb[0, :4] = [[3.0, 0.5, 0.5], [-0.1, 0.2, 0.3], [5.0, 5.0, 5.0], [0.2, 2.5, 0.1]]
+    lut = color_lut.bake(CHAIN, 33, 2.0)
+    out = color_lut.apply(rgb, {'lut': lut, 'domain_max': 2.0, 'shaper': 'sqrt', 'exact_chain': CHAIN})
+    exact = color_lut.run_chain(CHAIN, rgb[:1, :4])
+    np.testing.assert_array_equal(out[:1, :4], exact)
+
+def benchmark(height=1080, width=1920, repeat=3):
+    rgb = make_rgb(height, width, 1.0)
+    chain = [(ccm.apply, {'matrix': np.eye(3).tolist(), 'highlight_threshold': 2.0})] + CHAIN
+    lut = color_lut.bake(chain, 33, 2.0)
+    cases = [('原阶段链', lambda: color_lut.run_chain(chain, rgb))]
+    for method in ('trilinear', 'tetrahedral'):
+        cases.append((method, lambda method=method: color_lut.interpolate(rgb, lut, 2.0, 'sqrt', method)))
+    for name, fn in cases:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        print(f"3D LUT {name} {width}x{height}: {min(times) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    test_bake_accuracy()
+    test_cube_roundtrip()
+    test_out_of_range_exact()
+    print("✅ 3D LUT 测试通过")
+    benchmark()
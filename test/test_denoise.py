@@ -0,0 +1,117 @@
+# 文件：test/test_denoise.py
+# 去噪测试：NLM 分块并行与整帧结果一致（并行期间 OpenCV 内部单线程）、16 位亮度/色度分离路径、引导滤波和 Bayer 域去噪的精度，以及各路径的耗时对比
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import time
+import contextlib
+import cv2
+import numpy as np
+from stages import bayer_denoise, denoise
+from utils.tiling import map_tiles, thread_pool
+
+def make_rgb(h=96, w=160, sigma=0.03, seed=0):
+    """平滑彩色渐变 + 高斯噪声，返回 (带噪图, 干净图)"""
+    y, x = np.mgrid[:h, :w].astype(np.float32)
+    clean = np.dstack([0.4 + 0.3 * np.sin(x / 40), 0.5 + 0.2 * np.cos(y / 30), 0.3 + 0.2 * np.sin((x + y) / 50)])
+    noisy = clean + sigma * np.random.default_rng(seed).standard_normal(clean.shape)
+    return np.clip(noisy, 0, 1).astype(np.float32), clean.astype(np.float32)
+
+def run(rgb, **cfg):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return denoise.apply(rgb, dict({'method': 'nl_means', 'estimated_noise_level': 0.03}, **cfg))
+
+def test_tiled_nl_means():
+    rgb, _ = make_rgb()
+    for bit_depth in (8, 16):
+        full = run(rgb, bit_depth=bit_depth)
+        tiled = run(rgb, bit_depth=bit_depth, tile_size=48, threads=2)
+        np.testing.assert_array_equal(tiled, full)
+
+def test_tile_pool_opencv_threads():
+    # 线程池并行（NLM tile、Bayer 子平面）时 OpenCV 内部不再并行，结束后恢复原来的线程数；
+    # 交错结束的两个线程池不会提前恢复，也不会恢复成另一个线程池设置的 1
+    rgb, _ = make_rgb()
+    previous = cv2.getNumThreads()
+    seen = []
+    def fn(tile):
+        seen.append(cv2.getNumThreads())
+        return tile
+    guided_filter = bayer_denoise.guided_filter
+    bayer_denoise.guided_filter = lambda *args: seen.append(cv2.getNumThreads()) or guided_filter(*args)
+    cv2.setNumThreads(4)
+    try:
+        np.testing.assert_array_equal(map_tiles(rgb, fn, 48, 8, threads=2), rgb)
+        with contextlib.redirect_stdout(io.StringIO()):
+            bayer_denoise.apply(rgb[:, :, 1] * 1000, {'sigma': 5.0, 'threads': 4})
+        assert len(seen) > 4 and set(seen) == {1}
+        assert cv2.getNumThreads() == 4
+
+        first, second = thread_pool(2), thread_pool(2)
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        assert cv2.getNumThreads() == 1
+        second.__exit__(None, None, None)
+        assert cv2.getNumThreads() == 4
+    finally:
+        bayer_denoise.guided_filter = guided_filter
+        cv2.setNumThreads(previous)
+
+def test_16bit_nl_means():
+    rgb, clean = make_rgb()
+    out = run(rgb, bit_depth=16)
+    assert out.dtype == np.float32 and out.shape == rgb.shape
+    assert np.abs(out - clean).mean() < 0.3 * np.abs(rgb - clean).mean()
+
+def test_guided():
+    rgb, clean = make_rgb()
+    for cfg in ({}, {'guide': 'luma'}, {'subsample': 2}):
+        out = run(rgb, method='guided', **cfg)
+        assert out.dtype == np.float32 and out.shape == rgb.shape
+        assert np.abs(out - clean).mean() < 0.4 * np.abs(rgb - clean).mean(), cfg
+
+def test_bayer_denoise():
+    # Poisson-Gaussian 噪声的 Bayer 帧：VST 可逆，按正确的噪声模型去噪误差明显下降
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[:128, :192].astype(np.float32)
+    clean = (200 + 3000 * (0.5 + 0.5 * np.sin(x / 60) * np.cos(y / 45))).astype(np.float32)
+    gain, sigma = 4.0, 20.0
+    noisy = (rng.poisson(clean / gain) * gain + sigma * rng.standard_normal(clean.shape)).astype(np.float32)
+    np.testing.assert_allclose(bayer_denoise.inverse_vst(bayer_denoise.forward_vst(clean, gain, sigma), gain, sigma),
+                               clean, rtol=1e-4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = bayer_denoise.apply(noisy, {'sigma': sigma, 'gain': gain, 'threads': 2})
+        skipped = bayer_denoise.apply(noisy, {})
+    assert out.dtype == np.float32 and skipped is noisy
+    assert np.abs(out - clean).mean() < 0.5 * np.abs(noisy - clean).mean()
+
+def benchmark(height=1080, width=1920, repeat=2):
+    rgb, _ = make_rgb(height, width)
+    for bit_depth in (8, 16):
+        for tile_size in (0, 512):
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                run(rgb, bit_depth=bit_depth, tile_size=tile_size)
+                times.append(time.perf_counter() - t0)
+            mode = f"tile={tile_size}" if tile_size else "整帧"
+            print(f"NLM {bit_depth}位 {mode} {width}x{height}: {min(times) * 1000:.0f} ms")
+    for radius in (4, 16):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            run(rgb, method='guided', radius=radius)
+            times.append(time.perf_counter() - t0)
+        print(f"引导滤波 radius={radius} {width}x{height}: {min(times) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    test_tiled_nl_means()
+    test_tile_pool_opencv_threads()
+    test_16bit_nl_means()
+    test_guided()
+    test_bayer_denoise()
+    print("✅ 去噪测试通过")
+    benchmark()
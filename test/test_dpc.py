@@ -0,0 +1,104 @@
+# 文件：test/test_dpc.py
+# 坏点校正测试：邻域检测（亮/暗坏点）、静态坏点表保存与加载、批量处理时静态坏点表只读一次且
+# 各文件（各 worker）的检测结果合并后只写一次，以及与全局统计方法的耗时对比
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import time
+import tempfile
+import contextlib
+import numpy as np
+from conftest import load_config
+from pipeline import ISPPipeline
+from stages import dpc
+from test_batch import make_batch
+
+def make_raw(h=64, w=96, seed=0):
+    """平滑的 Bayer 测试图 + 若干亮/暗坏点，返回 (raw, 坏点坐标)"""
+    rng = np.random.default_rng(seed)
+    raw = rng.normal(400, 5, size=(h, w)).astype(np.float32)
+    defects = np.array([[10, 10], [11, 31], [40, 52], [0, 0], [h - 1, w - 1]])
+    raw[defects[:, 0], defects[:, 1]] = [1023, 0, 1023, 0, 1023]
+    return raw, defects
+
+def test_neighborhood():
+    raw, defects = make_raw()
+    cfg = {'enable': True, 'method': 'neighborhood', 'neighborhood_threshold': 64, 'bayer_pattern': 'rggb'}
+    out = dpc.apply(raw, cfg)
+    assert np.abs(out - 400).max() < 50
+    _, found = dpc.neighborhood_dpc(raw, 64, 'rggb')
+    assert set(map(tuple, found)) == set(map(tuple, defects))
+
+def test_defect_map_roundtrip():
+    raw, defects = make_raw()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in ('defects.txt', 'defects.npy'):
+            path = os.path.join(tmp_dir, name)
+            cfg = {'enable': True, 'method': 'neighborhood', 'neighborhood_threshold': 64, 'bayer_pattern': 'rggb'}
+            detected = []
+            dpc.apply(raw, cfg, detected=detected)
+            dpc.save_defect_map(path, np.concatenate(detected))
+            assert os.listdir(tmp_dir).count(name) == 1 and not any(f.endswith('.tmp') for f in os.listdir(tmp_dir))
+            assert set(map(tuple, dpc.load_defect_map(path))) == set(map(tuple, defects))
+            # static 模式只按坏点表修复
+            out = dpc.apply(raw, {'enable': True, 'method': 'static', 'defect_map': path})
+            assert np.abs(out - 400).max() < 50
+            assert np.array_equal(np.delete(out.ravel(), defects[:, 0] * raw.shape[1] + defects[:, 1]),
+                                  np.delete(raw.ravel(), defects[:, 0] * raw.shape[1] + defects[:, 1]))
+
+def test_batch_defect_map(config):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = make_batch(config, tmp)
+        # 每个文件一个不同位置的亮坏点，静态坏点表中另有一个
+        hot = {files[0]: (20, 30), files[1]: (33, 61), files[3]: (50, 12)}
+        for path, (y, x) in hot.items():
+            raw = np.fromfile(path, dtype='<u2').reshape(64, 96)
+            raw[y, x] = 1023
+            raw.tofile(path)
+        static_path = os.path.join(tmp, "static.txt")
+        dpc.save_defect_map(static_path, [[7, 9]])
+        save_path = os.path.join(tmp, "calib", "defects.npy")
+        config['dpc'].update(enable=True, method='neighborhood', defect_map=static_path, save_defect_map=save_path)
+
+        loads, saves = [], []
+        load_defect_map, save_defect_map = dpc.load_defect_map, dpc.save_defect_map
+        dpc.load_defect_map = lambda path: loads.append(path) or load_defect_map(path)
+        dpc.save_defect_map = lambda path, defects: saves.append(path) or save_defect_map(path, defects)
+        try:
+            maps = []
+            for workers in (1, 2):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pipeline = ISPPipeline(config=config)
+                    # 单个文件处理完不写坏点表，整批结束后只写一次
+                    pipeline.process_file_safe(files[0])
+                    assert not os.path.exists(save_path)
+                    pipeline.run(workers=workers)
+                assert saves == [save_path] * workers
+                maps.append(set(map(tuple, dpc.load_defect_map(save_path))))
+                os.remove(save_path)
+            # 静态坏点表在编译计划时读取一次（主进程），之后每帧不再读文件
+            assert loads.count(static_path) == 2
+        finally:
+            dpc.load_defect_map, dpc.save_defect_map = load_defect_map, save_defect_map
+        assert maps[0] == maps[1]
+        assert {(7, 9), *hot.values()} <= maps[0]
+
+def benchmark(height=3000, width=4000, repeat=3):
+    raw = np.random.default_rng(0).normal(400, 5, size=(height, width)).astype(np.float32)
+    for method in ('median', 'neighborhood'):
+        cfg = {'enable': True, 'method': method, 'threshold': 5.0, 'bayer_pattern': 'rggb'}
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            dpc.apply(raw, cfg)
+            times.append(time.perf_counter() - t0)
+        print(f"DPC {method} {width}x{height}: {min(times) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    test_neighborhood()
+    test_defect_map_roundtrip()
+    test_batch_defect_map(load_config())
+    print("✅ 坏点校正测试通过")
+    benchmark()
@@ -0,0 +1,46 @@
+# 文件：test/test_image_io.py
+# 图像写入测试：cv2.imwrite 失败时抛出异常，异步调试图写入失败（包括 flush 之前就已完成的写入）由 flush 抛出
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import time
+import tempfile
+import numpy as np
+from utils.image_io import DebugWriter, save_image, save_image_debug
+
+def test_imwrite_failure():
+    img = np.zeros((8, 8, 3), dtype=np.float32)
+    missing = os.path.join(tempfile.gettempdir(), "isp_missing_dir", "x.png")
+    for fn in (save_image, save_image_debug):
+        try:
+            fn(img, missing)
+        except IOError:
+            continue
+        raise AssertionError(f"{fn.__name__} 没有报告写入失败")
+
+def test_debug_writer_errors():
+    img = np.zeros((8, 8, 3), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = DebugWriter(async_write=True, threads=1)
+        writer.save(img, os.path.join(tmp, "missing_dir", "bad"))
+        writer.save(img, os.path.join(tmp, "good"))
+        # 等两次写入都完成后再 flush：失败的写入已经从待写集合中移除，仍然要报告
+        deadline = time.time() + 10
+        while writer._pending and time.time() < deadline:
+            time.sleep(0.01)
+        try:
+            writer.flush()
+        except IOError:
+            pass
+        else:
+            raise AssertionError("flush 没有报告已完成的失败写入")
+        assert os.path.exists(os.path.join(tmp, "good.png"))
+        # 失败只报告一次
+        writer.flush()
+        writer.close()
+
+if __name__ == "__main__":
+    test_imwrite_failure()
+    test_debug_writer_errors()
+    print("✅ 图像写入测试通过")
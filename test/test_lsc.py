@@ -0,0 +1,49 @@
+# 文件：test/test_lsc.py
+# 镜头阴影校正测试：每帧的增益上限与增益图分开施加（结果与先限制再做强度控制一致），
+# 亮帧（增益上限随帧变化）仍然命中缓存，磁盘缓存只写一个文件
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import tempfile
+import contextlib
+import numpy as np
+from stages import lsc
+
+def reference(raw, strength, pixel_size=1.4):
+    """逐帧计算：cos^4 增益先限制在 [1, 上限] 内，再做强度控制"""
+    h, w = raw.shape
+    y, x = np.indices((h, w), dtype=np.float32)
+    r_mm = np.sqrt(((x - w / 2.0) * pixel_size / 1000.0) ** 2 + ((y - h / 2.0) * pixel_size / 1000.0) ** 2)
+    gain = 1.0 / np.cos(np.arctan(r_mm / 4.0)) ** 4
+    cap = min(65535 / raw.max(), lsc.MAX_GAIN)
+    gain = 1.0 + (np.clip(gain, 1.0, cap) - 1.0) * strength
+    return np.clip(raw * gain.astype(np.float32), 0, 65535)
+
+def test_bright_frames_share_cache():
+    # 大尺寸像素让边角增益超过上限；亮帧的最大值各不相同，增益上限也各不相同
+    h, w = 96, 128
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        config = {'strength': 0.8, 'pixel_size_um': 30.0, 'cache_dir': cache_dir}
+        lsc._cached_gain_map.cache_clear()
+        for peak in (50000.0, 55000.0, 60000.0, 64000.0):
+            raw = rng.uniform(0, peak, size=(h, w)).astype(np.float32)
+            with contextlib.redirect_stdout(io.StringIO()):
+                out = lsc.apply(raw, config)
+            np.testing.assert_allclose(out, reference(raw, 0.8, 30.0), rtol=1e-6)
+        assert lsc._cached_gain_map.cache_info().misses == 1
+        assert len(os.listdir(cache_dir)) == 1
+
+def test_matches_per_frame_cap():
+    raw = np.random.default_rng(1).uniform(0, 60000, size=(96, 128)).astype(np.float32)
+    for strength in (0.3, 1.0):
+        with contextlib.redirect_stdout(io.StringIO()):
+            out = lsc.apply(raw, {'strength': strength})
+        np.testing.assert_allclose(out, reference(raw, strength), rtol=1e-6)
+
+if __name__ == "__main__":
+    test_bright_frames_share_cache()
+    test_matches_per_frame_cap()
+    print("✅ 镜头阴影校正测试通过")
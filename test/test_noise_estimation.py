@@ -0,0 +1,84 @@
+# 文件：test/test_noise_estimation.py
+# 噪声估计测试：快速模式在已知噪声下的精度与置信度、低置信度时不调整后续模块、
+# 执行计划中按帧启用 denoise（不修改共享配置，后续的干净帧不受影响），以及与整帧估计的耗时对比
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import time
+import copy
+import contextlib
+import numpy as np
+from conftest import load_config, run_plan
+from pipeline import PlanNode, compile_plan
+from stages import noise_estimation
+from stages.registry import STAGES
+
+def make_raw(h=1024, w=1536, sigma=20.0, seed=0):
+    """平滑渐变的 Bayer 帧 + 已知标准差的高斯噪声"""
+    y, x = np.mgrid[:h, :w].astype(np.float32)
+    clean = 2000 + 1500 * np.sin(x / 80) * np.cos(y / 60)
+    return (clean + sigma * np.random.default_rng(seed).standard_normal(clean.shape)).astype(np.float32)
+
+def test_fast_accuracy():
+    for sigma in (5.0, 20.0, 80.0):
+        level, confidence, _ = noise_estimation.estimate_noise_fast(make_raw(sigma=sigma))
+        assert abs(level - sigma) < 0.05 * sigma, (sigma, level)
+        assert confidence > 0.9, (sigma, confidence)
+
+def test_low_confidence():
+    # 接近奈奎斯特频率的强纹理：估计偏高，但置信度下降，不驱动后续模块
+    raw = make_raw(sigma=5.0)
+    y, x = np.mgrid[:raw.shape[0], :raw.shape[1]].astype(np.float32)
+    raw += 800 * np.sin(x * 1.3) * np.sin(y * 0.9)
+    config = {'noise_estimation': {'method': 'fast', 'min_confidence': 0.8}, 'denoise': {'h_param': 3}}
+    context = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, confidence, _ = noise_estimation.estimate(raw, config)
+        PlanNode(STAGES['noise_estimation'], config).run(raw, context)
+    assert confidence < 0.8
+    assert 'stage_overrides' not in context and 'estimated_noise_level' not in context
+
+def test_plan_enables_denoise(config):
+    # denoise 未启用时，噪声估计在高噪声的帧上启用 denoise，低噪声的帧跳过；
+    # 同一个计划先处理高噪声帧再处理低噪声帧，低噪声帧不受前一帧影响，共享配置不被修改
+    config['demosaic']['method'] = 'opencv_ea'
+    config['denoise']['enable'] = False
+    config['noise_estimation']['enable'] = True
+    original = copy.deepcopy(config)
+    plan = compile_plan(config)
+
+    for sigma, enabled in ((240.0, True), (20.0, False)):
+        # 缩放到 10 位传感器的范围
+        raw = np.clip(make_raw(256, 384, sigma=sigma) / 4, 0, 1023)
+        context = {'raw_file_path': None}
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = plan.run(raw, context).copy()
+        overrides = context['stage_overrides']['denoise']
+        assert overrides.get('enable', False) == enabled, sigma
+        assert config == original
+        # 与编译时就按本帧参数启用（或不启用噪声估计）的结果一致
+        reference = copy.deepcopy(original)
+        reference['noise_estimation']['enable'] = False
+        reference['denoise'].update(overrides)
+        np.testing.assert_array_equal(result, run_plan(reference, raw), err_msg=str(sigma))
+
+def benchmark(height=3000, width=4000, repeat=3):
+    raw = make_raw(height, width)
+    cases = [('fast', lambda: noise_estimation.estimate_noise_fast(raw)),
+             ('laplacian', lambda: noise_estimation.estimate_noise_level(raw, {}))]
+    for name, fn in cases:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        print(f"噪声估计 {name} {width}x{height}: {min(times) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    test_fast_accuracy()
+    test_low_confidence()
+    test_plan_enables_denoise(load_config())
+    print("✅ 噪声估计测试通过")
+    benchmark()
@@ -0,0 +1,57 @@
+# 文件：test/test_precision.py
+# 精度策略测试：存储类型转换（uint16 取整与饱和、float16 往返）、阶段输入按 float32 计算、float64 升精度检查，
+# 以及执行计划中各数据域节点之间的存储类型
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import copy
+import contextlib
+import numpy as np
+from conftest import load_config
+from pipeline import compile_plan
+from stages.registry import BAYER
+from utils import precision
+from synthetic_bayer import make_bayer
+
+def test_convert():
+    data = np.array([[-3.2, 0.4, 1.6, 70000.0]], dtype=np.float32)
+    np.testing.assert_array_equal(precision.convert(data, np.uint16), [[0, 0, 2, 65535]])
+    rgb = np.random.default_rng(0).uniform(0, 4, size=(16, 24, 3)).astype(np.float32)
+    half = precision.convert(rgb, np.float16)
+    assert half.dtype == np.float16 and half.shape == rgb.shape
+    np.testing.assert_array_equal(half, rgb.astype(np.float16))
+    assert precision.convert(rgb, np.float32) is rgb
+
+def test_policy():
+    policy = precision.PrecisionPolicy(linear_hdr='float16', upcast_check='error')
+    assert policy.load(np.zeros((4, 4, 3), dtype=np.float16)).dtype == np.float32
+    assert policy.store(np.zeros((4, 4), dtype=np.float32), 'raw_processing', 'blc').dtype == np.uint16
+    assert policy.store(np.zeros((4, 4, 3), dtype=np.float32), 'linear_hdr', 'wb').dtype == np.float16
+    assert policy.store(np.zeros((4, 4, 3), dtype=np.float32), 'display_ready', 'gamma').dtype == np.float32
+    try:
+        policy.store(np.zeros((4, 4, 3)), 'linear_hdr', 'ccm')
+        assert False, "float64 输出应报错"
+    except TypeError:
+        pass
+
+def test_plan_storage(config):
+    # 按节点检查存储类型：Bayer 域 uint16，线性 RGB 与显示域 float16
+    config['bit_depth_management'].update(linear_hdr='float16', display_ready='float16', upcast_check='error')
+    config['demosaic']['method'] = 'mhc'
+    raw = make_bayer((96, 128))
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = compile_plan(copy.deepcopy(config))
+        data = raw
+        for node in plan.nodes:
+            data = plan._run_node(node, data, {'raw_file_path': None})
+            expected = np.uint16 if node.spec.output_domain == BAYER else np.float16
+            assert data.dtype == expected, (node.name, data.dtype)
+    assert data.shape == raw.shape + (3,)
+
+if __name__ == "__main__":
+    test_convert()
+    test_policy()
+    test_plan_storage(load_config())
+    print("✅ 精度策略测试通过")
@@ -0,0 +1,56 @@
+# 文件：test/test_profiling.py
+# 阶段分析测试：关闭时不记录、嵌套阶段的分配峰值并入外层、JSON / CSV 报告与汇总
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import csv
+import json
+import tempfile
+import numpy as np
+from utils import profiling
+
+def test_disabled():
+    profiler = profiling.Profiler()
+    with profiler.stage('demosaic'):
+        pass
+    assert profiler.records == []
+
+def test_nested_peak():
+    profiler = profiling.Profiler(enable=True, trace_memory=True)
+    profiler.begin_file('a.raw')
+    with profiler.stage('total'):
+        with profiler.stage('demosaic'):
+            buffer = np.ones(2 ** 20)  # 8 MB，阶段内释放
+            del buffer
+        with profiler.stage('wb'):
+            kept = np.ones(2 ** 17)  # 1 MB，阶段结束后仍保留
+    records = {r['stage']: r for r in profiler.records}
+    assert records['demosaic']['peak_alloc_bytes'] >= 8 * 2 ** 20 > records['demosaic']['alloc_bytes']
+    assert records['wb']['alloc_bytes'] >= 2 ** 20
+    assert records['total']['peak_alloc_bytes'] >= records['demosaic']['peak_alloc_bytes']
+    assert all(r['file'] == 'a.raw' and r['wall_ms'] >= 0 for r in records.values())
+    del kept
+
+def test_report():
+    records = [{'file': f, 'stage': s, 'wall_ms': t, 'cpu_ms': t, 'alloc_bytes': None,
+                'peak_alloc_bytes': None, 'peak_rss_bytes': 2 ** 20}
+               for f, t in (('a.raw', 10.0), ('b.raw', 30.0)) for s in ('demosaic', 'total')]
+    summary = profiling.summarize(records)
+    assert [row['stage'] for row in summary] == ['demosaic', 'total']
+    assert summary[0]['count'] == 2 and summary[0]['wall_ms_mean'] == 20.0 and summary[0]['wall_ms_max'] == 30.0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path, csv_path = os.path.join(tmp_dir, 'profile.json'), os.path.join(tmp_dir, 'profile.csv')
+        profiling.write_report(json_path, records, summary)
+        profiling.write_report(csv_path, records, summary)
+        with open(json_path, encoding='utf-8') as f:
+            assert json.load(f) == {'records': records, 'summary': summary}
+        with open(csv_path, encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    assert len(rows) == 4 and rows[0]['stage'] == 'demosaic' and float(rows[1]['wall_ms']) == 10.0
+
+if __name__ == "__main__":
+    test_disabled()
+    test_nested_peak()
+    test_report()
+    print("✅ 阶段分析测试通过")
@@ -0,0 +1,61 @@
+# 文件：test/test_stats.py
+# 诊断统计测试：单次遍历的 min/max/mean 与直方图分位数精度、关闭时不读取数据、分块执行时暂停记录，以及与逐项归约的耗时对比
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import time
+import json
+import tempfile
+import contextlib
+import numpy as np
+from utils import stats
+
+def test_compute_stats():
+    rng = np.random.default_rng(0)
+    cases = [rng.uniform(0, 1.7, size=(600, 800, 3)).astype(np.float32),
+             (rng.standard_normal((512, 700)) * 100).astype(np.float32),
+             rng.integers(0, 65535, size=(300, 400), dtype=np.uint16),
+             np.linspace(0.002, 0.001, 10 ** 6)]  # 第一块之后范围向下扩展
+    for data in cases:
+        result = stats.compute_stats(data, (1, 50, 99))
+        assert result['min'] == data.min() and result['max'] == data.max()
+        assert abs(result['mean'] - data.mean(dtype=np.float64)) < 1e-6 * abs(data.max())
+        tolerance = 2 * (float(data.max()) - float(data.min())) / 4096
+        for q, value in result['percentiles'].items():
+            assert abs(value - np.percentile(data, float(q))) <= tolerance, (q, value)
+
+def test_disabled_and_suspended():
+    # 关闭时不读取数据（传入不是数组的对象也不会出错）
+    assert stats.StatsLogger().log('wb', object()) is None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'stats.jsonl')
+        logger = stats.StatsLogger(enable=True, jsonl=path)
+        logger.begin_file('a.raw')
+        with contextlib.redirect_stdout(io.StringIO()):
+            with logger.suspended():
+                assert logger.log('demosaic', np.ones((4, 4))) is None
+            logger.log('wb', np.arange(12, dtype=np.float32).reshape(2, 2, 3), '输出')
+        with open(path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+    assert len(records) == 1 and records == logger.records
+    assert records[0]['file'] == 'a.raw' and records[0]['max'] == 11.0
+
+def benchmark(height=3000, width=4000, repeat=3):
+    rgb = np.random.default_rng(0).uniform(0, 1, size=(height, width, 3)).astype(np.float32)
+    cases = [('逐项归约', lambda: (rgb.min(), rgb.max(), rgb.mean(), np.percentile(rgb, [1, 99]))),
+             ('单次遍历', lambda: stats.compute_stats(rgb))]
+    for name, fn in cases:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        print(f"统计 {name} {width}x{height}x3: {min(times) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    test_compute_stats()
+    test_disabled_and_suspended()
+    print("✅ 诊断统计测试通过")
+    benchmark()
@@ -0,0 +1,76 @@
+# 文件：test/test_stream.py
+# 序列模式测试：3A 参数按间隔 / 场景变化重新估计、帧间指数平滑，
+# 以及 process_stream 逐帧产出结果且只在估计帧上统计白平衡增益
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import copy
+import contextlib
+import numpy as np
+from conftest import load_config
+from pipeline import ISPPipeline
+from stages import wb
+from utils.temporal import Temporal3A
+from synthetic_bayer import make_bayer
+
+def test_measure_interval():
+    state = Temporal3A(measure_interval=4, smoothing=0.5)
+    raw = make_bayer((64, 96))
+    calls = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(10):
+            state.begin_frame(raw)
+            gain = state.value('exposure_gain', lambda: calls.append(i) or 2.0 + len(calls))
+            # 同一帧再次查询不会重新估计，也不会再平滑一次
+            assert state.value('exposure_gain', lambda: 100.0) == gain
+    assert calls == [0, 4, 8] and state.measurements == 3
+    # 估计值 3 → 4（第 4 帧）→ 5（第 8 帧），每帧向目标靠近一半：
+    # 第 4-7 帧 3.5, 3.75, 3.875, 3.9375，第 8、9 帧 4.46875, 4.734375
+    assert gain == 4.734375
+
+def test_scene_change():
+    state = Temporal3A(measure_interval=100, scene_change_threshold=0.2, smoothing=0.1)
+    dark, bright = make_bayer((64, 96), seed=0), make_bayer((64, 96), seed=0) * 3
+    with contextlib.redirect_stdout(io.StringIO()):
+        state.begin_frame(dark)
+        state.value('wb_gains', lambda: (1.0, 1.0, 1.0))
+        state.begin_frame(dark)
+        assert not state.measuring
+        state.begin_frame(bright)
+        assert state.measuring and state.scene_changed
+        # 场景变化时直接采用新估计值，不做平滑
+        assert state.value('wb_gains', lambda: (2.0, 1.0, 0.5)) == (2.0, 1.0, 0.5)
+
+def test_process_stream(config):
+    config['raw'].update(height=96, width=128)
+    config['wb']['method'] = 'gray_world'
+    config['output']['dither_strength'] = 0
+    config['stream'].update(measure_interval=3, smoothing=0.5)
+    # 同一场景，亮度逐帧缓慢变化（不触发场景变化）
+    frames = [make_bayer((96, 128)) * (1 + 0.02 * i) for i in range(6)]
+
+    calls = []
+    compute_gains = wb.compute_gains
+    wb.compute_gains = lambda rgb, cfg: calls.append(cfg['method']) or compute_gains(rgb, cfg)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline = ISPPipeline(config=copy.deepcopy(config))
+            state = Temporal3A.from_config(config['stream'])
+            outputs = list(pipeline.process_stream(iter(frames), state))
+            # 对比：不使用序列模式，第一帧单独处理
+            first = (pipeline.plan.run(frames[0], {'raw_file_path': None}) * 255).astype(np.uint8)
+    finally:
+        wb.compute_gains = compute_gains
+
+    assert len(outputs) == 6 and all(o.shape == (96, 128, 3) and o.dtype == np.uint8 for o in outputs)
+    # 6 帧只在第 0、3 帧估计增益（最后一次估计来自对比的单帧处理），其余帧使用平滑后的手动增益
+    assert state.measurements == 2 and calls.count('gray_world') == 3
+    assert np.abs(outputs[0].astype(np.int16) - first).max() <= 1
+
+if __name__ == "__main__":
+    test_measure_interval()
+    test_scene_change()
+    test_process_stream(load_config())
+    print("✅ 序列模式测试通过")
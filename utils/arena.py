@@ -0,0 +1,40 @@
+# utils/arena.py
+# ---------------------
+# 整帧缓冲区池（config.yaml 的 pipeline.buffer_arena）
+# ✅ 执行计划持有一个 FrameArena，按 (shape, dtype) 缓存整帧缓冲区，批量处理同一分辨率的文件时反复复用，
+#    每帧只在第一次遇到新分辨率时分配，之后不再为阶段输出分配整帧数组（也没有新的缺页）。
+#    阶段的 out 约定（StageSpec.accepts_out 为 True 的阶段）：
+#      apply(data, config, out=None)
+#      out 为 None 时不修改输入，返回新数组；
+#      out 非空时（float32、与输入同形状、与输入不重叠）结果写入 out 并返回 out，
+#      方法不支持时可以忽略 out 返回新数组，调用方始终使用返回值。
+#    执行计划交替使用同一 (shape, dtype) 的两个缓冲区（输入一个、输出一个），
+#    所以 run() 返回的数组可能属于缓冲区池，下一次 run() 时会被覆盖。
+
+import numpy as np
+
+class FrameArena:
+    """按 (shape, dtype) 复用的整帧缓冲区池"""
+
+    def __init__(self, enable=True):
+        self.enabled = bool(enable)
+        self._buffers = {}
+        self.allocations = 0  # 累计分配次数（缓冲区池的大小）
+        self.reuses = 0
+
+    def take(self, shape, dtype, avoid=None):
+        """返回一个 shape / dtype 的缓冲区（内容未初始化），不与 avoid 共享内存；池中没有空闲的就新分配一个"""
+        key = (tuple(shape), np.dtype(dtype))
+        pool = self._buffers.setdefault(key, [])
+        for buffer in pool:
+            if avoid is None or not np.may_share_memory(buffer, avoid):
+                self.reuses += 1
+                return buffer
+        buffer = np.empty(key[0], dtype=key[1])
+        pool.append(buffer)
+        self.allocations += 1
+        return buffer
+
+    def nbytes(self):
+        return sum(buffer.nbytes for pool in self._buffers.values() for buffer in pool)
+
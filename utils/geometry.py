@@ -0,0 +1,77 @@
+# utils/geometry.py
+# ---------------------
+# 按分辨率缓存的几何量（Bayer mask、鱼眼 mask、频域滤波器）
+# ✅ 这些数组只取决于帧尺寸和 Bayer 排列，批量处理同一分辨率时只计算一次。
+#    返回的数组都是只读的，调用方不能原地修改（需要修改时先 copy）。
+
+import functools
+
+import numpy as np
+
+# 2x2 Bayer 单元内各位置的颜色：(0,0), (0,1), (1,0), (1,1)
+BAYER_LAYOUTS = {
+    "rggb": ("r", "g", "g", "b"),
+    "bggr": ("b", "g", "g", "r"),
+    "grbg": ("g", "r", "b", "g"),
+    "gbrg": ("g", "b", "r", "g"),
+}
+
+CACHE_SIZE = 8
+
+def _readonly(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays if len(arrays) > 1 else arrays[0]
+
+def bayer_sites(pattern="rggb"):
+    """返回 {'r': [(dy, dx)], 'g': [(dy, dx), (dy, dx)], 'b': [(dy, dx)]}
+
+    raw[dy::2, dx::2] 就是对应颜色的子平面（跨步视图，不分配内存），
+    可以代替布尔 mask 做按颜色的统计和修改。
+    """
+    layout = BAYER_LAYOUTS.get(pattern.lower(), BAYER_LAYOUTS["rggb"])
+    sites = {"r": [], "g": [], "b": []}
+    for offset, color in zip(((0, 0), (0, 1), (1, 0), (1, 1)), layout):
+        sites[color].append(offset)
+    return sites
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def bayer_masks(h, w, pattern="rggb"):
+    """返回只读的 (r_mask, g_mask, b_mask) 布尔 mask"""
+    masks = {color: np.zeros((h, w), dtype=bool) for color in "rgb"}
+    for color, offsets in bayer_sites(pattern).items():
+        for dy, dx in offsets:
+            masks[color][dy::2, dx::2] = True
+    return _readonly(masks["r"], masks["g"], masks["b"])
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def fisheye_outside_mask(h, w, cx, cy, radius):
+    """返回只读布尔 mask，True 表示在鱼眼成像圆之外"""
+    Y, X = np.ogrid[:h, :w]
+    dist = np.sqrt((X - cx)**2 + (Y - cy)**2)
+    return _readonly(dist > radius)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def gaussian_fft_filter(h, w, floor=0.3):
+    """频域高斯低通滤波器（保留 floor 比例的高频），只读 float64
+
+    返回的滤波器已经做过 ifftshift，可以直接乘在 np.fft.fft2 的结果上，不需要 fftshift。
+    """
+    crow, ccol = h//2, w//2
+    y, x = np.ogrid[:h, :w]
+    mask = np.exp(-((x - ccol)**2 + (y - crow)**2) / (2 * (min(h,w)/8)**2))
+    mask = floor + (1 - floor) * mask
+    return _readonly(np.fft.ifftshift(mask))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def gaussian_rfft_filter(h, w, floor=0.3):
+    """gaussian_fft_filter 的实数 FFT 版本：只保留 rfft2 输出的 w//2 + 1 列，只读 float32（C 连续）"""
+    mask = gaussian_fft_filter(h, w, floor)[:, :w//2 + 1]
+    return _readonly(np.ascontiguousarray(mask, dtype=np.float32))
+
+def parse_point(value):
+    """解析 [x, y] 坐标，兼容 config.yaml 中写成字符串的 '[1456, 1456]'"""
+    if isinstance(value, str):
+        value = [float(v) for v in value.strip("[]() ").split(",")]
+    x, y = value
+    return x, y
@@ -1,4 +1,7 @@
 # image_io.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
@@ -20,13 +23,116 @@ def save_image_debug(img, path, scale=False, reference_max=None):
     else:
         img_processed = np.clip(img_float * 255.0, 0, 255).astype(np.uint8)
             
-    cv2.imwrite(path, img_processed)
+    _imwrite(path, img_processed)
 
 # save_image 函数保持不变，因为它已经按照期望工作
 def save_image(img, path):
     #img = np.clip(img, 0, 1)
     img = np.clip(img, 0, 255).astype(np.uint8)
-    cv2.imwrite(path, img)
+    _imwrite(path, img)
+
+def _imwrite(path, img):
+    # cv2.imwrite 失败（目录不存在、扩展名不支持等）时只返回 False，不抛异常
+    if not cv2.imwrite(path, img):
+        raise IOError(f"写入图像失败: {path}")
     
     
     
+
+class DebugWriter:
+    """调试图写入器（可选后台异步写入）
+
+    steps:       'all'、'none' 或阶段名列表（如 ['demosaic', 'ccm']），决定哪些阶段保存调试图
+    fmt:         png（与 save_image_debug 相同的 8bit 图）或 npy（原始数据，不缩放不截断）
+    downscale:   > 1 时先按该倍数缩小（INTER_AREA）再写
+    async_write: True 时交给后台线程池编码写盘，提交时复制数据，
+                 待写数量超过 max_pending 时阻塞（有界队列），避免占用过多内存
+    """
+
+    def __init__(self, steps='all', fmt='png', downscale=1, async_write=True, threads=2, max_pending=4):
+        if isinstance(steps, str):
+            steps = None if steps == 'all' else ()
+        self.steps = None if steps is None else set(steps)
+        self.fmt = fmt
+        self.downscale = max(1, int(downscale or 1))
+        self.async_write = async_write
+        self.threads = threads
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._executor = None  # 第一次提交时创建（多进程 worker 中在子进程里创建）
+        self._pending = set()
+        self._failed = []      # 已完成但失败的写入（future），flush 时抛出
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, output_cfg):
+        return cls(steps=output_cfg.get('debug_steps', 'all'),
+                   fmt=output_cfg.get('debug_format', 'png'),
+                   downscale=output_cfg.get('debug_downscale', 1),
+                   async_write=output_cfg.get('debug_async', True),
+                   threads=output_cfg.get('debug_threads', 2))
+
+    @property
+    def enabled(self):
+        return self.steps is None or len(self.steps) > 0
+
+    def wants(self, step_name):
+        return self.steps is None or step_name in self.steps
+
+    def save(self, img, path, scale=False):
+        """保存调试图，path 不含扩展名"""
+        if self.downscale > 1:
+            h, w = img.shape[:2]
+            size = (max(1, w // self.downscale), max(1, h // self.downscale))
+            img = cv2.resize(img.astype(np.float32), size, interpolation=cv2.INTER_AREA)
+        elif self.async_write:
+            img = np.array(img, copy=True)  # 后续阶段可能原地修改数据
+
+        if not self.async_write:
+            self._write(img, path, scale)
+            return
+
+        self._slots.acquire()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='debug_writer')
+        future = self._executor.submit(self._write, img, path, scale)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            # 已经被 flush 取走的 future 不再重复记录
+            if future in self._pending:
+                self._pending.discard(future)
+                if not future.cancelled() and future.exception() is not None:
+                    self._failed.append(future)
+        self._slots.release()
+
+    def _write(self, img, path, scale):
+        if self.fmt == 'npy':
+            np.save(path + '.npy', img)
+        else:
+            save_image_debug(img, path + '.png', scale=scale)
+
+    def flush(self):
+        """等待所有已提交的调试图写完，写入失败时抛出第一个异常（包括在 flush 之前就已经失败的写入）"""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.exception()  # 只等待完成
+        with self._lock:
+            # 完成回调可能还没有执行，这些 future 在这里取走
+            for future in pending:
+                if future in self._pending:
+                    self._pending.discard(future)
+                    if future.exception() is not None:
+                        self._failed.append(future)
+            failed, self._failed = self._failed, []
+        if failed:
+            raise failed[0].exception()
+
+    def close(self):
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
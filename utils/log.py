@@ -0,0 +1,25 @@
+# utils/log.py
+# ---------------------
+# 阶段日志
+# ✅ 阶段的普通信息通过 log.info 打印，警告和错误仍然直接 print。
+#    分块执行时各 tile 打印的信息相同，run_tiled 在 quiet() 中执行第一个之后的 tile，只跳过 info。
+#    quiet 状态按线程保存，不替换 sys.stdout，不影响其他线程（DebugWriter、并发执行的计划等）。
+
+import contextlib
+import threading
+
+_state = threading.local()
+
+def info(message):
+    """打印普通信息（当前线程处于 quiet() 中时跳过）"""
+    if not getattr(_state, 'quiet', 0):
+        print(message)
+
+@contextlib.contextmanager
+def quiet():
+    """当前线程内暂停 info 输出（可嵌套）"""
+    _state.quiet = getattr(_state, 'quiet', 0) + 1
+    try:
+        yield
+    finally:
+        _state.quiet -= 1
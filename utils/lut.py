@@ -0,0 +1,63 @@
+# utils/lut.py
+# ---------------------
+# 1-D 查找表（LUT）
+# ✅ gamma / tone curve 这类逐像素的一维曲线，预先在 [0, x_max] 上均匀采样成高分辨率 LUT，
+#    按曲线函数和参数缓存（配置不变就不会重建），处理时每个像素只做一次线性插值查表。
+#    查表用 cv2.remap 的双线性插值实现（单次 C 循环），分块处理，中间结果留在缓存中。
+
+import functools
+
+import numpy as np
+import cv2
+
+# cv2.remap 要求源图和输出的宽高都小于 SHRT_MAX
+MAX_LUT_SIZE = 32766
+DEFAULT_LUT_SIZE = 16384
+
+# 分块查表：每块 BLOCK_ROWS x ROW_LENGTH 个元素
+ROW_LENGTH = 1024
+BLOCK_ROWS = 64
+_ZERO_MAP = np.zeros((BLOCK_ROWS, ROW_LENGTH), dtype=np.float32)
+_ZERO_MAP.flags.writeable = False
+
+@functools.lru_cache(maxsize=32)
+def cached_lut(curve, params=(), size=DEFAULT_LUT_SIZE, x_max=1.0):
+    """在 [0, x_max] 上均匀采样 curve(x, *params)，返回只读 (1, size) float32 LUT
+
+    curve 和 params 必须可哈希（模块级函数 + 参数元组），相同参数直接返回缓存的 LUT。
+    """
+    size = int(min(max(size, 2), MAX_LUT_SIZE))
+    x = np.linspace(0.0, x_max, size)
+    table = np.asarray(curve(x, *params), dtype=np.float32).reshape(1, size)
+    table.flags.writeable = False
+    return table
+
+def apply_lut(x, table, x_max=1.0, out=None):
+    """线性插值查表，x 为任意形状的 float 数组，超出 [0, x_max] 的值取端点值，返回 float32
+
+    out 非空时（与 x 同形状的连续 float32 数组，可以就是 x）结果写入 out。
+    """
+    size = table.shape[1]
+    scale = np.float32((size - 1) / x_max)
+    flat = np.ascontiguousarray(x, dtype=np.float32).reshape(-1)
+    result = out
+    out = np.empty_like(flat) if out is None else out.reshape(-1)
+
+    body_length = flat.size - flat.size % ROW_LENGTH
+    body = flat[:body_length].reshape(-1, ROW_LENGTH)
+    out_body = out[:body_length].reshape(-1, ROW_LENGTH)
+    for start in range(0, body.shape[0], BLOCK_ROWS):
+        block = body[start:start + BLOCK_ROWS]
+        cv2.remap(table, _lut_coords(block, scale, size), _ZERO_MAP[:block.shape[0]], cv2.INTER_LINEAR,
+                  dst=out_body[start:start + BLOCK_ROWS])
+
+    if body_length < flat.size:
+        tail = flat[body_length:].reshape(1, -1)
+        out[body_length:] = cv2.remap(table, _lut_coords(tail, scale, size), _ZERO_MAP[:1, :tail.shape[1]],
+                                      cv2.INTER_LINEAR).reshape(-1)
+    return out.reshape(x.shape) if result is None else result
+
+def _lut_coords(block, scale, size):
+    # 先把坐标裁剪到 LUT 范围内（比 BORDER_REPLICATE 边界处理更快）
+    coords = block * scale
+    return np.clip(coords, 0, size - 1, out=coords)
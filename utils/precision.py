@@ -0,0 +1,73 @@
+# utils/precision.py
+# ---------------------
+# 精度策略（config.yaml 的 bit_depth_management）
+# ✅ 决定各数据域在阶段之间的存储类型，阶段内部始终按 float32 计算：
+#    raw_processing: 16       Bayer 域存 uint16（就近取整并截断到 [0, 65535]）；大于 16 时存 float32
+#    linear_hdr: float32      线性 RGB（demosaic 之后、tone mapping 之前）的存储类型，可选 float16
+#    display_ready: float32   显示域 RGB（tone mapping 之后）的存储类型，可选 float16
+#    upcast_check: warn       阶段输出 float64（整帧静默升精度）时 warn 打印警告 / error 报错 / off 不检查
+#    float16 存储时阶段输入先转为 float32，输出再转回 float16，阶段之间传递的数据量减半。
+
+import numpy as np
+import cv2
+
+STORAGE_DTYPES = {"float16": np.float16, "float32": np.float32, "uint16": np.uint16}
+CV_DEPTHS = {np.dtype(np.float16): cv2.CV_16F, np.dtype(np.float32): cv2.CV_32F, np.dtype(np.uint16): cv2.CV_16U}
+
+class PrecisionPolicy:
+    """各数据域的存储类型 + 升精度检查"""
+
+    def __init__(self, raw_processing=16, linear_hdr="float32", display_ready="float32", upcast_check="warn"):
+        self.storage = {
+            "raw_processing": np.dtype(np.uint16 if int(raw_processing) <= 16 else np.float32),
+            "linear_hdr": np.dtype(STORAGE_DTYPES[linear_hdr]),
+            "display_ready": np.dtype(STORAGE_DTYPES[display_ready]),
+        }
+        if upcast_check not in ("warn", "error", "off"):
+            raise ValueError(f"upcast_check 只能是 warn / error / off，当前为 '{upcast_check}'")
+        self.upcast_check = upcast_check
+        self._warned = set()
+
+    @classmethod
+    def from_config(cls, bit_depth_cfg):
+        return cls(raw_processing=bit_depth_cfg.get("raw_processing", 16),
+                   linear_hdr=bit_depth_cfg.get("linear_hdr", "float32"),
+                   display_ready=bit_depth_cfg.get("display_ready", "float32"),
+                   upcast_check=bit_depth_cfg.get("upcast_check", "warn"))
+
+    def load(self, data):
+        """阶段输入：float16 存储转为 float32 计算，其他类型（uint16 / float32）原样传入"""
+        return convert(data, np.float32) if data.dtype == np.float16 else data
+
+    def store(self, data, storage, stage_name, out=None):
+        """阶段输出：检查升精度，再转换为 storage（'raw_processing' / 'linear_hdr' / 'display_ready'）对应的类型
+
+        out 非空时（目标类型、与 data 同形状）转换结果写入 out；不需要转换时直接返回 data。
+        """
+        self.check(data, stage_name)
+        return convert(data, self.storage[storage], out)
+
+    def check(self, data, stage_name):
+        if self.upcast_check == "off" or data.dtype != np.float64:
+            return
+        message = f"阶段 '{stage_name}' 输出 float64 {data.shape}，整帧静默升精度（计算应使用 float32）"
+        if self.upcast_check == "error":
+            raise TypeError(message)
+        if stage_name not in self._warned:
+            self._warned.add(stage_name)
+            print(f"⚠️ {message}")
+
+def convert(data, dtype, out=None):
+    """转换存储类型（OpenCV 单次转换，比 astype 快 2-3 倍）；转为 uint16 时就近取整并饱和截断
+
+    out 非空时写入 out（连续数组）并返回 out，不分配新数组。
+    """
+    dtype = np.dtype(dtype)
+    if data.dtype == dtype:
+        return data
+    # OpenCV 的多通道数最多 512，按 (行, 列 * 通道) 的单通道图转换
+    flat = np.ascontiguousarray(data).reshape(data.shape[0], -1)
+    if out is not None:
+        cv2.multiply(flat, 1.0, dst=out.reshape(flat.shape), dtype=CV_DEPTHS[dtype])
+        return out
+    return cv2.multiply(flat, 1.0, dtype=CV_DEPTHS[dtype]).reshape(data.shape)
@@ -0,0 +1,146 @@
+# utils/profiling.py
+# ---------------------
+# 按阶段 / 按文件的耗时与内存分析
+# ✅ 默认关闭：关闭时 stage() 返回空的上下文管理器，几乎没有开销。
+#    启用时每个阶段记录一条：墙钟时间、CPU 时间、分配字节数与分配峰值（tracemalloc，可选）、
+#    进程峰值 RSS。批量处理结束后汇总成表格打印，并按扩展名写出 JSON 或 CSV 报告。
+#    多进程处理时各 worker 的记录随处理结果返回主进程汇总。
+
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource  # Windows 上没有，峰值 RSS 记为 None
+except ImportError:
+    resource = None
+
+FIELDS = ("file", "stage", "wall_ms", "cpu_ms", "alloc_bytes", "peak_alloc_bytes", "peak_rss_bytes")
+
+def peak_rss_bytes():
+    """进程启动以来的峰值常驻内存（字节），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Profiler:
+    """阶段分析器
+
+    enable:      False 时 stage() 不做任何测量
+    tracemalloc: 同时用 tracemalloc 统计 Python / NumPy 的分配量和峰值
+                 （OpenCV 内部分配不计入；开启后分配本身会变慢，只在需要时打开）
+    report:      报告路径，.csv 写逐条记录，其他扩展名写 JSON（逐条记录 + 汇总）
+    """
+
+    def __init__(self, enable=False, trace_memory=False, report=''):
+        self.enabled = bool(enable)
+        self.trace_memory = self.enabled and trace_memory
+        self.report = report
+        self.current_file = None
+        self.records = []
+        self._stack = []  # 嵌套阶段的 [起始分配量, 峰值]（内层结束后并入外层）
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def from_config(cls, profiling_cfg):
+        return cls(enable=profiling_cfg.get('enable', False),
+                   trace_memory=profiling_cfg.get('tracemalloc', False),
+                   report=profiling_cfg.get('report', ''))
+
+    def begin_file(self, path):
+        """开始处理新文件：清空上一个文件的记录，之后的记录都带上文件名"""
+        self.current_file = path
+        self.records = []
+
+    def stage(self, name):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name):
+        start_alloc = self._enter()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            alloc, peak_alloc = self._exit(start_alloc)
+            self.records.append({
+                'file': self.current_file, 'stage': name,
+                'wall_ms': wall * 1000, 'cpu_ms': cpu * 1000,
+                'alloc_bytes': alloc, 'peak_alloc_bytes': peak_alloc,
+                'peak_rss_bytes': peak_rss_bytes()})
+
+    def _enter(self):
+        if not self.trace_memory:
+            self._stack.append(None)
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        # 外层阶段到目前为止的峰值先保存下来，再重置峰值开始统计本阶段
+        for frame in self._stack:
+            frame[1] = max(frame[1], peak)
+        self._stack.append([current, current])
+        tracemalloc.reset_peak()
+        return current
+
+    def _exit(self, start_alloc):
+        frame = self._stack.pop()
+        if frame is None:
+            return None, None
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(frame[1], peak)
+        for parent in self._stack:
+            parent[1] = max(parent[1], peak)
+        return current - start_alloc, peak - start_alloc
+
+def summarize(records):
+    """按阶段汇总：次数、墙钟 / CPU 时间（平均、p95、最大）、最大分配峰值、最大 RSS"""
+    summary = []
+    stages = list(dict.fromkeys(r['stage'] for r in records))
+    for stage in stages:
+        rows = [r for r in records if r['stage'] == stage]
+        wall = np.array([r['wall_ms'] for r in rows])
+        cpu = np.array([r['cpu_ms'] for r in rows])
+        peaks = [r['peak_alloc_bytes'] for r in rows if r['peak_alloc_bytes'] is not None]
+        rss = [r['peak_rss_bytes'] for r in rows if r['peak_rss_bytes'] is not None]
+        summary.append({
+            'stage': stage, 'count': len(rows),
+            'wall_ms_mean': float(wall.mean()), 'wall_ms_p95': float(np.percentile(wall, 95)),
+            'wall_ms_max': float(wall.max()), 'cpu_ms_mean': float(cpu.mean()),
+            'peak_alloc_bytes': max(peaks) if peaks else None,
+            'peak_rss_bytes': max(rss) if rss else None})
+    return summary
+
+def format_summary(summary):
+    def mb(value):
+        return f"{value / 2 ** 20:.1f}" if value is not None else "-"
+
+    lines = [f"{'stage':<24}{'count':>6}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'cpu ms':>10}"
+             f"{'alloc MB':>10}{'rss MB':>10}"]
+    for row in summary:
+        lines.append(f"{row['stage']:<24}{row['count']:>6}{row['wall_ms_mean']:>10.1f}{row['wall_ms_p95']:>10.1f}"
+                     f"{row['wall_ms_max']:>10.1f}{row['cpu_ms_mean']:>10.1f}"
+                     f"{mb(row['peak_alloc_bytes']):>10}{mb(row['peak_rss_bytes']):>10}")
+    return "\n".join(lines)
+
+def write_report(path, records, summary):
+    """.csv 写逐条记录；其他扩展名写 JSON {'records', 'summary'}"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.splitext(path)[1].lower() == ".csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'records': records, 'summary': summary}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,158 @@
+# utils/stats.py
+# ---------------------
+# 诊断统计：min / max / mean / 分位数
+# ✅ 默认关闭：关闭时各阶段不做任何诊断用的整帧归约（.min() / .max() / .mean() / np.percentile）。
+#    启用时按块单次遍历：每个块（缓存内）同时累加 min、max、和与直方图，分位数由直方图插值得到，
+#    不对整帧排序。每次统计生成一条结构化记录（dict），可打印，也可追加写入 JSON Lines 文件。
+
+import contextlib
+import json
+import threading
+
+import numpy as np
+import cv2
+
+# 每块元素数（float32 约 1 MB）
+BLOCK_ELEMENTS = 1 << 18
+
+class StatsLogger:
+    """结构化诊断统计记录器
+
+    enable:      False 时 log() 直接返回，不读取数据
+    percentiles: 需要的分位数（百分比）
+    bins:        直方图格数，分位数误差不超过约 2 * (max - min) / bins
+    print:       是否按原来的日志格式打印
+    jsonl:       非空时每条记录追加一行 JSON（多进程 worker 可写同一个文件）
+    """
+
+    def __init__(self, enable=False, percentiles=(1, 99), bins=4096, print_records=True, jsonl=''):
+        self.enabled = bool(enable)
+        self.percentiles = tuple(percentiles)
+        self.bins = int(bins)
+        self.print_records = print_records
+        self.jsonl = jsonl
+        self.current_file = None
+        self.records = []
+        self._suspended = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, stats_cfg):
+        return cls(enable=stats_cfg.get('enable', False),
+                   percentiles=stats_cfg.get('percentiles', (1, 99)),
+                   bins=stats_cfg.get('bins', 4096),
+                   print_records=stats_cfg.get('print', True),
+                   jsonl=stats_cfg.get('jsonl', ''))
+
+    def begin_file(self, path):
+        """开始处理新文件：之后的记录都带上文件名"""
+        self.current_file = path
+        self.records = []
+
+    @contextlib.contextmanager
+    def suspended(self):
+        """暂停记录（分块执行时各 tile 内的阶段统计没有意义）"""
+        self._suspended += 1
+        try:
+            yield
+        finally:
+            self._suspended -= 1
+
+    def log(self, stage, data, label=''):
+        """统计 data 并记录，未启用时返回 None"""
+        if not self.enabled or self._suspended:
+            return None
+        record = {'file': self.current_file, 'stage': stage, 'label': label,
+                  'shape': list(data.shape), 'dtype': str(data.dtype)}
+        record.update(compute_stats(data, self.percentiles, self.bins))
+        with self._lock:
+            self.records.append(record)
+            if self.jsonl:
+                with open(self.jsonl, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if self.print_records:
+            print(format_record(record))
+        return record
+
+def compute_stats(data, percentiles=(1, 99), bins=4096):
+    """单次遍历计算 {'min', 'max', 'mean', 'percentiles': {q: 值}}
+
+    直方图范围由第一块的 [min, max] 决定，之后遇到超出范围的块时相邻两格合并、范围翻倍，
+    因此不需要预先知道数据范围，也不需要第二次遍历。
+    """
+    flat = data.reshape(-1)
+    n = flat.size
+    if n == 0:
+        return {'min': None, 'max': None, 'mean': None, 'percentiles': {}}
+    bins += bins % 2  # 扩展范围时相邻两格合并，格数取偶数
+
+    hist = None
+    lo = width = 0.0
+    low = high = None
+    total = 0.0
+    for start in range(0, n, BLOCK_ELEMENTS):
+        block = flat[start:start + BLOCK_ELEMENTS]
+        block_min, block_max = float(block.min()), float(block.max())
+        total += float(block.sum(dtype=np.float64))
+        low = block_min if low is None else min(low, block_min)
+        high = block_max if high is None else max(high, block_max)
+
+        if hist is None:
+            lo = block_min
+            width = max(block_max - block_min, 1e-6 * max(1.0, abs(block_max))) / (bins - 1)
+            hist = np.zeros(bins, dtype=np.float64)
+        hist, lo, width = _extend(hist, lo, width, block_min, block_max)
+        # calcHist 只接受 8U / 16U / 32F；上界不包含在内，初始范围已留出一格余量
+        if block.dtype not in (np.uint8, np.uint16, np.float32):
+            block = block.astype(np.float32)
+        hist += cv2.calcHist([block.reshape(-1, 1)], [0], None, [bins],
+                             [lo, lo + bins * width]).ravel()
+
+    stats = {'min': low, 'max': high, 'mean': total / n, 'percentiles': {}}
+    cumulative = np.cumsum(hist)
+    for q in percentiles:
+        rank = q / 100.0 * n
+        i = int(np.searchsorted(cumulative, rank))
+        i = min(i, bins - 1)
+        before = cumulative[i - 1] if i > 0 else 0.0
+        fraction = (rank - before) / hist[i] if hist[i] > 0 else 0.0
+        value = lo + (i + fraction) * width
+        stats['percentiles'][f'{q:g}'] = float(min(max(value, low), high))
+    return stats
+
+def _extend(hist, lo, width, block_min, block_max):
+    """直方图范围不够时向上 / 向下翻倍（相邻两格合并）"""
+    bins = len(hist)
+    while block_max >= lo + bins * width or block_min < lo:
+        merged = hist.reshape(-1, 2).sum(axis=1)
+        padding = np.zeros(bins - len(merged))
+        if block_max >= lo + bins * width:
+            hist = np.concatenate([merged, padding])
+        else:
+            hist = np.concatenate([padding, merged])
+            lo -= bins * width
+        width *= 2
+    return hist, lo, width
+
+def format_record(record):
+    name = f"{record['stage']} {record['label']}".strip()
+    if record['min'] is None:
+        return f"→ {name}: 空数据"
+    text = f"→ {name}: 范围[{record['min']:.4f}, {record['max']:.4f}], 均值{record['mean']:.4f}"
+    for q, value in record['percentiles'].items():
+        text += f", {q}%分位数{value:.4f}"
+    return text
+
+# 进程内的全局记录器：ISPPipeline 根据 config['stats'] 配置，各阶段通过 stats.log() 记录
+_logger = StatsLogger()
+
+def configure(stats_cfg):
+    global _logger
+    _logger = StatsLogger.from_config(stats_cfg or {})
+    return _logger
+
+def get_logger():
+    return _logger
+
+def log(stage, data, label=''):
+    return _logger.log(stage, data, label)
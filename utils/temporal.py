@@ -0,0 +1,113 @@
+# utils/temporal.py
+# ---------------------
+# 序列模式（视频 / 连拍）的时域 3A 状态（config.yaml 的 stream 段）
+# ✅ 同一传感器的连续帧之间 3A 参数（WB 增益、曝光增益、噪声水平）变化很慢，不必每帧重新估计：
+#    measure_interval:        每隔多少帧重新估计一次（1 为每帧估计）
+#    scene_change_threshold:  缩略图签名相对上次估计时的平均变化超过该比例时视为场景变化，立即重新估计
+#    smoothing:               指数平滑系数，每帧当前值向最近一次估计值靠近该比例（1 为不平滑）；
+#                             场景变化时直接采用新估计值
+#    阶段通过 context['3a'].value(key, measure) 取本帧使用的参数：需要估计的帧调用 measure()，
+#    其余帧跳过整帧统计，沿用平滑后的值。
+
+import numpy as np
+import cv2
+
+# 场景签名：每个 Bayer 相位按 SIGNATURE_STRIDE 跨步抽样后缩小到 SIGNATURE_SIZE（宽, 高）
+SIGNATURE_STRIDE = 8
+SIGNATURE_SIZE = (16, 16)
+
+class Temporal3A:
+    """跨帧的 3A 参数状态：按间隔 / 场景变化重新估计，帧间做指数平滑"""
+
+    def __init__(self, measure_interval=8, scene_change_threshold=0.2, smoothing=0.3):
+        if measure_interval < 1:
+            raise ValueError(f"measure_interval 必须 >= 1，当前为 {measure_interval}")
+        if not 0 < smoothing <= 1:
+            raise ValueError(f"smoothing 必须在 (0, 1] 内，当前为 {smoothing}")
+        self.measure_interval = int(measure_interval)
+        self.scene_change_threshold = scene_change_threshold
+        self.smoothing = smoothing
+        self.frame_index = -1
+        self.measuring = False
+        self.scene_changed = False
+        self.measurements = 0     # 重新估计的帧数
+        self._since_measure = 0
+        self._signature = None    # 上次估计时的场景签名
+        self._targets = {}        # 最近一次估计值
+        self._current = {}        # 平滑后的当前值
+        self._frame_values = {}   # 本帧已经确定的值（同一帧多次查询时保持一致）
+
+    @classmethod
+    def from_config(cls, stream_cfg):
+        return cls(measure_interval=stream_cfg.get('measure_interval', 8),
+                   scene_change_threshold=stream_cfg.get('scene_change_threshold', 0.2),
+                   smoothing=stream_cfg.get('smoothing', 0.3))
+
+    def begin_frame(self, raw):
+        """开始新的一帧：决定本帧是否重新估计（第一帧、到达间隔或场景变化）"""
+        self.frame_index += 1
+        self._frame_values = {}
+        signature = scene_signature(raw)
+        change = scene_change(self._signature, signature)
+        self.scene_changed = self._signature is not None and change > self.scene_change_threshold
+        self.measuring = (self._signature is None or self.scene_changed
+                          or self._since_measure + 1 >= self.measure_interval)
+        if self.measuring:
+            self._signature = signature
+            self._since_measure = 0
+            self.measurements += 1
+            reason = "场景变化" if self.scene_changed else "首帧" if self.frame_index == 0 else "到达间隔"
+            print(f"3A: 第 {self.frame_index} 帧重新估计（{reason}，签名变化 {change:.3f}）")
+        else:
+            self._since_measure += 1
+
+    def value(self, key, measure):
+        """本帧使用的参数值
+
+        重新估计的帧（或还没有该参数的估计值时）调用 measure()，返回 None 表示估计失败（沿用之前的估计值）。
+        当前值每帧向估计值靠近 smoothing 比例；场景变化时直接采用估计值。没有任何估计值时返回 None。
+        """
+        if key in self._frame_values:
+            return self._frame_values[key]
+        if self.wants_measurement(key):
+            measured = measure()
+            if measured is not None:
+                self._targets[key] = np.asarray(measured, dtype=np.float64)
+
+        target = self._targets.get(key)
+        current = self._current.get(key)
+        if target is None:
+            current = None
+        elif current is None or self.scene_changed:
+            current = target
+        else:
+            current = current + self.smoothing * (target - current)
+        self._current[key] = current
+
+        if current is None:
+            result = None
+        elif current.ndim == 0:
+            result = float(current)
+        else:
+            result = tuple(float(v) for v in current)
+        self._frame_values[key] = result
+        return result
+
+    def wants_measurement(self, key):
+        """本帧是否需要重新估计 key（重新估计的帧，或还没有该参数的估计值）"""
+        return key not in self._frame_values and (self.measuring or key not in self._targets)
+
+def scene_signature(raw):
+    """场景签名 (4, 高, 宽) float32：4 个 Bayer 相位的跨步抽样缩略图，只读取约 1/64 的像素"""
+    planes = []
+    for dy in (0, 1):
+        for dx in (0, 1):
+            plane = np.ascontiguousarray(raw[dy::SIGNATURE_STRIDE, dx::SIGNATURE_STRIDE], dtype=np.float32)
+            planes.append(cv2.resize(plane, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA))
+    return np.stack(planes)
+
+def scene_change(reference, signature):
+    """两个签名的平均绝对差（相对参考签名的平均亮度），没有参考签名时为 0"""
+    if reference is None:
+        return 0.0
+    return float(np.mean(np.abs(signature - reference)) / (np.mean(reference) + 1e-6))
@@ -0,0 +1,157 @@
+# utils/tiling.py
+# ---------------------
+# 分块（tile）执行引擎
+# ✅ 把 Bayer 帧切成 2x2 对齐的 tile，每个 tile 带上各阶段需要的 halo（重叠边，见 stages/registry.py），
+#    依次跑完整条阶段链后裁掉 halo 拼回整帧。
+#    峰值内存只和 tile 大小有关，中间结果也更容易留在 CPU 缓存中。
+#    依赖整帧统计量的阶段（灰度世界白平衡增益、demosaic 归一化最大值）
+#    需要先调用 analyze_frame 做一次分析预处理，保证各 tile 结果一致。
+
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from stages import color_space, wb
+from utils import log
+from utils.geometry import bayer_sites
+
+def iter_tiles(h, w, tile_size, halo):
+    """生成 tile 坐标
+
+    返回 (y0, y1, x0, x1, py0, py1, px0, px1)：前四个是 tile 核心区域，
+    后四个是加上 halo 后（裁剪到图像边界内）的读取区域。
+    tile_size 与 halo 都取偶数，读取区域起点始终落在偶数坐标上，保持 Bayer 相位不变。
+    """
+    tile_size = max(2, tile_size - tile_size % 2)
+    halo = halo + halo % 2
+    for y0 in range(0, h, tile_size):
+        y1 = min(y0 + tile_size, h)
+        for x0 in range(0, w, tile_size):
+            x1 = min(x0 + tile_size, w)
+            yield (y0, y1, x0, x1,
+                   max(y0 - halo, 0), min(y1 + halo, h),
+                   max(x0 - halo, 0), min(x1 + halo, w))
+
+def run_tiled(raw, chain, tile_size=512):
+    """按 tile 执行阶段链
+
+    raw:   (H, W) Bayer 帧，可以是 np.memmap，只会按 tile 读取对应区域；
+           demosaic 整帧执行时为 (H, W, 3) RGB
+    chain: [(name, fn, halo), ...]，fn(tile) -> tile，第一个阶段通常是 demosaic
+    返回拼接后的 (H, W, 3) float32 图像。
+    """
+    h, w = raw.shape[:2]
+    halo = sum(stage_halo for _, _, stage_halo in chain)
+    out = None
+
+    for i, (y0, y1, x0, x1, py0, py1, px0, px1) in enumerate(iter_tiles(h, w, tile_size, halo)):
+        # 各阶段对每个 tile 打印的普通日志相同，只保留第一个 tile 的（警告和错误每个 tile 都输出）
+        with log.quiet() if i > 0 else contextlib.nullcontext():
+            tile = raw[py0:py1, px0:px1]
+            for _, fn, _ in chain:
+                tile = fn(tile)
+
+        if out is None:
+            out = np.empty((h, w) + tile.shape[2:], dtype=np.float32)
+        out[y0:y1, x0:x1] = tile[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+    return out
+
+def map_tiles(image, fn, tile_size, halo, threads=1):
+    """把 fn 分别作用于带 halo 的重叠 tile，用线程池并行执行后拼回整帧
+
+    fn(tile) -> tile 只能做局部运算（输出与输入同尺寸，影响范围不超过 halo）。
+    OpenCV 函数执行时释放 GIL，多个 tile 可以在线程中同时计算。
+    多线程时 OpenCV 内部的并行在线程池执行期间设为单线程，避免两层并行超额占用 CPU。
+    tile_size <= 0 时直接对整帧调用 fn。
+    """
+    if tile_size <= 0:
+        return fn(image)
+    h, w = image.shape[:2]
+    tiles = list(iter_tiles(h, w, tile_size, halo))
+    
+    def run(tile):
+        _, _, _, _, py0, py1, px0, px1 = tile
+        return fn(image[py0:py1, px0:px1])
+    
+    out = None
+    with thread_pool(threads) as executor:
+        # map 按提交顺序返回结果，边算边拼接
+        for (y0, y1, x0, x1, py0, py1, px0, px1), result in zip(tiles, executor.map(run, tiles)):
+            if out is None:
+                out = np.empty((h, w) + result.shape[2:], dtype=result.dtype)
+            out[y0:y1, x0:x1] = result[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+    return out
+
+# OpenCV 的线程数是进程全局的：同时存在的多个线程池共享一次设置，
+# 第一个线程池创建时记下原来的线程数并设为 1，最后一个线程池结束时恢复
+_opencv_lock = threading.Lock()
+_opencv_pools = 0
+_opencv_saved_threads = None
+
+@contextlib.contextmanager
+def thread_pool(threads):
+    """在 OpenCV 函数上并行的线程池（threads <= 1 时只有一个线程）
+
+    多线程时线程池存在期间 OpenCV 内部的并行设为单线程，避免两层并行超额占用 CPU。
+    """
+    global _opencv_pools, _opencv_saved_threads
+    threads = max(1, threads)
+    if threads == 1:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            yield executor
+        return
+
+    with _opencv_lock:
+        if _opencv_pools == 0:
+            _opencv_saved_threads = cv2.getNumThreads()
+            cv2.setNumThreads(1)
+        _opencv_pools += 1
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            yield executor
+    finally:
+        with _opencv_lock:
+            _opencv_pools -= 1
+            if _opencv_pools == 0:
+                cv2.setNumThreads(_opencv_saved_threads)
+
+def analyze_frame(raw, config, bayer_pattern="rggb"):
+    """分析预处理：计算分块执行需要的整帧统计量
+
+    config 为整个 pipeline 配置。返回 dict：
+      raw_max: demosaic 归一化使用的整帧最大值
+      wb_gains: 在 2x2 合并的半分辨率预览图上估计的白平衡增益（未启用或失败时为 None）
+    """
+    raw_max = float(raw.max())
+    stats = {"raw_max": raw_max, "wb_gains": None}
+
+    wb_cfg = config.get("wb", {})
+    if not wb_cfg.get("enable", False) or raw_max <= 0:
+        return stats
+
+    # 2x2 合并成半分辨率 RGB 预览（两个 G 取平均），归一化方式与 demosaic 一致
+    preview = bayer_to_preview(raw, bayer_pattern) / raw_max
+    if config.get("color_space_conversion", {}).get("enable", False):
+        preview = color_space.apply(preview, config["color_space_conversion"])
+    stats["wb_gains"] = wb.compute_gains(preview, wb_cfg)
+    return stats
+
+def bayer_to_preview(raw, pattern="rggb"):
+    """把 Bayer 帧 2x2 合并成半分辨率 RGB（float32）
+
+    通道顺序与 demosaic 的 OpenCV BayerXX2RGB 输出保持一致：
+    OpenCV 的命名相对 config 中的 pattern 字符串 R/B 互换，pattern 中 'b' 位置的像素落在通道 0。
+    """
+    h, w = raw.shape
+    raw = raw[:h - h % 2, :w - w % 2]
+    preview = np.zeros((raw.shape[0] // 2, raw.shape[1] // 2, 3), dtype=np.float32)
+    channel_index = {"r": 2, "g": 1, "b": 0}
+    for color, offsets in bayer_sites(pattern).items():
+        weight = 0.5 if color == "g" else 1.0
+        for dy, dx in offsets:
+            preview[:, :, channel_index[color]] += raw[dy::2, dx::2] * weight
+    return preview